@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Chunker benchmark: chunks/s and MB/s of the structure-aware chunker vs. the previous
+encode/decode sliding window, on statement-like pages and pathological input
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Add the backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.chunker import Chunker, encoding
+
+
+def sliding_window(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+    """
+    The chunker this replaced: fixed token windows, each decoded back to text
+    """
+    tokens = encoding.encode(text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + chunk_size, len(tokens))
+        chunks.append(encoding.decode(tokens[start:end]))
+        if end == len(tokens):
+            break
+        start = end - overlap
+    return chunks
+
+
+def statement_page(n: int) -> str:
+    """
+    Prose paragraphs followed by a transaction table, like an extracted statement page
+    """
+    prose = "\n\n".join(
+        " ".join(
+            f"Section {n}.{p}.{s}: the monthly fee for account tier {s} is {s * 2.5:.2f} USD, "
+            f"waived when the average balance exceeds {s * 1000} USD."
+            for s in range(1, 7)
+        )
+        for p in range(1, 6)
+    )
+    table = "\n".join(
+        f"2024-{r % 12 + 1:02d}-{r % 28 + 1:02d}  CARD PURCHASE #{r * 7919 % 100000:05d}  "
+        f"{(r * 37) % 900 + 0.99:>8.2f}  {10000 - r * 3.5:>10.2f}"
+        for r in range(60)
+    )
+    return f"{prose}\n\n{table}\n"
+
+
+def corpora(pages: int) -> Dict[str, List[str]]:
+    return {
+        'statement pages': [statement_page(n) for n in range(pages)],
+        'long page': ["\n\n".join(statement_page(n) for n in range(pages))],
+        'no whitespace': ["ACCT" + "x" * 60000],
+        'unicode': ["Überweisung — 5 € 日本語のテキスト 🚀 " * 5000],
+    }
+
+
+def measure(split: Callable[[str], list], texts: List[str], repeat: int) -> Dict[str, float]:
+    best = float('inf')
+    chunks = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = sum(len(split(text)) for text in texts)
+        best = min(best, time.perf_counter() - started)
+    size = sum(len(text.encode('utf-8')) for text in texts)
+    return {'chunks': chunks, 'seconds': best, 'chunks_s': chunks / best, 'mb_s': size / best / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark text chunking throughput')
+    parser.add_argument('--pages', type=int, default=200, help='Synthetic statement pages')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--overlap', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the best is kept')
+    args = parser.parse_args()
+    
+    chunker = Chunker(args.chunk_size, args.overlap)
+    splitters = {
+        'sliding window': lambda text: sliding_window(text, args.chunk_size, args.overlap),
+        'structured': chunker.split,
+    }
+    print(f"{'corpus':<16} {'chunker':<15} {'chunks':>7} {'seconds':>8} {'chunks/s':>9} "
+          f"{'MB/s':>7}")
+    for name, texts in corpora(args.pages).items():
+        for label, split in splitters.items():
+            result = measure(split, texts, args.repeat)
+            print(
+                f"{name:<16} {label:<15} {result['chunks']:>7} {result['seconds']:>8.3f} "
+                f"{result['chunks_s']:>9.0f} {result['mb_s']:>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
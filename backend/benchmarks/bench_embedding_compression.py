@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Embedding compression benchmark: recall vs. latency and memory for shortened and quantized
+embeddings in the local vector store
+"""
+
+import asyncio
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+
+# Add the backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.local_db import connect, data_path
+from services.local_vector_store import LocalVectorStore
+
+
+def load_corpus(path: str, limit: int) -> np.ndarray:
+    """
+    Embeddings from the embedding cache: the chunks actually ingested
+    Only vectors of the most common dimension are kept (the cache may hold several models)
+    """
+    conn = connect(path)
+    try:
+        rows = conn.execute("SELECT vector FROM embeddings LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    vectors = [np.frombuffer(row['vector'], dtype=np.float32) for row in rows]
+    if not vectors:
+        raise SystemExit(f"No embeddings in {path}; ingest documents first or use --synthetic")
+    sizes, counts = np.unique([len(vector) for vector in vectors], return_counts=True)
+    dimension = sizes[np.argmax(counts)]
+    return np.stack([vector for vector in vectors if len(vector) == dimension])
+
+
+def synthetic_corpus(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """
+    Clustered random vectors, for trying the benchmark without an ingested corpus
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 50), dimension))
+    assignment = rng.integers(len(centers), size=count)
+    return (centers[assignment] + rng.normal(scale=0.6, size=(count, dimension))).astype(np.float32)
+
+
+def shorten(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    What the API's dimensions parameter returns for text-embedding-3 models: the leading
+    dimensions, re-normalized
+    """
+    short = vectors[:, :dimensions]
+    norms = np.linalg.norm(short, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return short / norms
+
+
+def bytes_per_vector(dimensions: int, quantization: str) -> int:
+    """
+    Bytes each search scans per vector
+    """
+    if quantization == 'int8':
+        return dimensions + 4
+    if quantization == 'binary':
+        return (dimensions + 7) // 8
+    return dimensions * 4
+
+
+def directory_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in Path(path).iterdir() if entry.is_file())
+
+
+async def run_config(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    dimensions: int,
+    quantization: str,
+    top_k: int
+) -> Dict[str, float]:
+    ids = [str(i) for i in range(len(corpus))]
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalVectorStore(directory, quantization=quantization)
+        try:
+            vectors = shorten(corpus, dimensions)
+            for start in range(0, len(vectors), 5000):
+                await store.upsert_vectors(
+                    vectors[start:start + 5000], ids[start:start + 5000],
+                    [{}] * len(vectors[start:start + 5000])
+                )
+            
+            latencies, hits = [], 0
+            for query, expected in zip(shorten(queries, dimensions), truth):
+                started = time.perf_counter()
+                results = await store.query_vectors(query.tolist(), top_k=top_k)
+                latencies.append(time.perf_counter() - started)
+                hits += len(expected & {result['id'] for result in results})
+            size = directory_size(directory)
+        finally:
+            store.close()
+    return {
+        'recall': hits / (len(queries) * top_k),
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+        'scanned_bytes': bytes_per_vector(dimensions, quantization) * len(corpus),
+        'disk_bytes': size
+    }
+
+
+async def benchmark(args: argparse.Namespace):
+    if args.synthetic:
+        corpus = synthetic_corpus(args.synthetic, args.synthetic_dimension)
+        source = f"{len(corpus)} synthetic vectors"
+    else:
+        corpus = load_corpus(args.embedding_cache, args.limit)
+        source = f"{len(corpus)} embeddings from {args.embedding_cache}"
+    
+    # Held-out corpus vectors serve as queries; ground truth is an exact full-precision search
+    rng = np.random.default_rng(0)
+    held_out = rng.choice(len(corpus), size=min(args.queries, len(corpus) // 10), replace=False)
+    queries = corpus[held_out]
+    corpus = np.delete(corpus, held_out, axis=0)
+    full = shorten(corpus, corpus.shape[1])
+    truth = []
+    for query in shorten(queries, corpus.shape[1]):
+        best = np.argpartition(-(full @ query), args.top_k - 1)[:args.top_k]
+        truth.append({str(i) for i in best})
+    
+    print(f"Corpus: {source}, {len(queries)} queries, recall@{args.top_k} vs. exact float32 "
+          f"search at {corpus.shape[1]} dimensions")
+    print(f"{'dims':>6} {'quant':>7} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'scanned MB':>11} {'disk MB':>8}")
+    configs: List[Tuple[int, str]] = [
+        (dimensions, quantization)
+        for dimensions in args.dimensions if dimensions <= corpus.shape[1]
+        for quantization in args.quantization
+    ]
+    for dimensions, quantization in configs:
+        result = await run_config(corpus, queries, truth, dimensions, quantization, args.top_k)
+        print(
+            f"{dimensions:>6} {quantization:>7} {result['recall']:>7.3f} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['scanned_bytes'] / 1e6:>11.1f} {result['disk_bytes'] / 1e6:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark embedding dimensions and quantization')
+    parser.add_argument(
+        '--embedding-cache',
+        default=os.getenv('EMBED_CACHE_DB', data_path('embedding_cache.db')),
+        help='Embedding cache database to take the corpus from'
+    )
+    parser.add_argument('--limit', type=int, default=100000, help='Max corpus vectors')
+    parser.add_argument(
+        '--synthetic', type=int, default=0, help='Use this many synthetic vectors instead'
+    )
+    parser.add_argument('--synthetic-dimension', type=int, default=3072)
+    parser.add_argument('--queries', type=int, default=200, help='Held-out query vectors')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument(
+        '--dimensions', type=lambda value: [int(d) for d in value.split(',')],
+        default=[3072, 1024, 512, 256], help='Comma-separated embedding sizes to compare'
+    )
+    parser.add_argument(
+        '--quantization', type=lambda value: value.split(','),
+        default=['none', 'int8', 'binary'], help='Comma-separated quantization modes'
+    )
+    args = parser.parse_args()
+    # Measure quantization on its own, without the IVF index's approximation
+    os.environ.setdefault('LOCAL_VECTOR_IVF_MIN', str(10 ** 9))
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Extraction micro-benchmarks (pytest-benchmark) for the ingestion steps before embedding:
+chunking a page, and streaming chunks out of a CSV and a PDF
+
+    python -m pytest backend/benchmarks/bench_extraction.py --benchmark-columns=min,median,ops
+
+Compare runs with --benchmark-autosave and --benchmark-compare
+"""
+
+import io
+import sys
+import asyncio
+from pathlib import Path
+import pytest
+
+# Add the backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from documents import statement_pages, statement_pdf, transactions_csv
+from services.ingestion_service import IngestionService
+from services.pdf_extractor import PdfExtractor
+
+PDF_PAGES = 50
+CSV_ROWS = 20000
+
+
+@pytest.fixture(scope="module")
+def service():
+    # Extraction doesn't touch OpenAI, the vector store or S3
+    service = IngestionService(object(), object(), s3_service=object())
+    service.pdf_extractor = PdfExtractor()
+    yield service
+    service.close()
+
+
+def drain(chunks) -> int:
+    async def count():
+        return sum([1 async for _ in chunks])
+    return asyncio.run(count())
+
+
+def test_chunk_text(benchmark, service):
+    text = "\n".join(line for page in statement_pages(20) for line in page)
+    chunks = benchmark(service._chunk_text, text, "statement.pdf", 1)
+    assert chunks
+
+
+def test_extract_csv_text(benchmark, service):
+    data = transactions_csv(CSV_ROWS)
+    chunks = benchmark(
+        lambda: drain(service._extract_csv_text(io.BytesIO(data), "transactions.csv"))
+    )
+    assert chunks > 0
+
+
+def test_extract_pdf_text(benchmark, service):
+    data = statement_pdf(PDF_PAGES)
+    # Start the worker processes outside the measured rounds
+    drain(service._extract_pdf_text(io.BytesIO(data), "warmup.pdf"))
+    chunks = benchmark(lambda: drain(service._extract_pdf_text(io.BytesIO(data), "statement.pdf")))
+    assert chunks >= PDF_PAGES
@@ -0,0 +1,110 @@
+"""
+Synthetic banking documents for benchmarks: statement PDFs and transaction CSVs
+Content is deterministic for a given seed, so runs are comparable
+"""
+
+import random
+from typing import List
+
+_MERCHANTS = [
+    "GROCERY MART", "CITY TRANSIT", "COFFEE HOUSE", "ONLINE BOOKS", "FUEL STATION",
+    "PHARMACY PLUS", "HOME SUPPLIES", "STREAMING SVC", "RESTAURANT 21", "AIRLINE TICKETS",
+]
+_TOPICS = [
+    ("wire transfer", "Outgoing wire transfers cost {fee} USD and arrive within one business day."),
+    ("overdraft", "An overdraft fee of {fee} USD applies when the balance falls below zero."),
+    ("foreign transaction", "Card purchases abroad carry a {rate}% foreign transaction fee."),
+    ("minimum balance", "Keep a minimum balance of {amount} USD to waive the monthly fee."),
+    ("savings interest", "Savings balances earn {rate}% annual interest, paid monthly."),
+    ("atm withdrawal", "Withdrawals at other banks' ATMs cost {fee} USD each."),
+    ("stop payment", "A stop payment order on a check costs {fee} USD."),
+    ("mortgage rate", "The fixed mortgage rate for a 30-year term is {rate}% APR."),
+]
+
+# Questions the fee schedules answer, for query load
+QUESTIONS = [f"What are the terms for {topic}?" for topic, _ in _TOPICS] + [
+    "How much does an outgoing wire transfer cost?",
+    "When is the overdraft fee charged?",
+    "What interest do savings accounts earn?",
+    "How do I avoid the monthly maintenance fee?",
+]
+
+
+def statement_pages(pages: int, seed: int = 0) -> List[List[str]]:
+    """
+    Lines of each page: a fee schedule paragraph followed by transaction rows
+    """
+    rng = random.Random(seed)
+    result = []
+    balance = 50000.0
+    for page in range(pages):
+        lines = [f"Account statement page {page + 1}"]
+        for topic, sentence in rng.sample(_TOPICS, 3):
+            lines.append(f"{topic.title()}: " + sentence.format(
+                fee=rng.choice([5, 15, 25, 35]),
+                rate=rng.choice([0.5, 1.5, 3.0, 6.25]),
+                amount=rng.choice([500, 1500, 2500])
+            ))
+        for row in range(30):
+            amount = round(rng.uniform(1, 400), 2)
+            balance -= amount
+            lines.append(
+                f"2024-{page % 12 + 1:02d}-{row % 28 + 1:02d} {rng.choice(_MERCHANTS)} "
+                f"{amount:.2f} {balance:.2f}"
+            )
+        result.append(lines)
+    return result
+
+
+def _pdf_text(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """
+    Build a minimal text PDF with the given lines on each page
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        )
+    ]
+    font_id = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        text = " T* ".join(f"({_pdf_text(line)}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 760 Td {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    pdf += f"startxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def statement_pdf(pages: int, seed: int = 0) -> bytes:
+    return make_pdf(statement_pages(pages, seed))
+
+
+def transactions_csv(rows: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    lines = ["transaction_id,date,merchant,category,amount,currency"]
+    for row in range(rows):
+        lines.append(
+            f"T{seed:03d}{row:07d},2024-{row % 12 + 1:02d}-{row % 28 + 1:02d},"
+            f"{rng.choice(_MERCHANTS)},{rng.choice(['debit', 'credit', 'fee'])},"
+            f"{rng.uniform(1, 900):.2f},USD"
+        )
+    return ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI API: deterministic embeddings and chat completions with configurable latency and
+rate limits, for benchmarking without network access or API spend
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+"""
+
+import re
+import sys
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Dimensions of the models the backend uses, when a request doesn't ask for fewer
+MODEL_DIMENSIONS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+    'text-embedding-ada-002': 1536,
+}
+DEFAULT_DIMENSIONS = 1536
+
+_WORD = re.compile(r'\w+')
+_DOCUMENT = re.compile(r'\[Document 1\]\n(.*?)(?:\n\n\[Document \d+\]|\n\nQuestion:)', re.S)
+
+
+@lru_cache(maxsize=200000)
+def _word_slot(word: str, dimensions: int) -> Tuple[int, float]:
+    value = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+def embed(text: str, dimensions: int) -> np.ndarray:
+    """
+    Hashed bag-of-words vector, unit length
+    Texts sharing words get similar vectors, so retrieval over fake embeddings still finds the
+    chunks a query mentions
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        slot, sign = _word_slot(word, dimensions)
+        vector[slot] += sign
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = norm = 1.0
+    return vector / norm
+
+
+def count_tokens(text: str) -> int:
+    # About four characters per token, as for English text with cl100k_base
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Token bucket allowing requests_per_minute, with bursts of up to one second's worth
+    """
+    
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """
+        Take a token; returns 0, or the seconds until one is available
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class FakeOpenAI:
+    """
+    The embeddings and chat completions endpoints, with fixed delays:
+    - embed_latency_ms per embeddings request, plus embed_latency_per_input_ms per input
+    - chat_latency_ms before a completion's first token, then token_latency_ms per token
+    Requests over rate_limit_rpm (per endpoint) get a 429 with a retry-after header, like the
+    real API. Answers are the first answer_words words of the first context document.
+    """
+    
+    def __init__(
+        self,
+        embed_latency_ms: float = 0.0,
+        embed_latency_per_input_ms: float = 0.0,
+        chat_latency_ms: float = 0.0,
+        token_latency_ms: float = 0.0,
+        rate_limit_rpm: Optional[float] = None,
+        answer_words: int = 60
+    ):
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_latency_per_input_ms = embed_latency_per_input_ms
+        self.chat_latency_ms = chat_latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.answer_words = answer_words
+        self.limiters = {
+            endpoint: RateLimiter(rate_limit_rpm) if rate_limit_rpm else None
+            for endpoint in ('embeddings', 'chat')
+        }
+        self.requests = {'embeddings': 0, 'chat': 0, 'rate_limited': 0}
+        self.app = self._build_app()
+    
+    def _rate_limited(self, endpoint: str) -> Optional[JSONResponse]:
+        limiter = self.limiters[endpoint]
+        wait = limiter.acquire() if limiter else 0.0
+        if not wait:
+            self.requests[endpoint] += 1
+            return None
+        self.requests['rate_limited'] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={'retry-after': f"{wait:.3f}"},
+            content={'error': {
+                'message': f"Rate limit reached for {endpoint}",
+                'type': 'requests',
+                'code': 'rate_limit_exceeded'
+            }}
+        )
+    
+    def answer(self, messages: List[Dict[str, str]]) -> List[str]:
+        """
+        Answer tokens: whitespace-separated words, each counted as one token
+        """
+        prompt = messages[-1]['content'] if messages else ''
+        match = _DOCUMENT.search(prompt)
+        words = (match.group(1) if match else prompt).split()[:self.answer_words]
+        text = "Based on the documents: " + " ".join(words)
+        return [word if i == 0 else f" {word}" for i, word in enumerate(text.split())]
+    
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake OpenAI API")
+        
+        @app.post("/v1/embeddings")
+        async def embeddings(request: Request):
+            limited = self._rate_limited('embeddings')
+            if limited:
+                return limited
+            body = await request.json()
+            inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+            dimensions = body.get('dimensions') or MODEL_DIMENSIONS.get(
+                body.get('model'), DEFAULT_DIMENSIONS
+            )
+            await asyncio.sleep(
+                (self.embed_latency_ms + self.embed_latency_per_input_ms * len(inputs)) / 1000
+            )
+            vectors = [embed(text, dimensions) for text in inputs]
+            if body.get('encoding_format') == 'base64':
+                # What the SDK asks for when numpy is installed
+                data = [base64.b64encode(vector.tobytes()).decode() for vector in vectors]
+            else:
+                data = [vector.tolist() for vector in vectors]
+            tokens = sum(count_tokens(text) for text in inputs)
+            return {
+                'object': 'list',
+                'model': body.get('model'),
+                'data': [
+                    {'object': 'embedding', 'index': i, 'embedding': embedding}
+                    for i, embedding in enumerate(data)
+                ],
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+            }
+        
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            limited = self._rate_limited('chat')
+            if limited:
+                return limited
+            body = await request.json()
+            tokens = self.answer(body.get('messages', []))
+            prompt_tokens = sum(
+                count_tokens(message.get('content') or '') for message in body.get('messages', [])
+            )
+            completion_id = f"chatcmpl-{hashlib.md5(json.dumps(body).encode()).hexdigest()[:24]}"
+            created = int(time.time())
+            await asyncio.sleep(self.chat_latency_ms / 1000)
+            
+            if not body.get('stream'):
+                await asyncio.sleep(self.token_latency_ms * len(tokens) / 1000)
+                return {
+                    'id': completion_id,
+                    'object': 'chat.completion',
+                    'created': created,
+                    'model': body.get('model'),
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': len(tokens),
+                        'total_tokens': prompt_tokens + len(tokens)
+                    }
+                }
+            
+            def event(delta: Dict[str, str], finish_reason: Optional[str] = None) -> str:
+                chunk = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': created,
+                    'model': body.get('model'),
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                }
+                return f"data: {json.dumps(chunk)}\n\n"
+            
+            async def stream():
+                yield event({'role': 'assistant', 'content': ''})
+                for token in tokens:
+                    await asyncio.sleep(self.token_latency_ms / 1000)
+                    yield event({'content': token})
+                yield event({}, 'stop')
+                yield "data: [DONE]\n\n"
+            
+            return StreamingResponse(stream(), media_type='text/event-stream')
+        
+        return app
+
+
+class ServerThread:
+    """
+    Runs an ASGI app under uvicorn on a background thread
+    """
+    
+    def __init__(self, app, host: str = '127.0.0.1', port: int = 0):
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host=host, port=port, log_level='warning', lifespan='on'
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+    
+    def start(self) -> str:
+        """
+        Start serving; returns the base URL once the server accepts connections
+        """
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.01)
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+    
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--embed-latency-ms', type=float, default=0.0,
+                        help='Delay per embeddings request')
+    parser.add_argument('--embed-latency-per-input-ms', type=float, default=0.0,
+                        help='Extra delay per embedded input')
+    parser.add_argument('--chat-latency-ms', type=float, default=0.0,
+                        help='Delay before the first completion token')
+    parser.add_argument('--token-latency-ms', type=float, default=0.0,
+                        help='Delay per completion token')
+    parser.add_argument('--rate-limit-rpm', type=float, default=None,
+                        help='Requests per minute per endpoint before 429s (default: unlimited)')
+    parser.add_argument('--answer-words', type=int, default=60,
+                        help='Completion length in words')
+
+
+def from_arguments(args: argparse.Namespace) -> FakeOpenAI:
+    return FakeOpenAI(
+        embed_latency_ms=args.embed_latency_ms,
+        embed_latency_per_input_ms=args.embed_latency_per_input_ms,
+        chat_latency_ms=args.chat_latency_ms,
+        token_latency_ms=args.token_latency_ms,
+        rate_limit_rpm=args.rate_limit_rpm,
+        answer_words=args.answer_words
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake OpenAI API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1", file=sys.stderr)
+    uvicorn.run(from_arguments(args).app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Load test: drives /upload -> /ingest -> /query at a target request rate and reports throughput
+and p50/p95/p99 latency per phase
+By default the backend runs in-process against local stand-ins (local_stack.py), so no network
+or credentials are needed; --url targets a running deployment instead.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+import numpy as np
+
+# Add the backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from documents import QUESTIONS, statement_pdf, transactions_csv
+from fake_openai import add_arguments, from_arguments
+from local_stack import local_stack
+
+
+class Recorder:
+    """
+    Latencies and errors of one phase
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.finished = self.started
+    
+    def record(self, seconds: float):
+        self.latencies.append(seconds)
+    
+    def fail(self, error: Exception):
+        self.errors += 1
+        if self.errors <= 3:
+            print(f"{self.name}: {type(error).__name__}: {error}", file=sys.stderr)
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(self.finished - self.started, 1e-9)
+        latencies = np.asarray(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+        return {
+            'phase': self.name,
+            'requests': len(self.latencies) + self.errors,
+            'errors': self.errors,
+            'seconds': elapsed,
+            'throughput': len(self.latencies) / elapsed,
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+        }
+
+
+async def paced(
+    recorder: Recorder,
+    send: Callable[[int], Awaitable[None]],
+    rps: float,
+    count: Optional[int] = None,
+    duration: Optional[float] = None
+):
+    """
+    Start send(i) every 1/rps seconds (open loop: slow responses don't slow the schedule) until
+    count requests were started or duration seconds passed, then wait for all of them
+    """
+    async def timed(i: int):
+        started = time.perf_counter()
+        try:
+            await send(i)
+        except Exception as e:
+            recorder.fail(e)
+        else:
+            recorder.record(time.perf_counter() - started)
+    
+    tasks = []
+    recorder.started = time.perf_counter()
+    i = 0
+    while (count is None or i < count) and (
+        duration is None or time.perf_counter() - recorder.started < duration
+    ):
+        delay = recorder.started + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(timed(i)))
+        i += 1
+    await asyncio.gather(*tasks)
+    recorder.finished = time.perf_counter()
+
+
+def make_documents(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    documents = [
+        {'name': f"statement-{i:04d}.pdf", 'body': statement_pdf(args.pages, seed=i),
+         'type': 'application/pdf'}
+        for i in range(args.pdfs)
+    ]
+    documents += [
+        {'name': f"transactions-{i:04d}.csv", 'body': transactions_csv(args.csv_rows, seed=i),
+         'type': 'text/csv'}
+        for i in range(args.csvs)
+    ]
+    return documents
+
+
+async def run(url: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    documents = make_documents(args)
+    file_ids: List[Optional[str]] = [None] * len(documents)
+    limits = httpx.Limits(max_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        async def upload(i: int):
+            document = documents[i]
+            response = await client.post(
+                "/upload", files={'file': (document['name'], document['body'], document['type'])}
+            )
+            response.raise_for_status()
+            file_ids[i] = response.json()['file_id']
+        
+        # Ingestion latency is submission to job completion, polled every poll_interval
+        chunks = []
+        
+        async def ingest(i: int):
+            if file_ids[i] is None:
+                raise RuntimeError(f"{documents[i]['name']} was not uploaded")
+            response = await client.post("/ingest", json={'file_id': file_ids[i]})
+            response.raise_for_status()
+            job_id = response.json()['job_id']
+            while True:
+                await asyncio.sleep(args.poll_interval)
+                response = await client.get(f"/ingest/{job_id}")
+                response.raise_for_status()
+                job = response.json()
+                if job['status'] == 'completed':
+                    chunks.append(job['chunks_processed'] or 0)
+                    return
+                if job['status'] == 'failed':
+                    raise RuntimeError(
+                        f"Ingestion of {documents[i]['name']} failed: {job['error']}"
+                    )
+        
+        first_event = Recorder('query first event')
+        
+        async def query(i: int):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            if args.unique_queries:
+                # Distinct text for every request, so no query cache tier can answer it
+                question = f"{question} (request {i})"
+            body = {'query': question, 'top_k': args.top_k}
+            if args.query_endpoint == 'query':
+                response = await client.post("/query", json=body)
+                response.raise_for_status()
+                return
+            started = time.perf_counter()
+            async with client.stream("POST", "/query/stream", json=body) as response:
+                response.raise_for_status()
+                first = True
+                async for _ in response.aiter_bytes():
+                    if first:
+                        first_event.record(time.perf_counter() - started)
+                        first = False
+        
+        results = []
+        for name, send, count, duration in (
+            ('upload', upload, len(documents), None),
+            ('ingest', ingest, len(documents), None),
+            ('query', query, None, args.duration),
+        ):
+            recorder = Recorder(name)
+            print(f"Running {name}...", file=sys.stderr)
+            await paced(recorder, send, args.rps, count=count, duration=duration)
+            results.append(recorder.summary())
+            if name == 'ingest':
+                results[-1]['chunks'] = sum(chunks)
+                results[-1]['chunks_per_s'] = sum(chunks) / results[-1]['seconds']
+        if first_event.latencies:
+            first_event.started, first_event.finished = recorder.started, recorder.finished
+            results.append(first_event.summary())
+        return results
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'phase':<18} {'requests':>8} {'errors':>6} {'seconds':>8} {'req/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(
+            f"{result['phase']:<18} {result['requests']:>8} {result['errors']:>6} "
+            f"{result['seconds']:>8.2f} {result['throughput']:>7.2f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+        if 'chunks' in result:
+            print(f"{'':<18} {result['chunks']} chunks ingested, "
+                  f"{result['chunks_per_s']:.1f} chunks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test upload, ingest and query')
+    parser.add_argument('--url', help='Target a running backend instead of the local stack')
+    parser.add_argument('--rps', type=float, default=5.0, help='Requests started per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Query phase seconds')
+    parser.add_argument('--pdfs', type=int, default=10, help='Statement PDFs to upload')
+    parser.add_argument('--pages', type=int, default=20, help='Pages per PDF')
+    parser.add_argument('--csvs', type=int, default=2, help='Transaction CSVs to upload')
+    parser.add_argument('--csv-rows', type=int, default=5000, help='Rows per CSV')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--query-endpoint', choices=['query', 'stream'], default='query')
+    parser.add_argument('--unique-queries', action='store_true',
+                        help='Make every query distinct so caches never answer')
+    parser.add_argument('--max-connections', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=120.0, help='Request timeout seconds')
+    parser.add_argument('--poll-interval', type=float, default=0.1,
+                        help='Seconds between ingestion job status checks')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    add_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.url:
+        results = asyncio.run(run(args.url, args))
+    else:
+        with tempfile.TemporaryDirectory(prefix='ragledger-bench-') as data_dir:
+            with local_stack(data_dir, from_arguments(args)) as url:
+                results = asyncio.run(run(url, args))
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
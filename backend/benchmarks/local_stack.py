@@ -0,0 +1,76 @@
+"""
+Runs the backend offline against local stand-ins for its external services:
+- OpenAI: the fake API in fake_openai.py, on a background thread
+- S3 (and Secrets Manager, read at startup): mocked in-process by moto
+- Pinecone: the local vector store (VECTOR_STORE=local) in a scratch data directory
+"""
+
+import os
+import sys
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+import boto3
+from moto import mock_s3, mock_secretsmanager
+
+# Add the backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fake_openai import FakeOpenAI, ServerThread
+
+BENCH_BUCKET = 'ragledger-bench'
+
+
+@contextmanager
+def _environment(values: Dict[str, str]) -> Iterator[None]:
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextmanager
+def local_stack(
+    data_dir: str,
+    fake_openai: Optional[FakeOpenAI] = None,
+    env: Optional[Dict[str, str]] = None,
+    log_level: int = logging.WARNING
+) -> Iterator[str]:
+    """
+    Serve the backend on a background thread and yield its base URL
+    Settings the backend reads at import time (data directory, bucket) are set first, so the
+    backend must not have been imported yet. env overrides or adds backend settings.
+    """
+    fake_openai = fake_openai or FakeOpenAI()
+    openai_server = ServerThread(fake_openai.app)
+    openai_url = openai_server.start()
+    settings = {
+        'OPENAI_BASE_URL': f"{openai_url}/v1",
+        'OPENAI_API_KEY': 'sk-bench',
+        'VECTOR_STORE': 'local',
+        'RAGLEDGER_DATA_DIR': data_dir,
+        'S3_BUCKET': BENCH_BUCKET,
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        **(env or {})
+    }
+    try:
+        with _environment(settings), mock_s3(), mock_secretsmanager():
+            boto3.client('s3').create_bucket(Bucket=BENCH_BUCKET)
+            from main import app
+            logging.getLogger().setLevel(log_level)
+            app_server = ServerThread(app)
+            try:
+                yield app_server.start()
+            finally:
+                app_server.stop()
+    finally:
+        openai_server.stop()
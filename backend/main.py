@@ -3,14 +3,17 @@ RAGLedger Backend - FastAPI Application
 Main entry point for the RAG application
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from routers import upload, ingest, query, health
+from routers import upload, ingest, query, health, metrics
+from services.metrics import MetricsMiddleware
 from services.secrets_service import SecretsService
+from services.container import ServiceContainer
 
 # Configure logging
 logging.basicConfig(
@@ -36,10 +39,22 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error loading secrets: {e}")
         logger.warning("Continuing with environment variables...")
     
+    # Build the shared service clients once; requests reuse their connection pools
+    services = ServiceContainer()
+    await asyncio.to_thread(services.warm_up)
+    app.state.services = services
+    
+    # Start ingestion workers (and resume jobs interrupted by a previous shutdown)
+    try:
+        await services.job_queue.start()
+    except Exception as e:
+        logger.warning(f"Ingestion job queue not started: {e}")
+    
     yield
     
     # Shutdown
     logger.info("Shutting down RAGLedger backend...")
+    await services.close()
 
 
 # Create FastAPI app
@@ -58,9 +73,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency by route, and the optional Server-Timing header
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(health.router, tags=["health"])
+app.include_router(metrics.router, tags=["metrics"])
 app.include_router(upload.router, prefix="/upload", tags=["upload"])
 app.include_router(ingest.router, prefix="/ingest", tags=["ingest"])
 app.include_router(query.router, prefix="/query", tags=["query"])
@@ -2,28 +2,125 @@
 Pydantic models for request/response schemas
 """
 
-from pydantic import BaseModel, Field
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional, Dict, Any
 
+# Tenants are Pinecone namespaces: letters, digits, '_', '-' and '.'
+TENANT_PATTERN = r'^[A-Za-z0-9_.-]+$'
+
 
 class UploadResponse(BaseModel):
     message: str
     file_id: str
     filename: str
+    size: Optional[int] = None
+    content_hash: Optional[str] = None  # SHA-256 hex digest of the file
 
 
 class IngestRequest(BaseModel):
     file_id: str
-
-
-class IngestResponse(BaseModel):
-    message: str
-    chunks_processed: int
+    document_id: Optional[str] = Field(
+        default=None,
+        description="Ingest the file as a new version of this document (default: the file_id)"
+    )
+    tenant: Optional[str] = Field(
+        default=None, max_length=64, pattern=TENANT_PATTERN,
+        description="Tenant the document belongs to; only queries for this tenant will find it"
+    )
+
+
+class IngestProgress(BaseModel):
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_unchanged: int = 0  # already stored by the document's previous version
+    chunks_embedded: int = 0
+    vectors_upserted: int = 0
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    file_id: str
+    document_id: Optional[str] = None
+    tenant: Optional[str] = None
+    status: str = Field(..., description="queued, running, completed or failed")
+    progress: IngestProgress
+    chunks_processed: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class DeleteDocumentResponse(BaseModel):
+    document_id: str
+    chunks_deleted: int
+
+
+class QueryFilters(BaseModel):
+    """
+    Restrict retrieval to chunks matching every given condition
+    """
+    file_ids: Optional[List[str]] = Field(
+        default=None, min_length=1, max_length=100, description="Uploaded files to search"
+    )
+    document_ids: Optional[List[str]] = Field(
+        default=None, min_length=1, max_length=100,
+        description="Documents to search, including chunks kept from their earlier versions"
+    )
+    file_types: Optional[List[str]] = Field(
+        default=None, min_length=1, description="File types to search, e.g. pdf or csv"
+    )
+    page_from: Optional[int] = Field(default=None, ge=1, description="First page (inclusive)")
+    page_to: Optional[int] = Field(default=None, ge=1, description="Last page (inclusive)")
+    uploaded_after: Optional[datetime] = Field(
+        default=None, description="Only chunks uploaded at or after this time (UTC if naive)"
+    )
+    uploaded_before: Optional[datetime] = Field(
+        default=None, description="Only chunks uploaded before this time (UTC if naive)"
+    )
+    
+    @field_validator('uploaded_after', 'uploaded_before')
+    @classmethod
+    def assume_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+    
+    @model_validator(mode='after')
+    def check_ranges(self) -> 'QueryFilters':
+        if (
+            self.page_from is not None and self.page_to is not None
+            and self.page_from > self.page_to
+        ):
+            raise ValueError("page_from must not be after page_to")
+        if (
+            self.uploaded_after is not None and self.uploaded_before is not None
+            and self.uploaded_after >= self.uploaded_before
+        ):
+            raise ValueError("uploaded_after must be before uploaded_before")
+        return self
 
 
 class QueryRequest(BaseModel):
     query: str = Field(..., description="The question to ask")
     top_k: int = Field(default=5, ge=1, le=20, description="Number of results to retrieve")
+    filters: Optional[QueryFilters] = Field(default=None, description="Metadata filters")
+    tenant: Optional[str] = Field(
+        default=None, max_length=64, pattern=TENANT_PATTERN,
+        description="Search only this tenant's documents (default: documents without a tenant)"
+    )
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=1000, description="Questions to ask")
+    top_k: int = Field(default=5, ge=1, le=20, description="Number of results to retrieve")
+    filters: Optional[QueryFilters] = Field(
+        default=None, description="Metadata filters applied to every query"
+    )
+    tenant: Optional[str] = Field(
+        default=None, max_length=64, pattern=TENANT_PATTERN,
+        description="Search only this tenant's documents (default: documents without a tenant)"
+    )
 
 
 class Source(BaseModel):
@@ -32,6 +129,8 @@ class Source(BaseModel):
     chunk_id: str
     similarity_score: float
     content: str
+    # False when the chunk's text couldn't be read; it was left out of the answer's context
+    text_available: bool = True
     metadata: Optional[Dict[str, Any]] = None
 
 
@@ -39,6 +138,7 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[Source]
     query: str
+    cached: bool = False
 
 
 class HealthResponse(BaseModel):
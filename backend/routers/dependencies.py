@@ -0,0 +1,66 @@
+"""
+FastAPI dependencies - resolve shared services from the application container
+"""
+
+import logging
+import threading
+from fastapi import Depends, HTTPException, Request
+from services.container import ServiceContainer
+from services.ingestion_service import IngestionService
+from services.job_queue import IngestionJobQueue
+from services.query_service import QueryService
+from services.s3_service import S3Service
+from services.upload_registry import UploadRegistry
+
+logger = logging.getLogger(__name__)
+
+_container_lock = threading.Lock()
+
+
+def get_container(request: Request) -> ServiceContainer:
+    """
+    Return the container built in the application lifespan
+    Falls back to creating one when the lifespan didn't run (e.g. TestClient without a context)
+    """
+    container = getattr(request.app.state, 'services', None)
+    if container is None:
+        with _container_lock:
+            container = getattr(request.app.state, 'services', None)
+            if container is None:
+                container = ServiceContainer()
+                request.app.state.services = container
+    return container
+
+
+def get_query_service(container: ServiceContainer = Depends(get_container)) -> QueryService:
+    try:
+        return container.query_service
+    except Exception as e:
+        logger.error(f"Query service unavailable: {e}")
+        raise HTTPException(status_code=503, detail=f"Query service unavailable: {str(e)}")
+
+
+def get_ingestion_service(
+    container: ServiceContainer = Depends(get_container)
+) -> IngestionService:
+    try:
+        return container.ingestion_service
+    except Exception as e:
+        logger.error(f"Ingestion service unavailable: {e}")
+        raise HTTPException(status_code=503, detail=f"Ingestion service unavailable: {str(e)}")
+
+
+def get_job_queue(container: ServiceContainer = Depends(get_container)) -> IngestionJobQueue:
+    try:
+        return container.job_queue
+    except Exception as e:
+        logger.error(f"Ingestion job queue unavailable: {e}")
+        raise HTTPException(status_code=503, detail=f"Ingestion service unavailable: {str(e)}")
+
+
+def get_s3_service(container: ServiceContainer = Depends(get_container)) -> S3Service:
+    return container.s3_service
+
+
+def get_upload_registry(container: ServiceContainer = Depends(get_container)) -> UploadRegistry:
+    return container.upload_registry
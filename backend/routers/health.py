@@ -3,18 +3,17 @@ Health check router
 """
 
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from models.schemas import HealthResponse
-from services.openai_service import OpenAIService
-from services.pinecone_service import PineconeService
-import boto3
+from services.container import ServiceContainer
+from routers.dependencies import get_container
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(container: ServiceContainer = Depends(get_container)):
     """
     Health check endpoint
     Returns the status of the service and its dependencies
@@ -23,28 +22,27 @@ async def health_check():
         # Check OpenAI
         openai_status = "unknown"
         try:
-            openai_service = OpenAIService()
+            openai_service = container.openai_service
             # Simple check - just verify the service is initialized
             openai_status = "healthy" if openai_service.client else "unhealthy"
         except Exception as e:
             logger.error(f"OpenAI health check failed: {e}")
             openai_status = "unhealthy"
 
-        # Check Pinecone
-        pinecone_status = "unknown"
+        # Check the vector store
+        vector_store_status = "unknown"
         try:
-            pinecone_service = PineconeService()
+            vector_store = container.vector_store
             # Check if index exists and is accessible
-            pinecone_status = "healthy" if pinecone_service.index else "unhealthy"
+            vector_store_status = "healthy" if vector_store.is_ready() else "unhealthy"
         except Exception as e:
-            logger.error(f"Pinecone health check failed: {e}")
-            pinecone_status = "unhealthy"
+            logger.error(f"Vector store health check failed: {e}")
+            vector_store_status = "unhealthy"
 
         # Check S3
         s3_status = "unknown"
         try:
-            s3_client = boto3.client('s3')
-            s3_client.list_buckets()
+            await container.s3_service.list_buckets()
             s3_status = "healthy"
         except Exception as e:
             logger.error(f"S3 health check failed: {e}")
@@ -55,7 +53,7 @@ async def health_check():
             version="1.0.0",
             services={
                 "openai": openai_status,
-                "pinecone": pinecone_status,
+                "vector_store": vector_store_status,
                 "s3": s3_status
             }
         )
@@ -3,33 +3,87 @@ Ingest router - handles document ingestion and embedding
 """
 
 import logging
-from fastapi import APIRouter, HTTPException
-from models.schemas import IngestRequest, IngestResponse
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, HTTPException
+from models.schemas import (
+    DeleteDocumentResponse, IngestRequest, IngestJobResponse, IngestProgress
+)
 from services.ingestion_service import IngestionService
+from services.job_queue import IngestionJobQueue
+from routers.dependencies import get_ingestion_service, get_job_queue
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("", response_model=IngestResponse)
-async def ingest_document(request: IngestRequest):
+def _job_response(job: Dict[str, Any]) -> IngestJobResponse:
+    result = job.get('result') or {}
+    return IngestJobResponse(
+        job_id=job['job_id'],
+        file_id=job['file_id'],
+        document_id=job.get('document_id') or job['file_id'],
+        tenant=job.get('tenant'),
+        status=job['status'],
+        progress=IngestProgress(**job['progress']),
+        chunks_processed=result.get('chunks_processed'),
+        error=job.get('error'),
+        created_at=job['created_at'],
+        updated_at=job['updated_at']
+    )
+
+
+@router.post("", response_model=IngestJobResponse, status_code=202)
+async def ingest_document(
+    request: IngestRequest,
+    job_queue: IngestionJobQueue = Depends(get_job_queue)
+):
     """
-    Ingest a document: extract text, chunk it, generate embeddings, and store in Pinecone
+    Queue a document for ingestion: extract, chunk, embed, and store in Pinecone
+    With a document_id, the file replaces that document's previous version and only changed
+    chunks are embedded. With a tenant, only that tenant's queries will find the document.
+    Returns immediately with a job id; poll GET /ingest/{job_id} for progress
     """
     try:
-        ingestion_service = IngestionService()
-        
-        # Process the document
-        result = await ingestion_service.ingest_document(request.file_id)
-        
-        return IngestResponse(
-            message="Document ingested successfully",
-            chunks_processed=result['chunks_processed']
-        )
+        job = await job_queue.enqueue(request.file_id, request.document_id, request.tenant)
+        return _job_response(job)
     except Exception as e:
-        logger.error(f"Error ingesting document: {e}", exc_info=True)
+        logger.error(f"Error queueing document ingestion: {e}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Ingestion failed: {str(e)}"
         )
 
+
+@router.get("/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(
+    job_id: str,
+    job_queue: IngestionJobQueue = Depends(get_job_queue)
+):
+    """
+    Report the status and progress of an ingestion job
+    """
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return _job_response(job)
+
+
+@router.delete("/{document_id}", response_model=DeleteDocumentResponse)
+async def delete_document(
+    document_id: str,
+    ingestion_service: IngestionService = Depends(get_ingestion_service)
+):
+    """
+    Remove a document's chunks from the vector store, keyword index and chunk store
+    """
+    try:
+        result = await ingestion_service.delete_document(document_id)
+        return DeleteDocumentResponse(**result)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error deleting document: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Delete failed: {str(e)}"
+        )
@@ -0,0 +1,18 @@
+"""
+Metrics router
+"""
+
+from fastapi import APIRouter, Response
+from services.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics: per-stage query and ingestion latency, OpenAI tokens, cache hits,
+    S3 bytes downloaded and vectors upserted
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -2,34 +2,46 @@
 Query router - handles RAG queries
 """
 
+import json
 import logging
-from fastapi import APIRouter, HTTPException
-from models.schemas import QueryRequest, QueryResponse
-from services.query_service import QueryService
+from typing import Any, AsyncIterator, Dict
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from models.schemas import BatchQueryRequest, QueryRequest, QueryResponse
+from services.query_service import ChunkTextUnavailable, QueryService
+from routers.dependencies import get_query_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.post("", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(
+    request: QueryRequest,
+    query_service: QueryService = Depends(get_query_service)
+):
     """
     Query documents using RAG: retrieve relevant chunks and generate answer
+    Retrieval is limited to the tenant's documents and the chunks matching the filters
     """
     try:
-        query_service = QueryService()
-        
         # Process the query
         result = await query_service.query(
             query=request.query,
-            top_k=request.top_k
+            top_k=request.top_k,
+            filters=request.filters,
+            tenant=request.tenant
         )
         
         return QueryResponse(
             answer=result['answer'],
             sources=result['sources'],
-            query=request.query
+            query=request.query,
+            cached=result.get('cached', False)
         )
+    except ChunkTextUnavailable as e:
+        logger.error(f"Error querying documents: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying documents: {e}", exc_info=True)
         raise HTTPException(
@@ -37,3 +49,91 @@ async def query_documents(request: QueryRequest):
             detail=f"Query failed: {str(e)}"
         )
 
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@router.post("/stream")
+async def query_documents_stream(
+    request: QueryRequest,
+    query_service: QueryService = Depends(get_query_service)
+):
+    """
+    Query documents using RAG and stream the answer as Server-Sent Events
+    Emits a 'sources' event after retrieval, 'token' events while generating, then 'done'
+    """
+    events = query_service.query_stream(
+        query=request.query, top_k=request.top_k, filters=request.filters, tenant=request.tenant
+    )
+    try:
+        # Run retrieval before committing to a 200 so failures still map to an HTTP error
+        first_event = await events.__anext__()
+    except ChunkTextUnavailable as e:
+        logger.error(f"Error querying documents: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error querying documents: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Query failed: {str(e)}"
+        )
+    
+    async def event_stream() -> AsyncIterator[str]:
+        yield _format_sse(first_event)
+        try:
+            async for event in events:
+                yield _format_sse(event)
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}", exc_info=True)
+            yield _format_sse({'event': 'error', 'data': {'detail': f"Query failed: {str(e)}"}})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _format_ndjson(result: Dict[str, Any]) -> str:
+    if 'sources' in result:
+        result = {**result, 'sources': [source.model_dump() for source in result['sources']]}
+    return json.dumps(result) + "\n"
+
+
+@router.post("/batch")
+async def query_documents_batch(
+    request: BatchQueryRequest,
+    query_service: QueryService = Depends(get_query_service)
+):
+    """
+    Answer many queries in one request, streamed as NDJSON in completion order
+    Each line carries the query's index in the request; failed queries have 'error' instead of
+    'answer' and 'sources'
+    """
+    try:
+        # Embed the batch before committing to a 200 so failures still map to an HTTP error;
+        # answers then stream as they complete
+        results = await query_service.query_batch(
+            queries=request.queries, top_k=request.top_k, filters=request.filters,
+            tenant=request.tenant
+        )
+    except Exception as e:
+        logger.error(f"Error querying documents: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch query failed: {str(e)}"
+        )
+    
+    async def result_stream() -> AsyncIterator[str]:
+        try:
+            async for result in results:
+                yield _format_ndjson(result)
+        finally:
+            await results.aclose()
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -2,75 +2,210 @@
 Upload router - handles file uploads
 """
 
+import os
+import asyncio
 import logging
 import uuid
-import boto3
-import os
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import Any, AsyncIterator, Dict, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.requests import ClientDisconnect
+from multipart.multipart import MultipartParser, parse_options_header
 from models.schemas import UploadResponse
 from botocore.exceptions import ClientError
+from routers.dependencies import get_s3_service, get_upload_registry
+from services.s3_service import S3Service, UploadTooLarge
+from services.upload_registry import UploadRegistry
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize S3 client
-s3_client = boto3.client('s3')
-S3_BUCKET = os.getenv('S3_BUCKET', 'ragledger-documents')
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(500 * 1024 * 1024)))
+
+_UPLOAD_FORM_SCHEMA = {
+    'requestBody': {
+        'required': True,
+        'content': {
+            'multipart/form-data': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {'file': {'type': 'string', 'format': 'binary'}},
+                    'required': ['file']
+                }
+            }
+        }
+    }
+}
 
 
-@router.post("", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def _iter_form_file(
+    request: Request,
+    field_name: str = 'file'
+) -> AsyncIterator[Tuple[str, Any]]:
     """
-    Upload a PDF or CSV file to S3
+    Parse a multipart/form-data body as it arrives
+    Yields ('file', {'filename', 'content_type'}) once the file part's headers are read, then
+    ('data', bytes) pieces of its content; other form fields are skipped
+    A body that ends before the file part or the closing boundary (a truncated or aborted
+    request) is rejected with 400, so a partial file is never stored as complete
     """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    events = []
+    header = {'field': b'', 'value': b'', 'headers': {}}
+    
+    def on_part_begin():
+        header['headers'] = {}
+    
+    def on_header_field(data, start, end):
+        header['field'] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        header['value'] += data[start:end]
+    
+    def on_header_end():
+        header['headers'][header['field'].lower()] = header['value']
+        header['field'], header['value'] = b'', b''
+    
+    def on_headers_finished():
+        events.append(('part', header['headers']))
+    
+    def on_part_data(data, start, end):
+        events.append(('data', bytes(data[start:end])))
+    
+    parser = MultipartParser(params[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': lambda: events.append(('end', None)),
+        'on_end': lambda: events.append(('finished', None))
+    })
+    
+    in_file = False
+    found = False
+    file_complete = False
+    body_complete = False
     try:
-        # Validate file type
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="Filename is required")
-        
-        file_ext = file.filename.split('.')[-1].lower()
-        if file_ext not in ['pdf', 'csv']:
-            raise HTTPException(
-                status_code=400,
-                detail="Only PDF and CSV files are supported"
-            )
-
-        # Generate unique file ID
-        file_id = str(uuid.uuid4())
-        s3_key = f"documents/{file_id}/{file.filename}"
+        async for body_chunk in request.stream():
+            parser.write(body_chunk)
+            for kind, value in events:
+                if kind == 'part':
+                    _, options = parse_options_header(value.get(b'content-disposition', b''))
+                    in_file = (
+                        not found
+                        and options.get(b'name') == field_name.encode()
+                        and b'filename' in options
+                    )
+                    if in_file:
+                        found = True
+                        yield 'file', {
+                            'filename': options[b'filename'].decode('utf-8', 'replace'),
+                            'content_type': value.get(b'content-type', b'').decode() or None
+                        }
+                elif kind == 'data' and in_file:
+                    yield 'data', value
+                elif kind == 'end':
+                    file_complete = file_complete or in_file
+                    in_file = False
+                elif kind == 'finished':
+                    body_complete = True
+            events.clear()
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload aborted by the client")
+    parser.finalize()
+    if not found:
+        raise HTTPException(status_code=400, detail="File is required")
+    if not (file_complete and body_complete):
+        raise HTTPException(
+            status_code=400,
+            detail="Upload body ended before the file was complete"
+        )
 
-        # Read file content
-        file_content = await file.read()
 
+@router.post("", response_model=UploadResponse, openapi_extra=_UPLOAD_FORM_SCHEMA)
+async def upload_file(
+    request: Request,
+    s3_service: S3Service = Depends(get_s3_service),
+    upload_registry: UploadRegistry = Depends(get_upload_registry)
+):
+    """
+    Upload a PDF or CSV file to S3
+    The body is streamed into an S3 multipart upload, so files are never held whole in memory
+    """
+    # Reject oversized bodies up front; the limit is enforced again while streaming
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    writer = None
+    try:
+        async for kind, value in _iter_form_file(request):
+            if kind == 'file':
+                filename = os.path.basename(value['filename'])
+                
+                # Validate file type
+                if not filename:
+                    raise HTTPException(status_code=400, detail="Filename is required")
+                
+                file_ext = filename.split('.')[-1].lower()
+                if file_ext not in ['pdf', 'csv']:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Only PDF and CSV files are supported"
+                    )
+                
+                # Generate unique file ID
+                file_id = str(uuid.uuid4())
+                s3_key = f"documents/{file_id}/{filename}"
+                writer = s3_service.open_multipart_upload(
+                    s3_key,
+                    max_size=UPLOAD_MAX_BYTES,
+                    ContentType=value['content_type'] or f"application/{file_ext}",
+                    Metadata={
+                        'original_filename': filename,
+                        'file_id': file_id,
+                        'file_type': file_ext
+                    }
+                )
+            else:
+                await writer.write(value)
+        
         # Upload to S3
         try:
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=file.content_type or f"application/{file_ext}",
-                Metadata={
-                    'original_filename': file.filename,
-                    'file_id': file_id,
-                    'file_type': file_ext
-                }
-            )
-            logger.info(f"File uploaded to S3: {s3_key}")
+            upload: Dict[str, Any] = await writer.complete()
+            writer = None
+            logger.info(f"File uploaded to S3: {s3_key} ({upload['size']} bytes)")
         except ClientError as e:
             logger.error(f"Error uploading to S3: {e}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to upload file to S3: {str(e)}"
             )
-
+        await asyncio.to_thread(
+            upload_registry.record, file_id, s3_key, filename, file_ext,
+            size=upload['size'], content_hash=upload['sha256']
+        )
+        
         return UploadResponse(
             message="File uploaded successfully",
             file_id=file_id,
-            filename=file.filename
+            filename=filename,
+            size=upload['size'],
+            content_hash=upload['sha256']
         )
+    except UploadTooLarge as e:
+        await writer.abort()
+        raise HTTPException(status_code=413, detail=str(e))
     except HTTPException:
+        if writer is not None:
+            await writer.abort()
         raise
     except Exception as e:
+        if writer is not None:
+            await writer.abort()
         logger.error(f"Error uploading file: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
-
@@ -0,0 +1,216 @@
+"""
+Chunk Store - full chunk text keyed by chunk_id, stored as zstd-compressed blocks
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import zstandard
+from services.concurrency import BoundedExecutor
+from services.local_db import connect, data_path
+
+logger = logging.getLogger(__name__)
+
+_SQL_BATCH = 500
+
+
+class ChunkStore:
+    """
+    SQLite store of chunk text
+    Chunks are concatenated into blocks of up to block_chunks chunks and compressed together,
+    which compresses far better than chunk by chunk; recently read blocks are kept decompressed
+    in a small LRU so chunks retrieved together don't decompress the same block twice.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('CHUNK_STORE_DB', data_path('chunks.db'))
+        self.block_chunks = int(os.getenv('CHUNK_STORE_BLOCK_CHUNKS', '32'))
+        self.cache_blocks = int(os.getenv('CHUNK_STORE_CACHE_BLOCKS', '256'))
+        self.level = int(os.getenv('CHUNK_STORE_ZSTD_LEVEL', '3'))
+        self.executor = BoundedExecutor(
+            'chunk-store', int(os.getenv('CHUNK_STORE_MAX_CONCURRENCY', '4'))
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._blocks: "OrderedDict[int, bytes]" = OrderedDict()
+        self._conn = connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blocks (
+                block_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_id TEXT NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                block_id INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks (file_id);
+            CREATE INDEX IF NOT EXISTS idx_chunks_block ON chunks (block_id);
+            """
+        )
+    
+    async def put_many(self, file_id: str, chunks: Dict[str, str]):
+        """
+        Store chunk texts for a file, replacing chunks with the same ids
+        """
+        await self.executor.run(self._put_many, file_id, chunks)
+    
+    async def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Fetch several chunks at once; returns only the ids that were found
+        """
+        return await self.executor.run(self._get_many, list(chunk_ids))
+    
+    async def remove_file(self, file_id: str):
+        await self.executor.run(self._remove_file, file_id)
+    
+    async def remove_chunks(self, chunk_ids: List[str]):
+        await self.executor.run(self._remove_chunks, chunk_ids)
+    
+    def _compressor(self) -> Tuple[zstandard.ZstdCompressor, zstandard.ZstdDecompressor]:
+        # zstd contexts aren't thread-safe, so each worker thread gets its own
+        if not hasattr(self._local, 'compressor'):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.compressor, self._local.decompressor
+    
+    def _put_many(self, file_id: str, chunks: Dict[str, str]):
+        compressor, _ = self._compressor()
+        items = list(chunks.items())
+        blocks = []
+        for i in range(0, len(items), self.block_chunks):
+            entries, parts, offset = [], [], 0
+            for chunk_id, text in items[i:i + self.block_chunks]:
+                data = text.encode('utf-8')
+                entries.append((chunk_id, offset, len(data)))
+                parts.append(data)
+                offset += len(data)
+            blocks.append((entries, compressor.compress(b"".join(parts))))
+        
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_chunks([chunk_id for chunk_id, _ in items])
+                for entries, data in blocks:
+                    block_id = self._conn.execute(
+                        "INSERT INTO blocks (file_id, data) VALUES (?, ?)", (file_id, data)
+                    ).lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (chunk_id, file_id, block_id, offset, length)
+                            for chunk_id, offset, length in entries
+                        ]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _get_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        _, decompressor = self._compressor()
+        locations = []
+        with self._lock:
+            for i in range(0, len(chunk_ids), _SQL_BATCH):
+                batch = chunk_ids[i:i + _SQL_BATCH]
+                locations.extend(self._conn.execute(
+                    f"SELECT chunk_id, block_id, offset, length FROM chunks "
+                    f"WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+            blocks = {}
+            missing = []
+            for block_id in {row['block_id'] for row in locations}:
+                if block_id in self._blocks:
+                    self._blocks.move_to_end(block_id)
+                    blocks[block_id] = self._blocks[block_id]
+                else:
+                    missing.append(block_id)
+            compressed = {}
+            for i in range(0, len(missing), _SQL_BATCH):
+                batch = missing[i:i + _SQL_BATCH]
+                compressed.update(self._conn.execute(
+                    f"SELECT block_id, data FROM blocks "
+                    f"WHERE block_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+        
+        for block_id, data in compressed.items():
+            blocks[block_id] = decompressor.decompress(data)
+        if compressed:
+            with self._lock:
+                for block_id in compressed:
+                    self._blocks[block_id] = blocks[block_id]
+                while len(self._blocks) > self.cache_blocks:
+                    self._blocks.popitem(last=False)
+        
+        return {
+            row['chunk_id']: blocks[row['block_id']][
+                row['offset']:row['offset'] + row['length']
+            ].decode('utf-8')
+            for row in locations
+        }
+    
+    def _remove_file(self, file_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM chunks WHERE file_id = ?", (file_id,))
+                block_ids = [
+                    row[0] for row in self._conn.execute(
+                        "SELECT block_id FROM blocks WHERE file_id = ?", (file_id,)
+                    )
+                ]
+                self._conn.execute("DELETE FROM blocks WHERE file_id = ?", (file_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for block_id in block_ids:
+                self._blocks.pop(block_id, None)
+    
+    def _remove_chunks(self, chunk_ids: List[str]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_chunks(chunk_ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """
+        Delete chunks and any blocks left without chunks (caller holds the lock in a transaction)
+        """
+        for i in range(0, len(chunk_ids), _SQL_BATCH):
+            batch = chunk_ids[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            block_ids = [
+                row[0] for row in self._conn.execute(
+                    f"SELECT DISTINCT block_id FROM chunks WHERE chunk_id IN ({placeholders})",
+                    batch
+                )
+            ]
+            if not block_ids:
+                continue
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+            block_placeholders = ",".join("?" * len(block_ids))
+            self._conn.execute(
+                f"DELETE FROM blocks WHERE block_id IN ({block_placeholders}) AND NOT EXISTS "
+                f"(SELECT 1 FROM chunks WHERE chunks.block_id = blocks.block_id)",
+                block_ids
+            )
+            for block_id in block_ids:
+                self._blocks.pop(block_id, None)
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,181 @@
+"""
+Chunker - splits text into token-bounded chunks at paragraph, line, sentence or word breaks
+"""
+
+import os
+import re
+import logging
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Tokenizer used by the embedding models
+encoding = tiktoken.get_encoding("cl100k_base")
+
+# Places a chunk may end, strongest first; blank lines also separate formatted CSV rows
+_BREAKS = [
+    re.compile(r'\n[ \t]*\n\s*'),
+    re.compile(r'\n\s*'),
+    re.compile(r'[.!?;:]["\')\]]*\s+'),
+    re.compile(r'\s+'),
+]
+# Breaks strong enough to start an overlap at (paragraph, line, sentence)
+_OVERLAP_BREAKS = 3
+# tiktoken's merge step is quadratic in the length of a run of non-whitespace or of whitespace
+# characters, so longer runs are encoded in slices of this many characters
+_MAX_RUN = 1000
+_LONG_RUN = re.compile(r'(?<!\S)\S{%d,}|(?<!\s)\s{%d,}' % (_MAX_RUN + 1, _MAX_RUN + 1))
+
+
+def encode(text: str) -> List[int]:
+    """
+    Tokenize text, treating special-token markup as plain text
+    """
+    if len(text) <= _MAX_RUN or not _LONG_RUN.search(text):
+        return encoding.encode_ordinary(text)
+    pieces = []
+    last = 0
+    for match in _LONG_RUN.finditer(text):
+        pieces.append(text[last:match.start()])
+        pieces.extend(
+            text[i:min(i + _MAX_RUN, match.end())]
+            for i in range(match.start(), match.end(), _MAX_RUN)
+        )
+        last = match.end()
+    pieces.append(text[last:])
+    return [
+        token
+        for tokens in encoding.encode_ordinary_batch([piece for piece in pieces if piece])
+        for token in tokens
+    ]
+
+
+@lru_cache(maxsize=1)
+def _token_lengths() -> np.ndarray:
+    """
+    Byte length of every token in the vocabulary, built on first use
+    """
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # Unused ids between the ordinary and the special tokens
+    return lengths
+
+
+def token_offsets(text: str, tokens: List[int]) -> np.ndarray:
+    """
+    Character offset at which each token starts, plus len(text) at the end
+    Offsets come from the tokens' byte lengths, so nothing is decoded; a token boundary inside
+    a multi-byte character rounds up to the next character
+    """
+    lengths = _token_lengths()[np.asarray(tokens, dtype=np.int64)]
+    byte_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    data = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    if len(data) == len(text):
+        return byte_offsets
+    # Characters started before each byte: UTF-8 continuation bytes are 10xxxxxx
+    char_of_byte = np.concatenate(([0], np.cumsum((data & 0xC0) != 0x80)))
+    return char_of_byte[byte_offsets]
+
+
+class Chunker:
+    """
+    Splits text into chunks of at most chunk_size tokens, consecutive chunks sharing about
+    overlap tokens
+    The text is tokenized once and chunks are slices of the original text, located through the
+    tokens' character offsets. A chunk ends at the strongest break (paragraph, line, sentence,
+    word) in the last (1 - min_fill) of its window, and the next chunk's overlap starts at a
+    sentence or line break where there is one. Breaks are found with one regex pass each and
+    looked up by bisection, so chunking is linear in the length of the text.
+    """
+    
+    def __init__(self, chunk_size: int = 500, overlap: int = 50, min_fill: float = 0.5):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1 token")
+        self.chunk_size = chunk_size
+        # Each chunk must add at least half its size of new text
+        self.overlap = max(0, min(overlap, chunk_size // 2))
+        self.min_fill = min_fill
+    
+    @classmethod
+    def for_file_type(cls, file_type: str) -> 'Chunker':
+        """
+        Sizes from CHUNK_SIZE_<TYPE> / CHUNK_OVERLAP_<TYPE>, else CHUNK_SIZE / CHUNK_OVERLAP
+        """
+        suffix = file_type.upper()
+        size = os.getenv(f'CHUNK_SIZE_{suffix}') or os.getenv('CHUNK_SIZE', '500')
+        overlap = os.getenv(f'CHUNK_OVERLAP_{suffix}') or os.getenv('CHUNK_OVERLAP', '50')
+        return cls(int(size), int(overlap))
+    
+    def split(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Chunk text, returning (content, token count) pairs in order
+        """
+        tokens = encode(text)
+        total = len(tokens)
+        if total <= self.chunk_size:
+            content = text.strip()
+            return [(content, total)] if content else []
+        
+        offsets = token_offsets(text, tokens)
+        breaks: Dict[int, List[int]] = {}
+        
+        def break_tokens(level: int) -> List[int]:
+            # Token index each break ends before; computed only for the levels a text needs
+            if level not in breaks:
+                ends = np.fromiter(
+                    (match.end() for match in _BREAKS[level].finditer(text)), dtype=np.int64
+                )
+                positions = np.searchsorted(offsets, ends, side='right') - 1
+                breaks[level] = np.unique(positions[positions > 0]).tolist()
+            return breaks[level]
+        
+        chunks = []
+        start = 0
+        while True:
+            limit = start + self.chunk_size
+            if limit >= total:
+                end = total
+            else:
+                lowest = start + max(1, int(self.chunk_size * self.min_fill))
+                end = self._last_break(break_tokens, lowest, limit) or limit
+            content = text[offsets[start]:offsets[end]].strip()
+            if content:
+                chunks.append((content, end - start))
+            if end >= total:
+                return chunks
+            start = max(self._overlap_start(break_tokens, end), start + 1)
+    
+    @staticmethod
+    def _last_break(break_tokens, lowest: int, highest: int) -> Optional[int]:
+        """
+        Latest break in [lowest, highest] of the strongest level that has one
+        """
+        for level in range(len(_BREAKS)):
+            positions = break_tokens(level)
+            i = bisect_right(positions, highest) - 1
+            if i >= 0 and positions[i] >= lowest:
+                return positions[i]
+        return None
+    
+    def _overlap_start(self, break_tokens, end: int) -> int:
+        """
+        Where the chunk after one ending at end starts: the earliest sentence or line break
+        within the overlap, else exactly overlap tokens back
+        """
+        if not self.overlap:
+            return end
+        lowest = end - self.overlap
+        starts = []
+        for level in range(_OVERLAP_BREAKS):
+            positions = break_tokens(level)
+            i = bisect_left(positions, lowest)
+            if i < len(positions) and positions[i] < end:
+                starts.append(positions[i])
+        return min(starts) if starts else lowest
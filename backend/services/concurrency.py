@@ -0,0 +1,33 @@
+"""
+Concurrency helpers - offload blocking client calls without stalling the event loop
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """
+    Dedicated thread pool for one blocking dependency
+    At most max_workers calls run at once; the rest wait without occupying the event loop
+    """
+    
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+    
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the pool and await its result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+    
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,212 @@
+"""
+Service Container - process-wide service singletons
+"""
+
+import os
+import logging
+import threading
+from typing import Optional
+from services.chunk_store import ChunkStore
+from services.embedding_cache import EmbeddingCache
+from services.openai_service import OpenAIService
+from services.vector_store import VectorStore, create_vector_store
+from services.query_cache import QueryCache
+from services.query_service import QueryService
+from services.document_registry import DocumentRegistry
+from services.ingestion_service import IngestionService
+from services.job_queue import IngestionJobQueue
+from services.reranker import Reranker
+from services.s3_service import S3Service
+from services.sparse_index import SparseIndex
+from services.upload_registry import UploadRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Holds the long-lived service clients shared by every request
+    Services are built once, on first use, and reuse their pooled connections afterwards
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._embedding_cache = None
+        self._query_cache = None
+        self._sparse_index = None
+        self._chunk_store = None
+        self._reranker = None
+        self._openai_service = None
+        self._vector_store = None
+        self._s3_service = None
+        self._upload_registry = None
+        self._document_registry = None
+        self._query_service = None
+        self._ingestion_service = None
+        self._job_queue = None
+    
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        with self._lock:
+            if self._embedding_cache is None and os.getenv('EMBED_CACHE_ENABLED', 'true') == 'true':
+                self._embedding_cache = EmbeddingCache()
+            return self._embedding_cache
+    
+    @property
+    def query_cache(self) -> Optional[QueryCache]:
+        with self._lock:
+            if self._query_cache is None and os.getenv('QUERY_CACHE_ENABLED', 'true') == 'true':
+                self._query_cache = QueryCache()
+            return self._query_cache
+    
+    @property
+    def sparse_index(self) -> Optional[SparseIndex]:
+        with self._lock:
+            if self._sparse_index is None and os.getenv('HYBRID_SEARCH_ENABLED', 'true') == 'true':
+                self._sparse_index = SparseIndex()
+            return self._sparse_index
+    
+    @property
+    def chunk_store(self) -> ChunkStore:
+        with self._lock:
+            if self._chunk_store is None:
+                self._chunk_store = ChunkStore()
+            return self._chunk_store
+    
+    @property
+    def reranker(self) -> Optional[Reranker]:
+        with self._lock:
+            if self._reranker is None and os.getenv('RERANK_MODE', 'none') != 'none':
+                self._reranker = Reranker()
+            return self._reranker
+    
+    @property
+    def openai_service(self) -> OpenAIService:
+        with self._lock:
+            if self._openai_service is None:
+                self._openai_service = OpenAIService(embedding_cache=self.embedding_cache)
+            return self._openai_service
+    
+    @property
+    def vector_store(self) -> VectorStore:
+        with self._lock:
+            if self._vector_store is None:
+                self._vector_store = create_vector_store()
+            return self._vector_store
+    
+    @property
+    def s3_service(self) -> S3Service:
+        with self._lock:
+            if self._s3_service is None:
+                self._s3_service = S3Service()
+            return self._s3_service
+    
+    @property
+    def upload_registry(self) -> UploadRegistry:
+        with self._lock:
+            if self._upload_registry is None:
+                self._upload_registry = UploadRegistry()
+            return self._upload_registry
+    
+    @property
+    def document_registry(self) -> DocumentRegistry:
+        with self._lock:
+            if self._document_registry is None:
+                self._document_registry = DocumentRegistry()
+            return self._document_registry
+    
+    @property
+    def query_service(self) -> QueryService:
+        with self._lock:
+            if self._query_service is None:
+                self._query_service = QueryService(
+                    openai_service=self.openai_service,
+                    vector_store=self.vector_store,
+                    query_cache=self.query_cache,
+                    sparse_index=self.sparse_index,
+                    chunk_store=self.chunk_store,
+                    reranker=self.reranker
+                )
+            return self._query_service
+    
+    @property
+    def ingestion_service(self) -> IngestionService:
+        with self._lock:
+            if self._ingestion_service is None:
+                self._ingestion_service = IngestionService(
+                    openai_service=self.openai_service,
+                    vector_store=self.vector_store,
+                    s3_service=self.s3_service,
+                    query_cache=self.query_cache,
+                    upload_registry=self.upload_registry,
+                    sparse_index=self.sparse_index,
+                    chunk_store=self.chunk_store,
+                    document_registry=self.document_registry
+                )
+            return self._ingestion_service
+    
+    @property
+    def job_queue(self) -> IngestionJobQueue:
+        with self._lock:
+            if self._job_queue is None:
+                self._job_queue = IngestionJobQueue(self.ingestion_service)
+            return self._job_queue
+    
+    def warm_up(self):
+        """
+        Build every service up front so the first request doesn't pay for client setup
+        Failures are logged and retried lazily on first use
+        """
+        for name in ('s3_service', 'query_service', 'ingestion_service'):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.warning(f"Could not initialize {name}: {e}")
+        try:
+            if self.reranker is not None:
+                self.reranker.warm_up()
+        except Exception as e:
+            logger.warning(f"Could not load the reranker model: {e}")
+    
+    async def close(self):
+        """
+        Close pooled connections held by the services
+        """
+        with self._lock:
+            if self._job_queue is not None:
+                await self._job_queue.stop()
+            if self._openai_service is not None:
+                await self._openai_service.close()
+            if self._vector_store is not None:
+                self._vector_store.close()
+            if self._s3_service is not None:
+                self._s3_service.close()
+            if self._ingestion_service is not None:
+                self._ingestion_service.close()
+            if self._upload_registry is not None:
+                self._upload_registry.close()
+            if self._document_registry is not None:
+                self._document_registry.close()
+            if self._embedding_cache is not None:
+                self._embedding_cache.close()
+            if self._query_cache is not None:
+                self._query_cache.close()
+            if self._sparse_index is not None:
+                self._sparse_index.close()
+            if self._chunk_store is not None:
+                self._chunk_store.close()
+            if self._reranker is not None:
+                self._reranker.close()
+            self._embedding_cache = None
+            self._query_cache = None
+            self._sparse_index = None
+            self._chunk_store = None
+            self._reranker = None
+            self._openai_service = None
+            self._vector_store = None
+            self._s3_service = None
+            self._upload_registry = None
+            self._document_registry = None
+            self._query_service = None
+            self._ingestion_service = None
+            self._job_queue = None
@@ -0,0 +1,130 @@
+"""
+Context Builder - token-budgeted assembly of retrieved chunks into LLM context
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Tokenizer used by the chat models
+encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def shingles(tokens: List[int], size: int = 5) -> Set[Tuple[int, ...]]:
+    """
+    Overlapping runs of size tokens; the set for a text shorter than size is the text itself
+    """
+    if len(tokens) <= size:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def jaccard(first: Set, second: Set) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _merge_text(first: str, second: str) -> str:
+    """
+    Join consecutive chunks, dropping the overlap the chunker repeats at the boundary
+    """
+    probe = second[:32]
+    # The earliest match in the tail is the longest overlap
+    lowest = max(0, len(first) - len(second))
+    start = first.find(probe, lowest) if probe else -1
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start:]
+        start = first.find(probe, start + 1)
+    return f"{first}\n{second}"
+
+
+class ContextBuilder:
+    """
+    Turns ranked retrieval candidates into the context sent to the chat model:
+    - drops near-duplicates: candidates whose token 5-shingles overlap a better-ranked one's
+      by at least dedup_threshold (Jaccard); with a few dozen candidates at most, exact
+      comparison is cheaper than MinHash signatures
+    - merges consecutive chunks of the same file and page, removing their overlap
+    - packs the best-scoring pieces into token_budget tokens
+    """
+    
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        dedup_threshold: Optional[float] = None
+    ):
+        self.token_budget = token_budget or int(os.getenv('CONTEXT_TOKEN_BUDGET', '4000'))
+        self.dedup_threshold = dedup_threshold or float(
+            os.getenv('CONTEXT_DEDUP_THRESHOLD', '0.85')
+        )
+    
+    def build(self, candidates: List[Dict[str, Any]]) -> List[str]:
+        """
+        candidates are dicts with text and metadata, best first
+        Returns the context passages, best first
+        """
+        kept = []
+        for rank, candidate in enumerate(candidates):
+            if not candidate['text'].strip():
+                continue
+            tokens = encoding.encode_ordinary(candidate['text'])
+            candidate_shingles = shingles(tokens)
+            if any(
+                jaccard(candidate_shingles, other['shingles']) >= self.dedup_threshold
+                for other in kept
+            ):
+                continue
+            kept.append({
+                **candidate, 'rank': rank, 'tokens': len(tokens), 'shingles': candidate_shingles
+            })
+        
+        pieces = self._merge_adjacent(kept)
+        pieces.sort(key=lambda piece: piece['rank'])
+        
+        context = []
+        used = 0
+        for piece in pieces:
+            if used + piece['tokens'] <= self.token_budget:
+                context.append(piece['text'])
+                used += piece['tokens']
+            elif not context:
+                # Always send something: truncate the best piece to the budget
+                tokens = encoding.encode_ordinary(piece['text'])[:self.token_budget]
+                context.append(encoding.decode(tokens))
+                used = len(tokens)
+        logger.debug(
+            f"Packed {len(context)} of {len(candidates)} candidates into {used} context tokens"
+        )
+        return context
+    
+    def _merge_adjacent(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        def position(candidate):
+            metadata = candidate.get('metadata') or {}
+            index = metadata.get('chunk_index')
+            # Chunks kept across document versions carry the file_id they were ingested from
+            owner = metadata.get('document_id') or metadata.get('file_id')
+            if index is None or owner is None:
+                return None
+            return (owner, metadata.get('page') or 0, index)
+        
+        positioned = sorted(
+            (candidate for candidate in candidates if position(candidate) is not None),
+            key=position
+        )
+        pieces = [candidate for candidate in candidates if position(candidate) is None]
+        for candidate in positioned:
+            previous = pieces[-1] if pieces and pieces[-1].get('_position') else None
+            owner, page, index = position(candidate)
+            if previous and previous['_position'] == (owner, page, index - 1):
+                previous['text'] = _merge_text(previous['text'], candidate['text'])
+                previous['tokens'] = len(encoding.encode_ordinary(previous['text']))
+                previous['rank'] = min(previous['rank'], candidate['rank'])
+                previous['_position'] = (owner, page, index)
+            else:
+                pieces.append({**candidate, '_position': (owner, page, index)})
+        return pieces
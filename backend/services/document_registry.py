@@ -0,0 +1,254 @@
+"""
+Document Registry - the chunks that make up each document's current version
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from services.local_db import connect, data_path
+
+logger = logging.getLogger(__name__)
+
+# Metadata that decides whether an unchanged chunk's stored vector is still accurate
+_FINGERPRINT_FIELDS = ('filename', 'page', 'chunk_index', 'type', 'row_start', 'row_end')
+
+
+def make_chunk_id(document_id: str, content: str, occurrence: int = 0) -> str:
+    """
+    Content-addressed chunk id: a document prefix plus a hash of the chunk text
+    Repeats of the same text within a document are told apart by occurrence
+    """
+    prefix = hashlib.sha256(document_id.encode('utf-8')).hexdigest()[:16]
+    digest = hashlib.sha256(content.encode('utf-8'))
+    if occurrence:
+        digest.update(f"\0{occurrence}".encode())
+    return f"{prefix}_{digest.hexdigest()[:32]}"
+
+
+def fingerprint(metadata: Dict[str, Any]) -> str:
+    return json.dumps(
+        {key: metadata.get(key) for key in _FINGERPRINT_FIELDS}, sort_keys=True, default=str
+    )
+
+
+class DocumentVersion:
+    """
+    A document being (re-)ingested: tracks its new chunks and diffs them against the previous
+    version's, so only added or moved chunks are embedded and removed ones can be deleted
+    """
+    
+    def __init__(
+        self,
+        document_id: str,
+        file_id: str,
+        filename: str,
+        file_type: str,
+        previous: Dict[str, str],
+        tenant: Optional[str] = None,
+        uploaded_at: Optional[int] = None
+    ):
+        self.document_id = document_id
+        self.file_id = file_id
+        self.filename = filename
+        self.file_type = file_type
+        self.previous = previous
+        self.tenant = tenant
+        self.uploaded_at = uploaded_at  # Unix time of the upload
+        self.chunks: Dict[str, str] = {}  # chunk_id -> fingerprint
+        self.unchanged = 0
+        self.kept: List[str] = []  # unchanged chunks, whose stored vectors are reused
+        self._occurrences: Counter = Counter()
+        self._page_positions: Counter = Counter()
+    
+    def add(self, chunk: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Register the next chunk; returns its id and metadata, or None if the previous version
+        already stored it with the same metadata
+        """
+        content = chunk['content']
+        chunk_id = make_chunk_id(self.document_id, content, self._occurrences[content])
+        self._occurrences[content] += 1
+        # Positions count within a page, so edits to one page don't renumber the rest
+        page = chunk.get('page')
+        position = self._page_positions[page]
+        self._page_positions[page] += 1
+        
+        metadata = {
+            'filename': chunk['filename'],
+            'file_id': self.file_id,
+            'document_id': self.document_id,
+            'page': page,
+            'chunk_index': position,
+            'type': self.file_type,
+            **{key: chunk[key] for key in ('row_start', 'row_end') if key in chunk}
+        }
+        # Filter-only fields: unchanged chunks get them through refreshed_fields instead
+        if self.tenant is not None:
+            metadata['tenant'] = self.tenant
+        if self.uploaded_at is not None:
+            metadata['uploaded_at'] = self.uploaded_at
+        self.chunks[chunk_id] = fingerprint(metadata)
+        if self.previous.get(chunk_id) == self.chunks[chunk_id]:
+            self.unchanged += 1
+            self.kept.append(chunk_id)
+            return None
+        return {'id': chunk_id, 'metadata': metadata}
+    
+    def refreshed_fields(self) -> Dict[str, Any]:
+        """
+        Metadata the kept chunks must be updated with to be found by this version's file_id and
+        upload time (the tenant never changes)
+        """
+        fields = {'file_id': self.file_id}
+        if self.uploaded_at is not None:
+            fields['uploaded_at'] = self.uploaded_at
+        return fields
+    
+    def removed(self) -> List[str]:
+        """
+        Chunks of the previous version that the new version no longer has
+        """
+        return [chunk_id for chunk_id in self.previous if chunk_id not in self.chunks]
+
+
+class DocumentRegistry:
+    """
+    SQLite store of documents and the ids and metadata fingerprints of their current chunks
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('DOCUMENT_REGISTRY_DB', data_path('documents.db'))
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                tenant TEXT
+            );
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                document_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (document_id, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pending_chunks (
+                document_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tenant TEXT,
+                PRIMARY KEY (document_id, chunk_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if 'tenant' not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN tenant TEXT")
+    
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def get_chunks(self, document_id: str) -> Dict[str, str]:
+        """
+        Map of chunk_id to metadata fingerprint for the document's current version
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, fingerprint FROM document_chunks WHERE document_id = ?",
+                (document_id,)
+            ).fetchall()
+        return {row['chunk_id']: row['fingerprint'] for row in rows}
+    
+    def add_pending(self, document_id: str, chunk_ids: List[str], tenant: Optional[str] = None):
+        """
+        Record chunks an ingest is about to store, so they can be found and deleted if it never
+        finishes
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO pending_chunks VALUES (?, ?, ?)",
+                    [(document_id, chunk_id, tenant) for chunk_id in chunk_ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def get_pending(self, document_id: str) -> Dict[str, Optional[str]]:
+        """
+        Map of chunk_id to tenant for chunks stored by an unfinished ingest of the document
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, tenant FROM pending_chunks WHERE document_id = ?",
+                (document_id,)
+            ).fetchall()
+        return {row['chunk_id']: row['tenant'] for row in rows}
+    
+    def clear_pending(self, document_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pending_chunks WHERE document_id = ?", (document_id,))
+    
+    def replace(self, version: DocumentVersion):
+        """
+        Record a fully ingested version as the document's current one
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table in ('document_chunks', 'pending_chunks'):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE document_id = ?", (version.document_id,)
+                    )
+                self._conn.executemany(
+                    "INSERT INTO document_chunks VALUES (?, ?, ?)",
+                    [
+                        (version.document_id, chunk_id, chunk_fingerprint)
+                        for chunk_id, chunk_fingerprint in version.chunks.items()
+                    ]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents "
+                    "(document_id, file_id, filename, chunk_count, updated_at, tenant) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        version.document_id, version.file_id, version.filename,
+                        len(version.chunks), datetime.now(timezone.utc).isoformat(),
+                        version.tenant
+                    )
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def delete(self, document_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table in ('document_chunks', 'pending_chunks', 'documents'):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE document_id = ?", (document_id,)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,145 @@
+"""
+Embedding Cache - content-addressed store of embeddings keyed by chunk text and model
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from services.local_db import connect, data_path
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so trivially different copies of a chunk share one cache entry
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by SQLite, storing vectors as float32 blobs
+    Least recently used entries are evicted once the cache exceeds max_entries
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.getenv('EMBED_CACHE_DB', data_path('embedding_cache.db'))
+        self.max_entries = max_entries or int(os.getenv('EMBED_CACHE_MAX_ENTRIES', '1000000'))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache opened at {self.path} with {self._entries} entries")
+    
+    @staticmethod
+    def make_key(text: str, model: str, dimensions: Optional[int] = None) -> str:
+        """
+        Cache key: hash of the embedding model (and requested dimensions) plus the normalized text
+        """
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        if dimensions:
+            digest.update(f"@{dimensions}".encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.hexdigest()
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Look up several keys at once; returns only the keys that were found
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                batch = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for row in rows:
+                    found[row['key']] = np.frombuffer(row['vector'], dtype=np.float32).tolist()
+                if rows:
+                    hit_keys = [row['key'] for row in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? "
+                        f"WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        (now, *hit_keys)
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+    
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        Store embeddings, evicting the least recently used entries if over capacity
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    rows
+                )
+                self._entries += self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._entries > self.max_entries:
+                self._evict()
+    
+    def _evict(self):
+        # Trim to 90% of capacity so eviction doesn't run on every insert
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self._entries -= excess
+        logger.info(f"Evicted {excess} least recently used embeddings from the cache")
+    
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
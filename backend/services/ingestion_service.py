@@ -3,22 +3,29 @@ Ingestion Service - handles document processing and ingestion
 """
 
 import os
+import asyncio
 import logging
-import uuid
-import boto3
 import pandas as pd
-from PyPDF2 import PdfReader
-from typing import List, Dict, Any
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import IO, AsyncIterator, Callable, List, Dict, Any, Optional, Union
+from services.chunk_store import ChunkStore
+from services.chunker import Chunker
+from services.document_registry import DocumentRegistry, DocumentVersion
+from services.metrics import PIPELINE_INGEST, stage
 from services.openai_service import OpenAIService
-from services.pinecone_service import PineconeService
+from services.vector_store import VectorStore, create_vector_store
+from services.s3_service import S3Service
+from services.upload_registry import UploadRegistry
+from services.query_cache import QueryCache
+from services.sparse_index import SparseIndex
+from services.concurrency import BoundedExecutor
+from services.pdf_extractor import PdfExtractor
 import tiktoken
 
 logger = logging.getLogger(__name__)
 
-# Initialize services
-s3_client = boto3.client('s3')
-S3_BUCKET = os.getenv('S3_BUCKET', 'ragledger-documents')
-
 # Tokenizer for chunking
 encoding = tiktoken.get_encoding("cl100k_base")
 
@@ -28,175 +35,594 @@ class IngestionService:
     Service for ingesting documents: extract, chunk, embed, and store
     """
     
-    def __init__(self):
-        self.openai_service = OpenAIService()
-        self.pinecone_service = PineconeService()
-        self.chunk_size = 500  # tokens
-        self.chunk_overlap = 50  # tokens
+    def __init__(
+        self,
+        openai_service: Optional[OpenAIService] = None,
+        vector_store: Optional[VectorStore] = None,
+        s3_service: Optional[S3Service] = None,
+        query_cache: Optional[QueryCache] = None,
+        upload_registry: Optional[UploadRegistry] = None,
+        sparse_index: Optional[SparseIndex] = None,
+        chunk_store: Optional[ChunkStore] = None,
+        document_registry: Optional[DocumentRegistry] = None
+    ):
+        self.openai_service = openai_service or OpenAIService()
+        self.vector_store = vector_store or create_vector_store()
+        self.s3_service = s3_service or S3Service()
+        self.query_cache = query_cache
+        self.upload_registry = upload_registry
+        self.sparse_index = sparse_index
+        self.chunk_store = chunk_store
+        # Re-ingesting a registered document only embeds the chunks that changed
+        self.document_registry = document_registry
+        self._document_locks: Dict[str, List[Any]] = {}  # document_id -> [lock, users]
+        # PDF/CSV parsing and tokenization are CPU-bound; keep them off the event loop
+        self.cpu_executor = BoundedExecutor(
+            'ingest-cpu', int(os.getenv('INGEST_CPU_WORKERS', '4'))
+        )
+        self.pdf_extractor = PdfExtractor()
+        # Chunks are embedded and upserted in groups; bounds memory per in-flight document
+        self.chunk_group_size = int(os.getenv('INGEST_CHUNK_GROUP_SIZE', '256'))
+        self.max_inflight_groups = int(os.getenv('INGEST_INFLIGHT_GROUPS', '2'))
+        self.csv_read_chunksize = int(os.getenv('CSV_READ_CHUNKSIZE', '50000'))  # rows
+        # Chunk sizes in tokens, per file type
+        self.chunkers = {
+            file_type: Chunker.for_file_type(file_type) for file_type in ('pdf', 'csv')
+        }
+    
+    async def ingest_document(
+        self,
+        file_id: str,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        document_id: Optional[str] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Ingest a document: fetch from S3 into memory, extract text, chunk, embed, and store
+        Chunks stream out of extraction in groups, so embedding and upserting start before the
+        last page is parsed and at most a few groups are held in memory at once.
+        The upload becomes the new version of document_id (default: its own file_id): chunks
+        the previous version already stored are skipped and chunks it no longer has are deleted.
+        With a tenant, the chunks are stored in that tenant's namespace and only its queries
+        find them. If given, progress is called with updated counters as each stage advances
+        """
+        document_id = document_id or file_id
+        async with self._document_lock(document_id):
+            return await self._ingest_document(file_id, document_id, progress, tenant)
     
-    async def ingest_document(self, file_id: str) -> Dict[str, Any]:
+    @asynccontextmanager
+    async def _document_lock(self, document_id: str) -> AsyncIterator[None]:
         """
-        Ingest a document: download from S3, extract text, chunk, embed, and store
+        Serialize ingests and deletes of a document; its lock is dropped once nobody holds or
+        waits for it
         """
+        entry = self._document_locks.setdefault(document_id, [asyncio.Lock(), 0])
+        entry[1] += 1
         try:
-            # Download file from S3
-            file_info = await self._download_file(file_id)
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._document_locks[document_id]
+    
+    async def _ingest_document(
+        self,
+        file_id: str,
+        document_id: str,
+        progress: Optional[Callable[[Dict[str, int]], None]],
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        counters = {
+            'pages_parsed': 0,
+            'chunks_total': 0,
+            'chunks_unchanged': 0,
+            'chunks_embedded': 0,
+            'vectors_upserted': 0
+        }
+        
+        def report(**updates):
+            counters.update(updates)
+            if progress:
+                progress(dict(counters))
+        
+        document = None
+        version = None
+        inflight = set()
+        try:
+            # Fetch file from S3
+            with stage(PIPELINE_INGEST, 'download'):
+                file_info = await self._download_file(file_id)
             filename = file_info['filename']
-            file_path = file_info['local_path']
+            document = file_info['document']
             file_type = file_info['file_type']
             
             # Extract text based on file type
-            if file_type == 'pdf':
-                chunks = await self._extract_pdf_text(file_path, filename)
-            elif file_type == 'csv':
-                chunks = await self._extract_csv_text(file_path, filename)
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
-            
-            # Generate embeddings
-            texts = [chunk['content'] for chunk in chunks]
-            embeddings = await self.openai_service.generate_embeddings(texts)
+            chunks = self.extract_chunks(
+                document, filename, file_type, on_page=lambda pages: report(pages_parsed=pages)
+            )
+            version = await self.begin_document(
+                document_id, file_id, filename, file_type,
+                tenant=tenant, uploaded_at=file_info.get('uploaded_at')
+            )
             
-            # Prepare vectors for Pinecone
-            vector_ids = [f"{file_id}_{i}" for i in range(len(chunks))]
-            metadata_list = [
-                {
-                    'filename': chunk['filename'],
-                    'chunk_id': vector_ids[i],
-                    'file_id': file_id,
-                    'page': chunk.get('page'),
-                    'type': file_type,
-                    'content': chunk['content'][:500]  # Store first 500 chars for display
-                }
-                for i, chunk in enumerate(chunks)
-            ]
+            async def embed_and_store(prepared: Dict[str, Any]):
+                embeddings = await self.embed_group(prepared)
+                report(chunks_embedded=counters['chunks_embedded'] + len(prepared['ids']))
+                
+                await self.upsert_group(prepared, embeddings)
+                report(vectors_upserted=counters['vectors_upserted'] + len(prepared['ids']))
             
-            # Upsert to Pinecone
-            await self.pinecone_service.upsert_vectors(
-                vectors=embeddings,
-                ids=vector_ids,
-                metadata=metadata_list
-            )
+            # Embed/upsert up to max_inflight_groups groups while extraction keeps going
+            chunk_count = 0
+            async for group in self.group_chunks(chunks):
+                prepared = self.prepare_group(version, group)
+                chunk_count += len(group)
+                report(chunks_total=chunk_count, chunks_unchanged=version.unchanged)
+                if not prepared['ids']:
+                    continue
+                while len(inflight) >= self.max_inflight_groups:
+                    done, inflight = await asyncio.wait(
+                        inflight, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+                inflight.add(asyncio.create_task(embed_and_store(prepared)))
+            if inflight:
+                await asyncio.gather(*inflight)
+            if file_type == 'csv':
+                report(pages_parsed=1)
             
-            # Cleanup local file
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            diff = await self.finish_document(version)
             
-            logger.info(f"Ingested {len(chunks)} chunks for file {filename}")
+            logger.info(
+                f"Ingested {chunk_count} chunks for file {filename} "
+                f"({diff['chunks_added']} new, {diff['chunks_removed']} removed)"
+            )
             
             return {
-                'chunks_processed': len(chunks),
+                'chunks_processed': chunk_count,
                 'file_id': file_id,
-                'filename': filename
+                'filename': filename,
+                'document_id': document_id,
+                **diff
             }
         except Exception as e:
+            for task in inflight:
+                task.cancel()
             logger.error(f"Error ingesting document: {e}", exc_info=True)
+            if version is not None:
+                await asyncio.gather(*inflight, return_exceptions=True)
+                await self.abort_document(version)
             raise
+        finally:
+            # Release the download buffer (a spooled temp file is deleted on close)
+            if document is not None and not isinstance(document, str):
+                document.close()
+    
+    def extract_chunks(
+        self,
+        document: Union[str, IO[bytes]],
+        filename: str,
+        file_type: str,
+        on_page: Optional[Callable[[int], None]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream chunks out of a PDF or CSV document, given as a local path or an open buffer
+        """
+        if file_type == 'pdf':
+            return self._extract_pdf_text(document, filename, on_page=on_page)
+        if file_type == 'csv':
+            return self._extract_csv_text(document, filename)
+        raise ValueError(f"Unsupported file type: {file_type}")
+    
+    async def begin_document(
+        self,
+        document_id: str,
+        file_id: str,
+        filename: str,
+        file_type: str,
+        tenant: Optional[str] = None,
+        uploaded_at: Optional[int] = None
+    ) -> DocumentVersion:
+        """
+        Start a new version of a document, diffed against the registered one
+        A document stays with the tenant it was first ingested for
+        """
+        previous = {}
+        if self.document_registry is not None:
+            record = await asyncio.to_thread(self.document_registry.get, document_id)
+            if record is not None and record.get('tenant') != tenant:
+                raise ValueError(
+                    f"Document {document_id} belongs to a different tenant; "
+                    f"delete it before ingesting it for another"
+                )
+            previous = await asyncio.to_thread(self.document_registry.get_chunks, document_id)
+            pending = await asyncio.to_thread(self.document_registry.get_pending, document_id)
+            if pending:
+                logger.warning(
+                    f"Removing {len(pending)} chunks left by an unfinished ingest of {document_id}"
+                )
+                await self.discard_pending(document_id, previous, pending)
+        if not previous:
+            # Nothing registered: clear text or keyword entries left by an unfinished attempt
+            if self.sparse_index is not None:
+                await self.sparse_index.remove_file(document_id)
+            if self.chunk_store is not None:
+                await self.chunk_store.remove_file(document_id)
+        return DocumentVersion(
+            document_id, file_id, filename, file_type, previous,
+            tenant=tenant, uploaded_at=uploaded_at
+        )
+    
+    def prepare_group(
+        self,
+        version: DocumentVersion,
+        group: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Vector ids, texts, token counts and metadata for the chunks of a group that the
+        document's previous version doesn't already have
+        """
+        # Metadata holds only filter fields; the text lives in the chunk store
+        ids, texts, token_counts, metadata_list = [], [], [], []
+        for chunk in group:
+            entry = version.add(chunk)
+            if entry is None:
+                continue
+            ids.append(entry['id'])
+            texts.append(chunk['content'])
+            token_counts.append(chunk['tokens'])
+            metadata_list.append(entry['metadata'])
+        if self.chunk_store is None:
+            for metadata, text in zip(metadata_list, texts):
+                metadata['content'] = text[:500]  # Store first 500 chars for display
+        return {
+            'document_id': version.document_id,
+            'tenant': version.tenant,
+            'ids': ids,
+            'texts': texts,
+            'token_counts': token_counts,
+            'metadata': metadata_list
+        }
+    
+    async def embed_group(self, prepared: Dict[str, Any]) -> List[List[float]]:
+        """
+        Generate embeddings for a prepared group while its text is stored and keyword-indexed
+        """
+        if not prepared['ids']:
+            return []
+        document_id = prepared['document_id']
+        if self.document_registry is not None:
+            # Recorded before anything is stored, so a failed ingest can't leave orphans
+            await asyncio.to_thread(
+                self.document_registry.add_pending,
+                document_id, prepared['ids'], prepared['tenant']
+            )
+        side_tasks = []
+        if self.chunk_store is not None:
+            side_tasks.append(self.chunk_store.put_many(
+                document_id, dict(zip(prepared['ids'], prepared['texts']))
+            ))
+        if self.sparse_index is not None:
+            side_tasks.append(self.sparse_index.add_chunks(
+                document_id, prepared['ids'], prepared['texts'], prepared['metadata']
+            ))
+        with stage(PIPELINE_INGEST, 'embed'):
+            embeddings, *_ = await asyncio.gather(
+                self.openai_service.generate_embeddings(
+                    prepared['texts'], token_counts=prepared['token_counts']
+                ),
+                *side_tasks
+            )
+        return embeddings
+    
+    async def upsert_group(self, prepared: Dict[str, Any], embeddings: List[List[float]]):
+        """
+        Upsert a prepared group's embeddings to the vector store
+        """
+        if not prepared['ids']:
+            return
+        with stage(PIPELINE_INGEST, 'upsert'):
+            await self.vector_store.upsert_vectors(
+                vectors=embeddings,
+                ids=prepared['ids'],
+                metadata=prepared['metadata'],
+                namespace=prepared['tenant']
+            )
+    
+    async def finish_document(self, version: DocumentVersion) -> Dict[str, int]:
+        """
+        Once every new chunk is stored, point the kept chunks at the new version, delete the
+        chunks it dropped and record it as the document's current version
+        """
+        removed = version.removed()
+        with stage(PIPELINE_INGEST, 'finish'):
+            if version.kept:
+                fields = version.refreshed_fields()
+                tasks = [self.vector_store.update_metadata(
+                    version.kept, fields, namespace=version.tenant
+                )]
+                if self.sparse_index is not None:
+                    tasks.append(self.sparse_index.update_metadata(version.kept, fields))
+                await asyncio.gather(*tasks)
+            if removed:
+                await self.remove_chunks(removed, version.tenant)
+            if self.document_registry is not None:
+                await asyncio.to_thread(self.document_registry.replace, version)
+        
+        # Cached answers may no longer reflect the index
+        if self.query_cache is not None:
+            await asyncio.to_thread(self.query_cache.invalidate, version.document_id)
+        return {
+            'chunks_added': len(version.chunks) - version.unchanged,
+            'chunks_unchanged': version.unchanged,
+            'chunks_removed': len(removed)
+        }
+    
+    async def abort_document(self, version: DocumentVersion):
+        """
+        Delete what a failed ingest stored for chunks the registered version doesn't have
+        If that fails too, the next ingest of the document deletes them
+        """
+        if self.document_registry is None:
+            return
+        try:
+            pending = await asyncio.to_thread(
+                self.document_registry.get_pending, version.document_id
+            )
+            await self.discard_pending(version.document_id, version.previous, pending)
+        except Exception as e:
+            logger.error(f"Error removing chunks of failed ingest of {version.document_id}: {e}")
+    
+    async def discard_pending(
+        self,
+        document_id: str,
+        previous: Dict[str, str],
+        pending: Dict[str, Optional[str]]
+    ):
+        """
+        Delete the pending chunks (chunk_id -> tenant) an unfinished ingest stored, except those
+        the registered version still uses, and forget them
+        """
+        orphans = defaultdict(list)
+        for chunk_id, tenant in pending.items():
+            if chunk_id not in previous:
+                orphans[tenant].append(chunk_id)
+        for tenant, chunk_ids in orphans.items():
+            await self.remove_chunks(chunk_ids, tenant)
+        await asyncio.to_thread(self.document_registry.clear_pending, document_id)
+    
+    async def remove_chunks(self, chunk_ids: List[str], tenant: Optional[str] = None):
+        """
+        Delete chunks from the vector store (in the tenant's namespace), chunk store and
+        keyword index
+        """
+        tasks = [self.vector_store.delete_vectors(chunk_ids, namespace=tenant)]
+        if self.chunk_store is not None:
+            tasks.append(self.chunk_store.remove_chunks(chunk_ids))
+        if self.sparse_index is not None:
+            tasks.append(self.sparse_index.remove_chunks(chunk_ids))
+        await asyncio.gather(*tasks)
+    
+    async def delete_document(self, document_id: str) -> Dict[str, Any]:
+        """
+        Remove every chunk of a registered document from the index
+        """
+        if self.document_registry is None:
+            raise FileNotFoundError(f"Document not found: {document_id}")
+        async with self._document_lock(document_id):
+            record = await asyncio.to_thread(self.document_registry.get, document_id)
+            if record is None:
+                raise FileNotFoundError(f"Document not found: {document_id}")
+            chunks = await asyncio.to_thread(self.document_registry.get_chunks, document_id)
+            pending = await asyncio.to_thread(self.document_registry.get_pending, document_id)
+            if pending:
+                await self.discard_pending(document_id, chunks, pending)
+            chunk_ids = list(chunks)
+            if chunk_ids:
+                await self.remove_chunks(chunk_ids, record.get('tenant'))
+            await asyncio.to_thread(self.document_registry.delete, document_id)
+            if self.query_cache is not None:
+                await asyncio.to_thread(self.query_cache.invalidate, document_id)
+            logger.info(f"Deleted document {document_id} ({len(chunk_ids)} chunks)")
+            return {'document_id': document_id, 'chunks_deleted': len(chunk_ids)}
+    
+    async def group_chunks(
+        self,
+        chunks: AsyncIterator[Dict[str, Any]]
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Collect streamed chunks into groups of chunk_group_size
+        """
+        group = []
+        async for chunk in chunks:
+            group.append(chunk)
+            if len(group) >= self.chunk_group_size:
+                yield group
+                group = []
+        if group:
+            yield group
     
     async def _download_file(self, file_id: str) -> Dict[str, Any]:
         """
-        Download file from S3 to local temporary storage
+        Download file from S3 into a buffer
+        The key comes from the upload registry; uploads made before it existed are found by
+        listing their prefix
         """
         try:
-            # List objects with prefix to find the file
-            response = s3_client.list_objects_v2(
-                Bucket=S3_BUCKET,
-                Prefix=f"documents/{file_id}/"
+            record = (
+                await asyncio.to_thread(self.upload_registry.get, file_id)
+                if self.upload_registry else None
             )
-            
-            if 'Contents' not in response or len(response['Contents']) == 0:
-                raise FileNotFoundError(f"File not found in S3: {file_id}")
-            
-            # Get the first file (should be only one)
-            s3_key = response['Contents'][0]['Key']
+            if record:
+                s3_key = record['s3_key']
+                size = record['size']
+                uploaded = datetime.fromisoformat(record['created_at'])
+            else:
+                # List objects with prefix to find the file
+                response = await self.s3_service.list_objects(f"documents/{file_id}/")
+                
+                if 'Contents' not in response or len(response['Contents']) == 0:
+                    raise FileNotFoundError(f"File not found in S3: {file_id}")
+                
+                # Get the first file (should be only one)
+                s3_key = response['Contents'][0]['Key']
+                size = response['Contents'][0].get('Size')
+                uploaded = response['Contents'][0].get('LastModified')
             filename = os.path.basename(s3_key)
             
-            # Download to temporary location
-            local_path = f"/tmp/{file_id}_{filename}"
-            s3_client.download_file(S3_BUCKET, s3_key, local_path)
+            document = await self.s3_service.open_object(s3_key, size=size)
             
             # Get file type
             file_type = filename.split('.')[-1].lower()
             
             return {
                 'filename': filename,
-                'local_path': local_path,
+                'document': document,
                 'file_type': file_type,
-                's3_key': s3_key
+                's3_key': s3_key,
+                # Unix time, so upload date ranges can be filtered on
+                'uploaded_at': int(uploaded.timestamp()) if uploaded else None
             }
         except Exception as e:
             logger.error(f"Error downloading file from S3: {e}")
             raise
     
-    async def _extract_pdf_text(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
+    async def _extract_pdf_text(
+        self,
+        document: Union[str, IO[bytes]],
+        filename: str,
+        on_page: Optional[Callable[[int], None]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Extract text from PDF and chunk it
+        Extract text from PDF and chunk it, yielding chunks as pages finish extracting
+        on_page is called with the number of pages parsed so far
         """
         try:
-            reader = PdfReader(file_path)
-            chunks = []
-            
-            for page_num, page in enumerate(reader.pages):
-                text = page.extract_text()
+            async for page_num, text in self.pdf_extractor.iter_pages(document):
+                if on_page:
+                    on_page(page_num)
                 if not text.strip():
                     continue
                 
                 # Chunk the text
-                page_chunks = self._chunk_text(text, filename, page_num + 1)
-                chunks.extend(page_chunks)
-            
-            return chunks
+                with stage(PIPELINE_INGEST, 'chunk'):
+                    page_chunks = await self.cpu_executor.run(
+                        self._chunk_text, text, filename, page_num, 'pdf'
+                    )
+                for chunk in page_chunks:
+                    yield chunk
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
             raise
     
-    async def _extract_csv_text(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
+    async def _extract_csv_text(
+        self,
+        document: Union[str, IO[bytes]],
+        filename: str
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
         Extract text from CSV and chunk it
+        The file is read in row batches and formatted column-wise; rows are packed into
+        token-bounded chunks directly, so a chunk never splits a row
         """
         try:
-            df = pd.read_csv(file_path)
-            
-            # Convert DataFrame to text representation
-            text_parts = []
-            for idx, row in df.iterrows():
-                row_text = f"Row {idx + 1}:\n"
-                for col, val in row.items():
-                    row_text += f"{col}: {val}\n"
-                text_parts.append(row_text)
-            
-            full_text = "\n\n".join(text_parts)
-            chunks = self._chunk_text(full_text, filename)
-            
-            return chunks
+            reader = await self.cpu_executor.run(
+                pd.read_csv, document, chunksize=self.csv_read_chunksize
+            )
+            try:
+                pending = []
+                while True:
+                    with stage(PIPELINE_INGEST, 'parse'):
+                        frame = await self.cpu_executor.run(next, reader, None)
+                    if frame is None:
+                        break
+                    with stage(PIPELINE_INGEST, 'chunk'):
+                        chunks, pending = await self.cpu_executor.run(
+                            self._pack_csv_rows, frame, filename, pending
+                        )
+                    for chunk in chunks:
+                        yield chunk
+                if pending:
+                    yield self._make_csv_chunk(pending, filename)
+            finally:
+                reader.close()
         except Exception as e:
             logger.error(f"Error extracting CSV text: {e}")
             raise
     
-    def _chunk_text(self, text: str, filename: str, page: int = None) -> List[Dict[str, Any]]:
+    def _format_csv_rows(self, frame: pd.DataFrame) -> pd.Series:
+        """
+        Render each row as "Row n:" followed by one "column: value" line per column
+        """
+        text = "Row " + pd.Series(frame.index + 1, index=frame.index).astype(str) + ":\n"
+        for column in frame.columns:
+            text = text + f"{column}: " + frame[column].astype(str) + "\n"
+        return text
+    
+    def _pack_csv_rows(
+        self,
+        frame: pd.DataFrame,
+        filename: str,
+        pending: List[tuple]
+    ) -> tuple:
         """
-        Chunk text into smaller pieces with overlap
+        Pack formatted rows into chunks of at most the CSV chunk size (blocking, CPU pool)
+        pending carries (row number, text, tokens) rows left over from the previous batch;
+        returns the finished chunks and the rows still pending
         """
-        # Tokenize text
-        tokens = encoding.encode(text)
+        texts = self._format_csv_rows(frame).tolist()
+        token_counts = [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+        row_numbers = (frame.index + 1).tolist()
+        chunk_size = self.chunkers['csv'].chunk_size
         
         chunks = []
-        start = 0
-        
-        while start < len(tokens):
-            # Get chunk
-            end = min(start + self.chunk_size, len(tokens))
-            chunk_tokens = tokens[start:end]
-            chunk_text = encoding.decode(chunk_tokens)
-            
-            chunks.append({
-                'content': chunk_text,
-                'filename': filename,
-                'page': page
-            })
-            
-            # Move start position with overlap
-            start = end - self.chunk_overlap
-        
-        return chunks
+        pending = list(pending)
+        pending_tokens = sum(row[2] + 1 for row in pending)
+        for row_number, text, tokens in zip(row_numbers, texts, token_counts):
+            if tokens > chunk_size:
+                # A single oversized row gets split on its own, between columns where possible
+                if pending:
+                    chunks.append(self._make_csv_chunk(pending, filename))
+                    pending, pending_tokens = [], 0
+                for chunk in self._chunk_text(text, filename, file_type='csv'):
+                    chunk.update(row_start=row_number, row_end=row_number)
+                    chunks.append(chunk)
+                continue
+            if pending and pending_tokens + tokens > chunk_size:
+                chunks.append(self._make_csv_chunk(pending, filename))
+                pending, pending_tokens = [], 0
+            pending.append((row_number, text, tokens))
+            pending_tokens += tokens + 1  # +1 for the blank line between rows
+        return chunks, pending
+    
+    def _make_csv_chunk(self, rows: List[tuple], filename: str) -> Dict[str, Any]:
+        return {
+            'content': "\n".join(row[1] for row in rows),
+            'filename': filename,
+            'page': None,
+            'tokens': sum(row[2] for row in rows) + len(rows) - 1,
+            'row_start': rows[0][0],
+            'row_end': rows[-1][0]
+        }
+    
+    def close(self):
+        self.cpu_executor.shutdown(wait=False)
+        self.pdf_extractor.close()
+    
+    def _chunk_text(
+        self,
+        text: str,
+        filename: str,
+        page: Optional[int] = None,
+        file_type: str = 'pdf'
+    ) -> List[Dict[str, Any]]:
+        """
+        Chunk text at paragraph, line or sentence breaks (blocking, CPU pool)
+        """
+        return [
+            {'content': content, 'filename': filename, 'page': page, 'tokens': tokens}
+            for content, tokens in self.chunkers[file_type].split(text)
+        ]
 
@@ -0,0 +1,325 @@
+"""
+Ingestion Job Queue - runs document ingestion in the background with bounded concurrency
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from services.ingestion_service import IngestionService
+from services.local_db import connect, data_path
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """
+    SQLite-backed record of ingestion jobs and their progress
+    Survives restarts so unfinished jobs can be resumed. Each unfinished job is leased to the
+    queue that owns it, which renews the lease with heartbeats; a job whose lease lapsed (its
+    process died) can be claimed by another queue.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('INGEST_JOB_DB', data_path('ingest_jobs.db'))
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_file ON ingest_jobs (file_id, status)"
+        )
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(ingest_jobs)")}
+        if 'document_id' not in columns:
+            self._conn.execute("ALTER TABLE ingest_jobs ADD COLUMN document_id TEXT")
+        if 'tenant' not in columns:
+            self._conn.execute("ALTER TABLE ingest_jobs ADD COLUMN tenant TEXT")
+        if 'worker_id' not in columns:
+            self._conn.execute("ALTER TABLE ingest_jobs ADD COLUMN worker_id TEXT")
+        if 'heartbeat_at' not in columns:
+            self._conn.execute("ALTER TABLE ingest_jobs ADD COLUMN heartbeat_at REAL")
+    
+    def create(
+        self,
+        file_id: str,
+        document_id: Optional[str] = None,
+        tenant: Optional[str] = None,
+        worker_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        now = _now()
+        progress = {
+            'pages_parsed': 0,
+            'chunks_total': 0,
+            'chunks_unchanged': 0,
+            'chunks_embedded': 0,
+            'vectors_upserted': 0
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_jobs (job_id, file_id, status, progress, created_at, "
+                "updated_at, document_id, tenant, worker_id, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, file_id, JOB_QUEUED, json.dumps(progress), now, now, document_id,
+                    tenant, worker_id, time.time()
+                )
+            )
+        return self.get(job_id)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def find_active(
+        self,
+        file_id: str,
+        document_id: Optional[str] = None,
+        tenant: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the queued or running job ingesting a file as the same document for the same
+        tenant, if any (a document_id left out is the file_id, as in ingestion)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM ingest_jobs WHERE file_id = ? "
+                "AND COALESCE(document_id, file_id) = ? AND tenant IS ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (file_id, document_id or file_id, tenant, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def claim_expired(self, worker_id: str, lease: float) -> List[Dict[str, Any]]:
+        """
+        Take over unfinished jobs whose owner stopped renewing its lease (or that predate
+        leases), re-queued under worker_id
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE ingest_jobs SET worker_id = ?, heartbeat_at = ?, status = ?, "
+                "updated_at = ? WHERE status IN (?, ?) "
+                "AND (worker_id IS NULL OR heartbeat_at IS NULL OR heartbeat_at < ?) RETURNING *",
+                (worker_id, now, JOB_QUEUED, _now(), JOB_QUEUED, JOB_RUNNING, now - lease)
+            ).fetchall()
+        return sorted((self._to_dict(row) for row in rows), key=lambda job: job['created_at'])
+    
+    def claim(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark a job running if worker_id still holds its lease
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, heartbeat_at = ?, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ? AND status IN (?, ?) RETURNING *",
+                (JOB_RUNNING, time.time(), _now(), job_id, worker_id, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def heartbeat(self, worker_id: str):
+        """
+        Renew the lease on every unfinished job worker_id owns
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET heartbeat_at = ? WHERE worker_id = ? AND status IN (?, ?)",
+                (time.time(), worker_id, JOB_QUEUED, JOB_RUNNING)
+            )
+    
+    def update(
+        self,
+        job_id: str,
+        status: Optional[str] = None,
+        progress: Optional[Dict[str, int]] = None,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ):
+        fields = {'updated_at': _now()}
+        if status is not None:
+            fields['status'] = status
+        if progress is not None:
+            fields['progress'] = json.dumps(progress)
+        if result is not None:
+            fields['result'] = json.dumps(result)
+        if error is not None:
+            fields['error'] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+    
+    @staticmethod
+    def _to_dict(row) -> Dict[str, Any]:
+        job = dict(row)
+        job['progress'] = json.loads(job['progress'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+
+class IngestionJobQueue:
+    """
+    In-process job queue: POST /ingest enqueues, a fixed pool of workers runs the pipeline
+    Several processes can share one job store: each queue holds a lease on the jobs it queued,
+    renewed every lease / 3 seconds, and takes over jobs whose lease lapsed
+    """
+    
+    def __init__(self, ingestion_service: IngestionService, store: Optional[JobStore] = None):
+        self.ingestion_service = ingestion_service
+        self.store = store or JobStore()
+        self.num_workers = int(os.getenv('INGEST_WORKERS', '2'))
+        self.lease = float(os.getenv('INGEST_JOB_LEASE', '60'))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+    
+    async def start(self):
+        """
+        Start the worker pool and resume jobs left unfinished by a process that is gone
+        Jobs another live process owns are left to it
+        """
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        await self._claim_expired()
+        self._workers.append(asyncio.create_task(self._heartbeat(), name="ingest-heartbeat"))
+        logger.info(f"Ingestion job queue started with {self.num_workers} workers")
+    
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.store.close()
+    
+    async def _claim_expired(self):
+        jobs = await asyncio.to_thread(self.store.claim_expired, self.worker_id, self.lease)
+        for job in jobs:
+            logger.info(f"Resuming ingestion job {job['job_id']} for file {job['file_id']}")
+            self._queue.put_nowait(job['job_id'])
+    
+    async def _heartbeat(self):
+        """
+        Renew this queue's leases, and pick up jobs of processes that died since start
+        """
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.worker_id)
+                await self._claim_expired()
+            except Exception as e:
+                logger.error(f"Ingestion job heartbeat failed: {e}")
+    
+    async def enqueue(
+        self,
+        file_id: str,
+        document_id: Optional[str] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a file for ingestion, as a new version of document_id if given and for a tenant's
+        namespace if given, and return its job
+        A retry while the same request is still queued or running returns the existing job; the
+        same file queued as another document or for another tenant gets a job of its own
+        """
+        await self.start()
+        active = await asyncio.to_thread(self.store.find_active, file_id, document_id, tenant)
+        if active:
+            return active
+        job = await asyncio.to_thread(
+            self.store.create, file_id, document_id, tenant, self.worker_id
+        )
+        self._queue.put_nowait(job['job_id'])
+        logger.info(f"Queued ingestion job {job['job_id']} for file {file_id}")
+        return job
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+    
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Ingestion worker {worker_id} failed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: str):
+        # Skipped if finished, or taken over by another queue while this one stopped heartbeating
+        job = await asyncio.to_thread(self.store.claim, job_id, self.worker_id)
+        if not job:
+            return
+        
+        # Progress is written off the event loop by one task at a time; reports arriving while
+        # a write is in flight are coalesced into the next write, so the latest counters land last
+        pending: Dict[str, Dict[str, int]] = {}
+        writer: Optional[asyncio.Task] = None
+        
+        async def write_progress():
+            while pending:
+                await asyncio.to_thread(
+                    self.store.update, job_id, progress=pending.pop('progress')
+                )
+        
+        def report(progress: Dict[str, int]):
+            nonlocal writer
+            pending['progress'] = progress
+            if writer is None or writer.done():
+                writer = asyncio.create_task(write_progress())
+        
+        try:
+            try:
+                result = await self.ingestion_service.ingest_document(
+                    job['file_id'], progress=report, document_id=job['document_id'],
+                    tenant=job['tenant']
+                )
+            finally:
+                if writer is not None:
+                    await writer
+            await asyncio.to_thread(self.store.update, job_id, status=JOB_COMPLETED, result=result)
+            logger.info(f"Ingestion job {job_id} completed")
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            await asyncio.to_thread(self.store.update, job_id, status=JOB_FAILED, error=str(e))
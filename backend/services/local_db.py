@@ -0,0 +1,32 @@
+"""
+Local storage helpers - SQLite files under the backend data directory
+"""
+
+import os
+import sqlite3
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.getenv('RAGLEDGER_DATA_DIR', os.path.join(BACKEND_DIR, 'data'))
+
+
+def data_path(filename: str) -> str:
+    """
+    Resolve a file inside the data directory, creating the directory if needed
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite connection shareable across threads (callers serialize access with a lock)
+    WAL mode lets readers proceed while a writer commits
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
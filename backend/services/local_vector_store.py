@@ -0,0 +1,929 @@
+"""
+Local Vector Store - in-cluster vector index on memory-mapped float32 matrices
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from services.concurrency import BoundedExecutor
+from services.local_db import connect, data_path
+from services.metrics import VECTORS_UPSERTED
+from services.vector_store import TENANT_FIELD, Vectors, VectorStore
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# Rows scored per matrix product when assigning vectors to IVF clusters
+_ASSIGN_BLOCK = 8192
+# Rows decoded at a time when scoring quantized codes
+_SCORE_BLOCK = 8192
+_SQL_BATCH = 500
+# Row masks of recently used filters; rows are never rewritten, so a mask only grows
+_FILTER_CACHE_SIZE = 32
+# Tenant column value of rows without a tenant
+_NO_TENANT = -1
+# Tombstoned rows tolerated before compaction, however small the store
+_COMPACT_MIN_DEAD = 1024
+# Matrix, code and scale files, named by the compaction generation they belong to
+_ROW_FILE = re.compile(r'^(?:vectors|scales)(?:-(\d+))?\.')
+
+QUANTIZATION_NONE = 'none'
+QUANTIZATION_INT8 = 'int8'
+QUANTIZATION_BINARY = 'binary'
+# Set bits of each byte value, for Hamming distances between packed sign bits
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_M1, _M2, _M4, _H01 = (
+    np.uint64(0x5555555555555555), np.uint64(0x3333333333333333),
+    np.uint64(0x0F0F0F0F0F0F0F0F), np.uint64(0x0101010101010101)
+)
+
+
+def hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """
+    Bits that differ between each row of packed codes and the packed query
+    Rows that are a whole number of 64-bit words are counted a word at a time
+    """
+    if codes.shape[1] % 8:
+        return _POPCOUNT[codes ^ query_bits].sum(axis=1)
+    x = np.ascontiguousarray(codes).view(np.uint64) ^ query_bits.view(np.uint64)
+    x = x - ((x >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).sum(axis=1)
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Compress L2-normalized vectors: int8 codes with a per-row scale (4x smaller than float32),
+    or packed sign bits with no scale (32x smaller)
+    """
+    if mode == QUANTIZATION_INT8:
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return np.packbits(vectors > 0, axis=1), None
+
+
+def _compare(op):
+    def compare(value, operand):
+        try:
+            return value is not None and op(value, operand)
+        except TypeError:
+            return False
+    return compare
+
+
+_OPERATORS = {
+    '$eq': lambda value, operand: (
+        operand in value if isinstance(value, list) else value == operand
+    ),
+    '$ne': lambda value, operand: (
+        operand not in value if isinstance(value, list) else value != operand
+    ),
+    '$in': lambda value, operand: (
+        any(item in operand for item in value) if isinstance(value, list) else value in operand
+    ),
+    '$nin': lambda value, operand: (
+        not any(item in operand for item in value)
+        if isinstance(value, list) else value not in operand
+    ),
+    '$gt': _compare(lambda value, operand: value > operand),
+    '$gte': _compare(lambda value, operand: value >= operand),
+    '$lt': _compare(lambda value, operand: value < operand),
+    '$lte': _compare(lambda value, operand: value <= operand),
+}
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """
+    Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $gt(e), $lt(e), $exists,
+    $and, $or; a bare value means $eq) against one vector's metadata
+    """
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key, _MISSING)
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for op, operand in condition.items():
+                if op == '$exists':
+                    matched = (value is not _MISSING) == operand
+                elif op not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                elif value is _MISSING:
+                    # A missing field is never equal to anything
+                    matched = op in ('$ne', '$nin')
+                else:
+                    matched = _OPERATORS[op](value, operand)
+                if not matched:
+                    return False
+    return True
+
+
+class _Column:
+    """
+    Per-row array with spare capacity
+    Appends write past the rows published so far, so a view a query took earlier never changes;
+    the buffer doubles when it fills
+    """
+    
+    def __init__(self, values: np.ndarray):
+        self._buffer = values
+        self.values = values
+    
+    def append(self, values: np.ndarray):
+        size = len(self.values)
+        end = size + len(values)
+        if end > len(self._buffer):
+            buffer = np.empty(max(1024, 2 * len(self._buffer), end), dtype=self._buffer.dtype)
+            buffer[:size] = self.values
+            self._buffer = buffer
+        self._buffer[size:end] = values
+        self.values = self._buffer[:end]
+    
+    def replace(self, values: np.ndarray):
+        self._buffer = self.values = values
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector index kept on local disk
+    Vectors are stored L2-normalized in a memory-mapped float32 matrix, so cosine similarity is
+    a dot product; ids and metadata live in SQLite. Once the collection reaches ivf_min_vectors,
+    an IVF index (spherical k-means centroids) limits each search to the nprobe closest
+    clusters. Smaller collections, and searches the probed clusters can't satisfy, use an exact
+    scan. A filtered search only scores the rows whose metadata matches; the matching rows are
+    cached per filter, so repeated tenant or document scopes skip the metadata pass.
+    There are no namespaces: a namespace is the chunks' tenant metadata field.
+    With quantization (int8 or binary), searches score compact codes of the vectors instead
+    and rescore the best top_k * rescore_factor at full precision from the float32 matrix, so
+    only the codes and a few float rows are read per query.
+    Updated and deleted vectors leave tombstoned rows behind; once they pass compact_ratio of
+    the rows, the live rows are rewritten into new files.
+    """
+    
+    name = 'local'
+    
+    def __init__(self, path: Optional[str] = None, quantization: Optional[str] = None):
+        self.path = path or os.getenv('LOCAL_VECTOR_DIR', data_path('vectors'))
+        os.makedirs(self.path, exist_ok=True)
+        self.nprobe = int(os.getenv('LOCAL_VECTOR_NPROBE', '8'))
+        self.ivf_min_vectors = int(os.getenv('LOCAL_VECTOR_IVF_MIN', '20000'))
+        self.quantization = (
+            quantization or os.getenv('LOCAL_VECTOR_QUANTIZATION', QUANTIZATION_NONE)
+        ).lower()
+        if self.quantization not in (QUANTIZATION_NONE, QUANTIZATION_INT8, QUANTIZATION_BINARY):
+            raise ValueError(f"Unknown LOCAL_VECTOR_QUANTIZATION: {self.quantization}")
+        self.rescore_factor = int(os.getenv('LOCAL_VECTOR_RESCORE_FACTOR', '8'))
+        self.executor = BoundedExecutor(
+            'local-vectors', int(os.getenv('LOCAL_VECTOR_MAX_CONCURRENCY', '4'))
+        )
+        self.compact_ratio = float(os.getenv('LOCAL_VECTOR_COMPACT_RATIO', '0.3'))
+        # Writers (upserts, deletes, compaction, swapping in a trained index) hold _write_lock
+        # for their whole run; _lock is only held to publish their result or snapshot it for a
+        # query, so queries never wait on a write
+        self._write_lock = threading.RLock()
+        self._lock = threading.RLock()
+        self._training = False
+        self._filter_masks: "OrderedDict[str, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._centroids_path = os.path.join(self.path, 'centroids.npy')
+        self._conn = connect(os.path.join(self.path, 'metadata.db'))
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                metadata TEXT NOT NULL,
+                cluster INTEGER NOT NULL DEFAULT -1,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._load()
+    
+    def _load(self):
+        state = dict(self._conn.execute("SELECT key, value FROM state").fetchall())
+        self.dimension = int(state['dimension']) if 'dimension' in state else None
+        self._trained_count = int(state.get('trained_count', 0))
+        self._generation = int(state.get('generation', 0))
+        self._matrix_path, self._codes_path, self._scales_path = self._paths(self._generation)
+        self._remove_stale_files()
+        
+        rows = self._conn.execute(
+            "SELECT row, id, metadata, cluster, deleted FROM vectors ORDER BY row"
+        ).fetchall()
+        self.count = rows[-1]['row'] + 1 if rows else 0
+        self._ids: List[Optional[str]] = [None] * self.count
+        self._metadata: List[Optional[Dict[str, Any]]] = [None] * self.count
+        clusters = np.full(self.count, -1, dtype=np.int32)
+        alive = np.zeros(self.count, dtype=bool)
+        self._rows: Dict[str, int] = {}
+        for row in rows:
+            self._ids[row['row']] = row['id']
+            self._metadata[row['row']] = json.loads(row['metadata'])
+            clusters[row['row']] = row['cluster']
+            alive[row['row']] = not row['deleted']
+            self._rows[row['id']] = row['row']
+        self._clusters = _Column(clusters)
+        self._alive = _Column(alive)
+        self._live = int(alive.sum())
+        # Each row's tenant as a small integer, so scoping a query to a tenant is one comparison
+        self._tenant_codes: Dict[str, int] = {}
+        self._tenants = _Column(self._tenant_column(self._metadata))
+        
+        self._matrix = None
+        if self.dimension is not None and os.path.exists(self._matrix_path):
+            capacity = os.path.getsize(self._matrix_path) // (self.dimension * 4)
+            self._matrix = np.memmap(
+                self._matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension)
+            )
+        self._centroids = (
+            np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+        )
+        
+        self._codes = self._scales = None
+        if self.quantization == QUANTIZATION_NONE:
+            # Codes left from an earlier quantized run go stale as soon as vectors change
+            self._conn.execute("DELETE FROM state WHERE key = 'quantization'")
+        elif self._matrix is not None:
+            if state.get('quantization') == self.quantization:
+                self._open_codes(len(self._matrix))
+            else:
+                self._build_codes()
+        logger.info(f"Local vector store opened at {self.path} with {self._live} vectors")
+    
+    def _paths(self, generation: int) -> Tuple[str, str, str]:
+        """
+        Matrix, code and scale files of a compaction generation
+        """
+        suffix = f'-{generation}' if generation else ''
+        return (
+            os.path.join(self.path, f'vectors{suffix}.f32'),
+            os.path.join(self.path, f'vectors{suffix}.{self.quantization}'),
+            os.path.join(self.path, f'scales{suffix}.f32')
+        )
+    
+    def _remove_stale_files(self):
+        """
+        Remove files of other generations, left by a compaction that was interrupted
+        """
+        for name in os.listdir(self.path):
+            match = _ROW_FILE.match(name)
+            if match and int(match.group(1) or 0) != self._generation:
+                os.remove(os.path.join(self.path, name))
+    
+    async def upsert_vectors(
+        self,
+        vectors: Vectors,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        namespace: Optional[str] = None
+    ):
+        """
+        Upsert vectors into the local index
+        Ids are unique across namespaces, so the namespace is only recorded in the metadata
+        """
+        try:
+            await self.executor.run(self._upsert, vectors, ids, metadata)
+            VECTORS_UPSERTED.labels(self.name).inc(len(ids))
+            logger.info(f"Upserted {len(ids)} vectors to the local vector store")
+        except Exception as e:
+            logger.error(f"Error upserting vectors: {e}")
+            raise
+    
+    async def update_metadata(
+        self,
+        ids: List[str],
+        fields: Dict[str, Any],
+        namespace: Optional[str] = None
+    ):
+        """
+        Set metadata fields on vectors in the local index
+        Rows are never rewritten, so each vector is upserted again with the merged metadata
+        """
+        try:
+            updated = await self.executor.run(self._update_metadata, ids, fields)
+            logger.info(f"Updated metadata of {updated} vectors in the local vector store")
+        except Exception as e:
+            logger.error(f"Error updating vector metadata: {e}")
+            raise
+    
+    async def delete_vectors(self, ids: List[str], namespace: Optional[str] = None):
+        """
+        Delete vectors from the local index
+        Deleted rows are tombstoned; re-upserting an id writes it to a new row
+        """
+        try:
+            deleted = await self.executor.run(self._delete, ids)
+            logger.info(f"Deleted {deleted} vectors from the local vector store")
+        except Exception as e:
+            logger.error(f"Error deleting vectors: {e}")
+            raise
+    
+    async def query_vectors(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query vectors from the local index
+        Returned values are the stored, L2-normalized vectors
+        """
+        try:
+            return await self.executor.run(
+                self._query, query_vector, top_k, filter, include_values, namespace
+            )
+        except Exception as e:
+            logger.error(f"Error querying vectors: {e}")
+            raise
+    
+    def _upsert(
+        self,
+        vectors: Vectors,
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        vectors = self._normalize(np.array(vectors, dtype=np.float32, ndmin=2))
+        if len(vectors) != len(ids) or len(ids) != len(metadata):
+            raise ValueError("vectors, ids and metadata must have the same length")
+        with self._write_lock:
+            self._write(vectors, ids, metadata)
+            self._maybe_compact()
+        self._maybe_train()
+    
+    def _write(self, vectors: np.ndarray, ids: List[str], metadata: List[Dict[str, Any]]):
+        """
+        Store normalized vectors in new rows, retiring the rows of ids they replace
+        """
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state VALUES ('dimension', ?)", (str(self.dimension),)
+            )
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Vector dimension {vectors.shape[1]} does not match index "
+                f"dimension {self.dimension}"
+            )
+        
+        # Queries score a snapshot of the row arrays outside the locks, so nothing they can see
+        # is written in place: every vector goes to a new row past the snapshot's count, lists
+        # and columns only grow past it, and retiring rows replaces the alive mask
+        latest = {vector_id: i for i, vector_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            keep = sorted(latest.values())
+            vectors = vectors[keep]
+            ids = [ids[i] for i in keep]
+            metadata = [metadata[i] for i in keep]
+        replaced = [
+            self._rows[vector_id] for vector_id in ids
+            if vector_id in self._rows and self._alive.values[self._rows[vector_id]]
+        ]
+        start = self.count
+        self._reserve(start + len(ids))
+        
+        rows = np.arange(start, start + len(ids))
+        self._matrix[rows] = vectors
+        self._matrix.flush()
+        if self._codes is not None:
+            self._write_codes(rows, vectors)
+        clusters = (
+            self._assign(vectors, self._centroids) if self._centroids is not None
+            else np.full(len(rows), -1, dtype=np.int32)
+        )
+        
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "INSERT INTO vectors (row, id, metadata, cluster, deleted) "
+                "VALUES (?, ?, ?, ?, 0) ON CONFLICT(id) DO UPDATE SET row = excluded.row, "
+                "metadata = excluded.metadata, cluster = excluded.cluster, deleted = 0",
+                [
+                    (row, vector_id, json.dumps(meta), int(cluster))
+                    for row, vector_id, meta, cluster
+                    in zip(rows.tolist(), ids, metadata, clusters)
+                ]
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        
+        with self._lock:
+            self._ids.extend(ids)
+            self._metadata.extend(dict(meta) for meta in metadata)
+            self._clusters.append(clusters)
+            self._tenants.append(self._tenant_column(metadata))
+            if replaced:
+                alive = np.concatenate([self._alive.values, np.ones(len(ids), dtype=bool)])
+                alive[replaced] = False
+                self._alive.replace(alive)
+            else:
+                self._alive.append(np.ones(len(ids), dtype=bool))
+            self.count = start + len(ids)
+        for row, vector_id in zip(rows.tolist(), ids):
+            self._rows[vector_id] = row
+        self._live += len(ids) - len(replaced)
+    
+    def _update_metadata(self, ids: List[str], fields: Dict[str, Any]) -> int:
+        with self._write_lock:
+            rows = [self._rows[vector_id] for vector_id in ids if vector_id in self._rows]
+            rows = [row for row in rows if self._alive.values[row]]
+            if not rows:
+                return 0
+            self._write(
+                np.asarray(self._matrix[rows]),
+                [self._ids[row] for row in rows],
+                [{**self._metadata[row], **fields} for row in rows]
+            )
+            self._maybe_compact()
+            return len(rows)
+    
+    def _delete(self, ids: List[str]) -> int:
+        with self._write_lock:
+            rows = [self._rows[vector_id] for vector_id in ids if vector_id in self._rows]
+            rows = [row for row in rows if self._alive.values[row]]
+            if not rows:
+                return 0
+            self._conn.execute("BEGIN")
+            try:
+                for i in range(0, len(rows), _SQL_BATCH):
+                    batch = rows[i:i + _SQL_BATCH]
+                    self._conn.execute(
+                        f"UPDATE vectors SET deleted = 1 "
+                        f"WHERE row IN ({','.join('?' * len(batch))})",
+                        batch
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Replace rather than mutate, so queries holding a snapshot stay consistent
+            alive = self._alive.values.copy()
+            alive[rows] = False
+            with self._lock:
+                self._alive.replace(alive)
+            self._live -= len(rows)
+            self._maybe_compact()
+            return len(rows)
+    
+    def _maybe_compact(self):
+        dead = self.count - self._live
+        if dead >= _COMPACT_MIN_DEAD and dead > self.compact_ratio * self.count:
+            self._compact()
+    
+    def _compact(self):
+        """
+        Rewrite the live rows into the next generation's files, dropping tombstoned rows
+        The new files only become current when the renumbered rows commit, so an interrupted
+        compaction leaves the previous generation intact. Queries holding the old matrix keep
+        reading the old files, which stay mapped after they are removed.
+        """
+        keep = np.flatnonzero(self._alive.values)
+        generation = self._generation + 1
+        paths = self._paths(generation)
+        capacity = max(1024, len(keep))
+        try:
+            matrix = self._copy_rows(paths[0], self._matrix, keep, capacity)
+            codes = scales = None
+            if self._codes is not None:
+                codes = self._copy_rows(paths[1], self._codes, keep, capacity)
+            if self._scales is not None:
+                scales = self._copy_rows(paths[2], self._scales, keep, capacity)
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM vectors WHERE deleted = 1")
+                # In ascending order each row moves down into a slot already vacated
+                self._conn.executemany(
+                    "UPDATE vectors SET row = ? WHERE row = ?",
+                    [(new, old) for new, old in enumerate(keep.tolist()) if new != old]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO state VALUES ('generation', ?)", (str(generation),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        except Exception:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        
+        stale, count = self._paths(self._generation), self.count
+        ids = [self._ids[row] for row in keep.tolist()]
+        with self._lock:
+            self._matrix, self._codes, self._scales = matrix, codes, scales
+            self._ids = ids
+            self._metadata = [self._metadata[row] for row in keep.tolist()]
+            self._clusters = _Column(self._clusters.values[keep])
+            self._tenants = _Column(self._tenants.values[keep])
+            self._alive = _Column(np.ones(len(keep), dtype=bool))
+            self.count = len(keep)
+            self._generation = generation
+            self._filter_masks.clear()
+        self._matrix_path, self._codes_path, self._scales_path = paths
+        self._rows = {vector_id: row for row, vector_id in enumerate(ids)}
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Compacted the local vector store from {count} to {len(keep)} rows")
+    
+    @staticmethod
+    def _copy_rows(path: str, source: np.ndarray, rows: np.ndarray, capacity: int) -> np.memmap:
+        target = np.memmap(
+            path, dtype=source.dtype, mode='w+', shape=(capacity,) + source.shape[1:]
+        )
+        for start in range(0, len(rows), _SCORE_BLOCK):
+            block = rows[start:start + _SCORE_BLOCK]
+            target[start:start + len(block)] = source[block]
+        target.flush()
+        return target
+    
+    def _tenant_column(self, metadata: List[Optional[Dict[str, Any]]]) -> np.ndarray:
+        """
+        Tenant codes of rows with the given metadata, registering tenants seen for the first time
+        """
+        tenants = np.full(len(metadata), _NO_TENANT, dtype=np.int32)
+        for row, meta in enumerate(metadata):
+            tenant = meta.get(TENANT_FIELD) if meta is not None else None
+            if tenant is not None:
+                tenants[row] = self._tenant_codes.setdefault(tenant, len(self._tenant_codes))
+        return tenants
+    
+    def _reserve(self, new_count: int):
+        """
+        Make room for new_count rows, doubling the matrix file when it runs out of rows
+        """
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if new_count <= capacity:
+            return
+        capacity = max(1024, capacity * 2, new_count)
+        with open(self._matrix_path, 'ab') as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._matrix = np.memmap(
+            self._matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension)
+        )
+        if self.quantization != QUANTIZATION_NONE:
+            self._resize_codes(capacity)
+    
+    def _open_codes(self, capacity: int):
+        if self.quantization == QUANTIZATION_INT8:
+            self._codes = np.memmap(
+                self._codes_path, dtype=np.int8, mode='r+', shape=(capacity, self.dimension)
+            )
+            self._scales = np.memmap(
+                self._scales_path, dtype=np.float32, mode='r+', shape=(capacity,)
+            )
+        else:
+            self._codes = np.memmap(
+                self._codes_path, dtype=np.uint8, mode='r+',
+                shape=(capacity, (self.dimension + 7) // 8)
+            )
+    
+    def _resize_codes(self, capacity: int):
+        """
+        Size the code (and scale) files to the matrix's capacity
+        """
+        if self.quantization == QUANTIZATION_INT8:
+            files = [(self._codes_path, self.dimension), (self._scales_path, 4)]
+        else:
+            files = [(self._codes_path, (self.dimension + 7) // 8)]
+        for path, row_bytes in files:
+            with open(path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self._open_codes(capacity)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state VALUES ('quantization', ?)", (self.quantization,)
+        )
+    
+    def _build_codes(self):
+        """
+        Quantize every stored vector, when quantization is first enabled or changes mode
+        """
+        self._resize_codes(len(self._matrix))
+        for start in range(0, self.count, _SCORE_BLOCK):
+            end = min(start + _SCORE_BLOCK, self.count)
+            self._write_codes(np.arange(start, end), np.asarray(self._matrix[start:end]))
+        logger.info(f"Built {self.quantization} codes for {self.count} vectors")
+    
+    def _write_codes(self, rows: np.ndarray, vectors: np.ndarray):
+        codes, scales = quantize(vectors, self.quantization)
+        self._codes[rows] = codes
+        self._codes.flush()
+        if scales is not None:
+            self._scales[rows] = scales
+            self._scales.flush()
+    
+    def _query(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        include_values: bool = False,
+        tenant: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._matrix is None or not self.count:
+                return []
+            # Writers only append past count or replace these arrays, and compaction and
+            # training publish new ones, so the snapshot stays consistent
+            matrix, count, generation = self._matrix, self.count, self._generation
+            alive, clusters, centroids = self._alive.values, self._clusters.values, self._centroids
+            ids, metadata = self._ids, self._metadata
+            codes, scales = self._codes, self._scales
+            tenants = self._tenants.values
+            # A tenant's query sees only its rows; an untenanted query only untenanted rows
+            tenant_code = _NO_TENANT if tenant is None else self._tenant_codes.get(tenant)
+            scoped = tenant is not None or len(self._tenant_codes) > 0
+        query = self._normalize(np.array(query_vector, dtype=np.float32, ndmin=2))[0]
+        values = matrix if include_values else None
+        
+        restricted = scoped or filter is not None
+        if restricted:
+            # Only rows in the tenant's scope that the filter allows are scored
+            if tenant_code is None:
+                return []
+            if scoped:
+                alive = alive & (tenants == tenant_code)
+            if filter is not None:
+                alive = alive & self._filter_mask(filter, metadata, len(alive), generation)
+            matching = int(np.count_nonzero(alive))
+            if not matching:
+                return []
+        
+        # Filters that leave fewer rows than an IVF index is built for are scanned exactly
+        if centroids is not None and (not restricted or matching >= self.ivf_min_vectors):
+            nprobe = min(self.nprobe, len(centroids))
+            probe = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+            candidates = np.flatnonzero(alive & np.isin(clusters, probe))
+            if codes is None:
+                scores = np.asarray(matrix[candidates]) @ query
+                results = self._select(candidates, scores, ids, metadata, top_k, values)
+            else:
+                results = self._search_codes(
+                    matrix, codes, scales, candidates, query, ids, metadata, top_k, values
+                )
+            if len(results) >= top_k:
+                return results
+        
+        # Exact scan; a selective filter scores just its rows, otherwise the filtered-out rows
+        # are masked like deleted ones
+        if restricted and matching < count // 2:
+            rows = np.flatnonzero(alive)
+            if codes is not None:
+                return self._search_codes(
+                    matrix, codes, scales, rows, query, ids, metadata, top_k, values
+                )
+            scores = np.asarray(matrix[rows]) @ query
+            return self._select(rows, scores, ids, metadata, top_k, values)
+        if codes is not None:
+            return self._search_codes(
+                matrix, codes, scales, None, query, ids, metadata, top_k, values, alive
+            )
+        scores = np.asarray(matrix[:count]) @ query
+        scores[~alive] = -np.inf
+        return self._select(np.arange(count), scores, ids, metadata, top_k, values)
+    
+    def _filter_mask(
+        self,
+        filter: Dict[str, Any],
+        metadata: List[Optional[Dict[str, Any]]],
+        count: int,
+        generation: int
+    ) -> np.ndarray:
+        """
+        Which of the first count rows have metadata matching the filter
+        Upserts append rows rather than rewriting them, so a cached mask stays valid for the rows
+        it covers and only rows added since are matched, until compaction renumbers the rows
+        """
+        key = json.dumps(filter, sort_keys=True, default=str)
+        with self._lock:
+            cached = self._filter_masks.get(key)
+            if cached is not None and cached[0] == generation:
+                self._filter_masks.move_to_end(key)
+                cached = cached[1]
+            else:
+                cached = None
+        known = 0 if cached is None else min(len(cached), count)
+        if known == count:
+            return cached[:count]
+        added = np.fromiter(
+            (meta is not None and matches_filter(meta, filter) for meta in metadata[known:count]),
+            dtype=bool, count=count - known
+        )
+        mask = added if cached is None else np.concatenate([cached[:known], added])
+        with self._lock:
+            cached = self._filter_masks.get(key)
+            if generation == self._generation and (
+                cached is None or cached[0] != generation or len(cached[1]) < count
+            ):
+                self._filter_masks[key] = (generation, mask)
+                while len(self._filter_masks) > _FILTER_CACHE_SIZE:
+                    self._filter_masks.popitem(last=False)
+        return mask
+    
+    def _search_codes(
+        self,
+        matrix: np.ndarray,
+        codes: np.ndarray,
+        scales: Optional[np.ndarray],
+        rows: Optional[np.ndarray],
+        query: np.ndarray,
+        ids: List[Optional[str]],
+        metadata: List[Optional[Dict[str, Any]]],
+        top_k: int,
+        values: Optional[np.ndarray],
+        alive: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Shortlist rows by their quantized codes, then rank the shortlist at full precision
+        rows=None scans every row, skipping those not alive
+        """
+        total = len(alive) if rows is None else len(rows)
+        approximate = np.empty(total, dtype=np.float32)
+        query_bits = np.packbits(query > 0)
+        for start in range(0, total, _SCORE_BLOCK):
+            end = min(start + _SCORE_BLOCK, total)
+            # Contiguous scans slice the codes rather than copying them out row by row
+            block = slice(start, end) if rows is None else rows[start:end]
+            if scales is not None:
+                approximate[start:end] = (
+                    (codes[block].astype(np.float32) @ query) * scales[block]
+                )
+            else:
+                # Sign agreement stands in for the angle between the vectors
+                distances = hamming(codes[block], query_bits)
+                approximate[start:end] = 1.0 - 2.0 * distances / len(query)
+        if rows is None:
+            approximate[~alive] = -np.inf
+            rows = np.arange(total)
+        
+        shortlist = rows[self._rank(approximate, top_k * self.rescore_factor)]
+        scores = np.asarray(matrix[shortlist]) @ query
+        return self._select(shortlist, scores, ids, metadata, top_k, values)
+    
+    @staticmethod
+    def _rank(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Positions of the k best scores, best first, leaving out rows scored -inf (not alive)
+        """
+        if not len(scores) or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        k = min(k, len(scores))
+        order = np.argpartition(-scores, k - 1)[:k]
+        order = order[np.argsort(-scores[order])]
+        return order[scores[order] != -np.inf]
+    
+    @classmethod
+    def _select(
+        cls,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        ids: List[Optional[str]],
+        metadata: List[Optional[Dict[str, Any]]],
+        top_k: int,
+        values: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        results = []
+        for i in cls._rank(scores, top_k).tolist():
+            row = int(rows[i])
+            results.append({
+                'id': ids[row],
+                'score': float(scores[i]),
+                'metadata': dict(metadata[row])
+            })
+            if values is not None:
+                results[-1]['values'] = values[row].tolist()
+        return results
+    
+    def _maybe_train(self):
+        """
+        Train the IVF index once enough vectors are stored, and again whenever they double
+        Clustering runs on a snapshot without holding either lock, so queries and writes go on
+        meanwhile; the result is swapped in under the locks
+        """
+        with self._write_lock:
+            if (
+                self._training or self._live < self.ivf_min_vectors
+                or self._live < 2 * self._trained_count
+            ):
+                return
+            self._training = True
+            matrix, count, generation = self._matrix, self.count, self._generation
+            alive_rows = np.flatnonzero(self._alive.values)
+        try:
+            centroids = self._train_ivf(matrix, alive_rows)
+            clusters = self._assign_rows(matrix, 0, count, centroids)
+            with self._write_lock:
+                if self._generation != generation:
+                    # Compaction renumbered the rows; the next upsert trains again
+                    return
+                # Rows written since the snapshot were assigned to the previous centroids
+                clusters = np.concatenate([
+                    clusters, self._assign_rows(self._matrix, count, self.count, centroids)
+                ])
+                alive = self._alive.values
+                clusters[~alive] = -1
+                alive_rows = np.flatnonzero(alive)
+                np.save(self._centroids_path, centroids)
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany(
+                        "UPDATE vectors SET cluster = ? WHERE row = ?",
+                        [(int(clusters[row]), int(row)) for row in alive_rows]
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state VALUES ('trained_count', ?)",
+                        (str(len(alive_rows)),)
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                with self._lock:
+                    self._clusters = _Column(clusters)
+                    self._centroids = centroids
+                self._trained_count = len(alive_rows)
+            logger.info(
+                f"Trained IVF index with {len(centroids)} lists over {len(alive_rows)} vectors"
+            )
+        finally:
+            self._training = False
+    
+    def _train_ivf(self, matrix: np.ndarray, alive_rows: np.ndarray) -> np.ndarray:
+        """
+        Cluster the given rows with spherical k-means
+        """
+        nlist = int(min(4096, max(1, round(math.sqrt(len(alive_rows))))))
+        rng = np.random.default_rng(0)
+        sample_size = min(len(alive_rows), nlist * 32)
+        sample = np.sort(rng.choice(alive_rows, size=sample_size, replace=False))
+        data = np.asarray(matrix[sample])
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(10):
+            assignment = self._assign(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = self._normalize(sums)
+        return centroids
+    
+    @classmethod
+    def _assign_rows(
+        cls,
+        matrix: np.ndarray,
+        start: int,
+        end: int,
+        centroids: np.ndarray
+    ) -> np.ndarray:
+        clusters = np.empty(end - start, dtype=np.int32)
+        for block in range(start, end, _ASSIGN_BLOCK):
+            stop = min(block + _ASSIGN_BLOCK, end)
+            clusters[block - start:stop - start] = cls._assign(
+                np.asarray(matrix[block:stop]), centroids
+            )
+        return clusters
+    
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        clusters = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _ASSIGN_BLOCK):
+            block = vectors[start:start + _ASSIGN_BLOCK]
+            clusters[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return clusters
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self._write_lock, self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self._codes is not None:
+                self._codes.flush()
+            self._conn.close()
@@ -0,0 +1,166 @@
+"""
+Metrics - Prometheus instrumentation of the query and ingestion pipelines
+"""
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+)
+
+logger = logging.getLogger(__name__)
+
+# Pipelines whose stages are timed
+PIPELINE_QUERY = 'query'
+PIPELINE_INGEST = 'ingest'
+
+_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+STAGE_SECONDS = Histogram(
+    'ragledger_stage_duration_seconds',
+    'Time spent in each stage of the query and ingestion pipelines',
+    ['pipeline', 'stage'],
+    buckets=_LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    'ragledger_stage_errors_total',
+    'Pipeline stages that raised an error',
+    ['pipeline', 'stage']
+)
+OPENAI_TOKENS = Counter(
+    'ragledger_openai_tokens_total',
+    'Tokens sent to (input) and generated by (output) the OpenAI API',
+    ['operation', 'direction']
+)
+CACHE_LOOKUPS = Counter(
+    'ragledger_cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result']
+)
+S3_DOWNLOADED_BYTES = Counter(
+    'ragledger_s3_downloaded_bytes_total',
+    'Bytes downloaded from S3'
+)
+VECTORS_UPSERTED = Counter(
+    'ragledger_vectors_upserted_total',
+    'Vectors written to the vector store',
+    ['backend']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'ragledger_http_request_duration_seconds',
+    'Time until an HTTP response starts (streamed bodies continue after it)',
+    ['method', 'route', 'status'],
+    buckets=_LATENCY_BUCKETS
+)
+
+# Stage durations of the request being handled, for its Server-Timing header
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    'request_timings', default=None
+)
+
+
+@contextmanager
+def stage(pipeline: str, name: str) -> Iterator[None]:
+    """
+    Time a block as a pipeline stage: observed in the stage histogram, counted as an error if
+    it raises, and added to the current request's Server-Timing
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(pipeline, name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(pipeline, name).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Concurrent stages (e.g. the queries of a batch) add up
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def record_cache(cache: str, hits: int, misses: int = 0):
+    if hits:
+        CACHE_LOOKUPS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, 'miss').inc(misses)
+
+
+def record_tokens(operation: str, input_tokens: int = 0, output_tokens: int = 0):
+    if input_tokens:
+        OPENAI_TOKENS.labels(operation, 'input').inc(input_tokens)
+    if output_tokens:
+        OPENAI_TOKENS.labels(operation, 'output').inc(output_tokens)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Exposition of every metric, and its content type
+    With PROMETHEUS_MULTIPROC_DIR set (several worker processes), the workers' metrics are
+    aggregated from that directory
+    """
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _server_timing(timings: Dict[str, float], total: float) -> bytes:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode('latin-1')
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request by route, and, if enabled with
+    SERVER_TIMING_ENABLED, reporting the request's stage durations in a Server-Timing header
+    Streamed responses report the stages finished before their first byte
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.server_timing = os.getenv('SERVER_TIMING_ENABLED', 'false') == 'true'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                elapsed = time.perf_counter() - started
+                route = scope.get('route')
+                HTTP_REQUEST_SECONDS.labels(
+                    scope['method'],
+                    # Route templates, not raw paths, keep the label set small
+                    getattr(route, 'path', 'unmatched'),
+                    str(message['status'])
+                ).observe(elapsed)
+                if self.server_timing:
+                    message = {
+                        **message,
+                        'headers': [
+                            *message.get('headers', []),
+                            (b'server-timing', _server_timing(timings, elapsed))
+                        ]
+                    }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
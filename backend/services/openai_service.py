@@ -3,12 +3,58 @@ OpenAI Service - handles OpenAI API interactions
 """
 
 import os
+import time
+import random
+import asyncio
 import logging
-from openai import OpenAI
-from typing import List
+import httpx
+import tiktoken
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError
+)
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from services.embedding_cache import EmbeddingCache
+from services.metrics import record_cache, record_tokens
 
 logger = logging.getLogger(__name__)
 
+# Tokenizer used by the embedding models, for batching by token count
+encoding = tiktoken.get_encoding("cl100k_base")
+
+EMBED_MIN_BACKOFF = 0.5  # seconds
+EMBED_MAX_BACKOFF = 60.0  # seconds
+
+
+def _retry_after(error: Exception) -> float:
+    """
+    Seconds the API asked us to wait, from the Retry-After header if present
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get('retry-after', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Build a pooled keep-alive HTTP client for the OpenAI SDK
+    Pool sizes are configurable so a single worker can reuse TLS connections across requests
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '100')),
+        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20')),
+        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '30'))
+    )
+    timeout = httpx.Timeout(float(os.getenv('OPENAI_TIMEOUT', '60')), connect=5.0)
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
 
 class OpenAIService:
     """
@@ -16,42 +62,182 @@ class OpenAIService:
     Handles embeddings and chat completions
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        embedding_cache: Optional[EmbeddingCache] = None
+    ):
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-        self.client = OpenAI(api_key=api_key)
+        self.http_client = http_client or build_http_client()
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client)
         self.model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
         self.embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-large')
+        # Shortened embeddings (text-embedding-3 models): fewer dimensions, smaller index
+        self.embed_dimensions = int(os.getenv('EMBED_DIMENSIONS', '0')) or None
+        self.embedding_cache = embedding_cache
+        
+        # Caps in-flight API calls so a burst of ingests can't starve queries
+        self.semaphore = asyncio.Semaphore(int(os.getenv('OPENAI_MAX_CONCURRENCY', '32')))
+        
+        # Embedding batcher limits (the API caps inputs per request and total tokens per request)
+        self.embed_batch_max_items = int(os.getenv('EMBED_BATCH_MAX_ITEMS', '2048'))
+        self.embed_batch_max_tokens = int(os.getenv('EMBED_BATCH_MAX_TOKENS', '250000'))
+        self.embed_max_retries = int(os.getenv('EMBED_MAX_RETRIES', '6'))
+        self.embed_semaphore = asyncio.Semaphore(int(os.getenv('EMBED_MAX_CONCURRENCY', '4')))
+        self._embed_backoff = EMBED_MIN_BACKOFF
+        self._embed_resume_at = 0.0
+        # Retries are handled by the batcher's shared backoff, not per request by the SDK
+        self._embed_client = self.client.with_options(max_retries=0)
         
         logger.info(f"OpenAI service initialized with model: {self.model}, embed_model: {self.embed_model}")
     
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    async def close(self):
+        """
+        Close the pooled HTTP connections
+        """
+        await self.http_client.aclose()
+    
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
         """
         Generate embeddings for a list of texts
+        With a cache configured, only texts not embedded before (by normalized content and
+        model) are sent to the API
         """
+        if self.embedding_cache is None or not texts:
+            return await self._embed_texts(texts, token_counts)
+        
         try:
-            response = self.client.embeddings.create(
-                model=self.embed_model,
-                input=texts
-            )
-            return [item.embedding for item in response.data]
+            keys = [
+                EmbeddingCache.make_key(text, self.embed_model, self.embed_dimensions)
+                for text in texts
+            ]
+            cached = await asyncio.to_thread(self.embedding_cache.get_many, keys)
+            
+            # Embed each distinct missing key once, even if it repeats within this call
+            missing = {}
+            for i, key in enumerate(keys):
+                if key not in cached and key not in missing:
+                    missing[key] = i
+            if missing:
+                indexes = list(missing.values())
+                embeddings = await self._embed_texts(
+                    [texts[i] for i in indexes],
+                    [token_counts[i] for i in indexes] if token_counts is not None else None
+                )
+                fresh = dict(zip(missing.keys(), embeddings))
+                await asyncio.to_thread(self.embedding_cache.put_many, fresh)
+                cached.update(fresh)
+            
+            record_cache('embedding', len(texts) - len(missing), len(missing))
+            if len(texts) > 1:
+                logger.info(
+                    f"Embeddings: {len(texts) - len(missing)} of {len(texts)} served from cache"
+                )
+            return [cached[key] for key in keys]
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
     
-    async def generate_answer(self, query: str, context: List[str]) -> str:
+    async def _embed_texts(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
         """
-        Generate an answer using GPT model with retrieved context
+        Embed texts through the API
+        Inputs are split into batches bounded by item count and total tokens, sent concurrently,
+        and returned in input order. Pass token_counts when they are already known (e.g. from
+        chunking) to skip re-tokenizing.
         """
         try:
-            # Construct prompt with context
-            context_text = "\n\n".join([
-                f"[Document {i+1}]\n{ctx}" for i, ctx in enumerate(context)
-            ])
+            if not texts:
+                return []
+            if token_counts is None:
+                token_counts = [len(tokens) for tokens in encoding.encode_batch(texts)]
             
-            prompt = f"""You are a helpful assistant that answers questions based on the provided banking documents.
+            batches = self._plan_embedding_batches(token_counts)
+            results: List[Optional[List[float]]] = [None] * len(texts)
+            
+            async def run_batch(start: int, end: int):
+                async with self.embed_semaphore:
+                    embeddings = await self._embed_batch_with_retry(texts[start:end])
+                results[start:end] = embeddings
+            
+            await asyncio.gather(*(run_batch(start, end) for start, end in batches))
+            
+            if len(batches) > 1:
+                logger.info(f"Embedded {len(texts)} texts in {len(batches)} batches")
+            return results
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {e}")
+            raise
+    
+    def _plan_embedding_batches(self, token_counts: List[int]) -> List[Tuple[int, int]]:
+        """
+        Split inputs into contiguous [start, end) ranges under the per-request item and token limits
+        """
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for i, count in enumerate(token_counts):
+            if i > start and (
+                i - start >= self.embed_batch_max_items
+                or batch_tokens + count > self.embed_batch_max_tokens
+            ):
+                batches.append((start, i))
+                start = i
+                batch_tokens = 0
+            batch_tokens += count
+        batches.append((start, len(token_counts)))
+        return batches
+    
+    async def _embed_batch_with_retry(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed one batch, backing off on rate limits and transient errors
+        The backoff is shared by all batches so concurrent requests slow down together
+        """
+        for attempt in range(self.embed_max_retries + 1):
+            # Honour a cool-down started by any batch that was rate limited
+            delay = self._embed_resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                async with self.semaphore:
+                    response = await self._embed_client.embeddings.create(
+                        model=self.embed_model,
+                        input=texts,
+                        **({'dimensions': self.embed_dimensions} if self.embed_dimensions else {})
+                    )
+                self._embed_backoff = max(self._embed_backoff / 2, EMBED_MIN_BACKOFF)
+                self._record_usage('embedding', response)
+                return [item.embedding for item in response.data]
+            except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+                if attempt == self.embed_max_retries:
+                    raise
+                self._embed_backoff = min(self._embed_backoff * 2, EMBED_MAX_BACKOFF)
+                wait = max(self._embed_backoff, _retry_after(e)) * random.uniform(1.0, 1.5)
+                self._embed_resume_at = max(self._embed_resume_at, time.monotonic() + wait)
+                logger.warning(
+                    f"Embedding batch of {len(texts)} failed ({type(e).__name__}), "
+                    f"retrying in {wait:.1f}s (attempt {attempt + 1}/{self.embed_max_retries})"
+                )
+    
+    def _build_messages(self, query: str, context: List[str]) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for a query and its retrieved context
+        """
+        context_text = "\n\n".join([
+            f"[Document {i+1}]\n{ctx}" for i, ctx in enumerate(context)
+        ])
+        
+        prompt = f"""You are a helpful assistant that answers questions based on the provided banking documents.
 
 Context from documents:
 {context_text}
@@ -61,19 +247,73 @@ Question: {query}
 Please provide a comprehensive answer based on the context above. If the context doesn't contain enough information to answer the question, please say so.
 
 Answer:"""
+        
+        return [
+            {"role": "system", "content": "You are a helpful assistant that answers questions about banking documents. Always cite your sources when providing information."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    async def generate_answer(self, query: str, context: List[str]) -> str:
+        """
+        Generate an answer using GPT model with retrieved context
+        """
+        try:
+            async with self.semaphore:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self._build_messages(query, context),
+                    temperature=0.7,
+                    max_tokens=1000
+                )
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions about banking documents. Always cite your sources when providing information."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
+            self._record_usage('completion', response)
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
             raise
-
+    
+    async def stream_answer(self, query: str, context: List[str]) -> AsyncIterator[str]:
+        """
+        Generate an answer and yield its tokens as they arrive
+        Streamed responses carry no usage, so prompt tokens are counted locally and each content
+        delta counts as one completion token
+        """
+        messages = self._build_messages(query, context)
+        stream = None
+        output_tokens = 0
+        try:
+            async with self.semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1000,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        output_tokens += 1
+                        yield delta
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            raise
+        finally:
+            if stream is not None:
+                record_tokens(
+                    'completion',
+                    sum(len(encoding.encode_ordinary(message['content'])) for message in messages),
+                    output_tokens
+                )
+    
+    @staticmethod
+    def _record_usage(operation: str, response):
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            record_tokens(
+                operation,
+                getattr(usage, 'prompt_tokens', 0) or 0,
+                getattr(usage, 'completion_tokens', 0) or 0
+            )
@@ -0,0 +1,174 @@
+"""
+PDF Extractor - parallel page-range text extraction on a process pool
+"""
+
+import io
+import os
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import IO, AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple, Union
+from PyPDF2 import PdfReader
+from services.metrics import PIPELINE_INGEST, stage
+
+logger = logging.getLogger(__name__)
+
+_COPY_BLOCK = 8 * 1024 * 1024
+
+
+class SharedPdf(NamedTuple):
+    """
+    A PDF held in a shared memory block, which workers map instead of receiving the bytes
+    """
+    name: str
+    size: int
+
+
+# What page-range tasks are sent: a file path or a shared memory block
+PdfSource = Union[str, SharedPdf]
+
+
+@contextmanager
+def _open_reader(source: PdfSource) -> Iterator[PdfReader]:
+    if isinstance(source, str):
+        yield PdfReader(source)
+        return
+    shm = SharedMemory(name=source.name)
+    try:
+        with shm.buf[:source.size] as view:
+            data = bytes(view)
+    finally:
+        shm.close()
+    yield PdfReader(io.BytesIO(data))
+
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract text for pages [start, end) of a PDF (runs in a worker process)
+    Returns (1-based page number, text) pairs
+    """
+    with _open_reader(source) as reader:
+        pages = []
+        for page_num in range(start, end):
+            pages.append((page_num + 1, reader.pages[page_num].extract_text() or ""))
+    return pages
+
+
+def count_pages(source: PdfSource) -> int:
+    with _open_reader(source) as reader:
+        return len(reader.pages)
+
+
+def share_pdf(document: Union[str, IO[bytes]]) -> Tuple[PdfSource, Optional[SharedMemory]]:
+    """
+    What the worker processes read the document from, and the shared memory block to release
+    after
+    Paths and spooled temp files are passed by name; in-memory buffers are copied into shared
+    memory once, so each page-range task sends a name rather than a copy of the whole PDF
+    """
+    if isinstance(document, str):
+        return document, None
+    name = getattr(document, 'name', None)
+    if isinstance(name, str) and os.path.exists(name):
+        return name, None
+    size = document.seek(0, io.SEEK_END)
+    document.seek(0)
+    shm = SharedMemory(create=True, size=max(size, 1))
+    try:
+        if isinstance(document, io.BytesIO):
+            shm.buf[:size] = document.getbuffer()
+        else:
+            offset = 0
+            while offset < size:
+                read = document.readinto(shm.buf[offset:min(offset + _COPY_BLOCK, size)])
+                if not read:
+                    break
+                offset += read
+    except BaseException:
+        release(shm)
+        raise
+    return SharedPdf(shm.name, size), shm
+
+
+def release(shm: Optional[SharedMemory]):
+    """
+    Free a shared memory block; workers still reading it keep their mapping until done
+    """
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+
+class PdfExtractor:
+    """
+    Splits a PDF into page ranges and extracts them on a process pool, so parsing large
+    files uses several cores and never holds the event loop's GIL.
+    At most max_inflight ranges are pending at once, which bounds memory for huge files.
+    """
+    
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        pages_per_task: Optional[int] = None,
+        max_inflight: Optional[int] = None
+    ):
+        self.max_workers = max_workers or int(
+            os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1)))
+        )
+        self.pages_per_task = pages_per_task or int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+        self.max_inflight = max_inflight or int(
+            os.getenv('PDF_INFLIGHT_TASKS', str(self.max_workers * 2))
+        )
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn avoids forking a process that already runs threads (uvicorn, executors)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+    
+    async def iter_pages(
+        self,
+        document: Union[str, IO[bytes]]
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield (page number, text) in page order as ranges finish extracting
+        document is a file path or a buffer returned by S3Service.open_object
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        source, shm = await asyncio.to_thread(share_pdf, document)
+        inflight = deque()
+        try:
+            total_pages = await loop.run_in_executor(pool, count_pages, source)
+            ranges = deque(
+                (start, min(start + self.pages_per_task, total_pages))
+                for start in range(0, total_pages, self.pages_per_task)
+            )
+            while ranges or inflight:
+                while ranges and len(inflight) < self.max_inflight:
+                    start, end = ranges.popleft()
+                    inflight.append(
+                        loop.run_in_executor(pool, _extract_page_range, source, start, end)
+                    )
+                # Time spent waiting on the workers, i.e. parsing not hidden behind the pipeline
+                with stage(PIPELINE_INGEST, 'parse'):
+                    pages = await inflight.popleft()
+                for page in pages:
+                    yield page
+        finally:
+            for future in inflight:
+                future.cancel()
+            release(shm)
+    
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
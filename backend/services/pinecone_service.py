@@ -3,40 +3,136 @@ Pinecone Service - handles vector database operations
 """
 
 import os
+import json
+import random
+import asyncio
 import logging
+import numpy as np
+import urllib3
 from pinecone import Pinecone, ServerlessSpec
-from typing import List, Dict, Any, Optional
+from pinecone.exceptions import PineconeApiException, PineconeProtocolError
+from typing import List, Dict, Any, Optional, Tuple
+from services.concurrency import BoundedExecutor
+from services.metrics import VECTORS_UPSERTED
+from services.vector_store import PartialUpsertError, Vectors, VectorStore, embedding_dimension
 
 logger = logging.getLogger(__name__)
 
+# Pinecone rejects upsert requests over 2 MB or 1000 vectors
+UPSERT_MAX_BYTES = 2 * 1024 * 1024
+UPSERT_MAX_VECTORS = 1000
+UPSERT_MIN_BACKOFF = 0.5  # seconds
+# Serialized size of one vector value: a float32 widened to a float64 repr is up to ~24 chars
+_VALUE_BYTES = 24
+_VECTOR_OVERHEAD_BYTES = 64
 
-class PineconeService:
+
+def _is_transient(error: Exception) -> bool:
+    """
+    Whether a failed request is worth retrying: throttling, server errors, dropped connections
+    """
+    if isinstance(error, PineconeApiException):
+        return error.status in (408, 429) or (error.status or 0) >= 500
+    return isinstance(
+        error, (PineconeProtocolError, urllib3.exceptions.HTTPError, ConnectionError, TimeoutError)
+    )
+
+
+def plan_upsert_batches(
+    ids: List[str],
+    metadata: List[Dict[str, Any]],
+    dimension: int,
+    max_bytes: int = UPSERT_MAX_BYTES,
+    max_vectors: int = UPSERT_MAX_VECTORS
+) -> List[Tuple[int, int]]:
+    """
+    Split vectors into contiguous [start, end) ranges whose estimated request size stays under
+    max_bytes and max_vectors
+    """
+    vector_bytes = dimension * _VALUE_BYTES + _VECTOR_OVERHEAD_BYTES
+    batches = []
+    start = 0
+    batch_bytes = 0
+    for i, (vector_id, vector_metadata) in enumerate(zip(ids, metadata)):
+        size = vector_bytes + len(vector_id) + len(json.dumps(vector_metadata, default=str))
+        if i > start and (i - start >= max_vectors or batch_bytes + size > max_bytes):
+            batches.append((start, i))
+            start = i
+            batch_bytes = 0
+        batch_bytes += size
+    if ids:
+        batches.append((start, len(ids)))
+    return batches
+
+
+class PineconeService(VectorStore):
     """
     Service for Pinecone vector database operations
     """
     
-    def __init__(self):
+    name = 'pinecone'
+    
+    def __init__(self, index=None):
+        # pool_threads sizes both the thread pool and the urllib3 keep-alive connection pool
+        self.pool_threads = int(os.getenv('PINECONE_POOL_THREADS', '8'))
+        self.index_name = os.getenv('PINECONE_INDEX', 'ragledger')
+        self.index_host = os.getenv('PINECONE_INDEX_HOST')
+        self.dimension = embedding_dimension()
+        # The Pinecone client is synchronous, so data-plane calls run on a bounded pool
+        self.executor = BoundedExecutor(
+            'pinecone', int(os.getenv('PINECONE_MAX_CONCURRENCY', str(self.pool_threads)))
+        )
+        # Upsert batches are sized by request bytes and sent a window at a time
+        self.upsert_max_bytes = int(os.getenv('PINECONE_UPSERT_MAX_BYTES', str(UPSERT_MAX_BYTES)))
+        self.upsert_inflight = int(os.getenv('PINECONE_UPSERT_INFLIGHT', '4'))
+        self.upsert_max_retries = int(os.getenv('PINECONE_UPSERT_MAX_RETRIES', '4'))
+        if index is not None:
+            self.index = index
+            return
+        
         api_key = os.getenv('PINECONE_API_KEY')
         if not api_key:
             raise ValueError("PINECONE_API_KEY environment variable is not set")
-        
-        self.pc = Pinecone(api_key=api_key)
-        self.index_name = os.getenv('PINECONE_INDEX', 'ragledger')
+        self.pc = Pinecone(api_key=api_key, pool_threads=self.pool_threads)
         
         # Initialize or connect to index
         try:
-            # Check if index exists
-            existing_indexes = [idx.name for idx in self.pc.list_indexes()]
-            if self.index_name not in existing_indexes:
-                logger.info(f"Index {self.index_name} does not exist. Creating...")
-                self._create_index()
-            
-            self.index = self.pc.Index(self.index_name)
+            if self.index_host:
+                # A known host skips the control-plane lookups entirely
+                self.index = self.pc.Index(host=self.index_host, pool_threads=self.pool_threads)
+            else:
+                # Check if index exists
+                existing_indexes = {idx.name: idx for idx in self.pc.list_indexes()}
+                if self.index_name not in existing_indexes:
+                    logger.info(f"Index {self.index_name} does not exist. Creating...")
+                    self._create_index()
+                elif existing_indexes[self.index_name].dimension != self.dimension:
+                    # An index's dimension is fixed; changing EMBED_DIMENSIONS needs a new index
+                    logger.warning(
+                        f"Index {self.index_name} has dimension "
+                        f"{existing_indexes[self.index_name].dimension}, but embeddings have "
+                        f"{self.dimension}; set PINECONE_INDEX to a new index"
+                    )
+                
+                self.index = self.pc.Index(self.index_name, pool_threads=self.pool_threads)
             logger.info(f"Connected to Pinecone index: {self.index_name}")
         except Exception as e:
             logger.error(f"Error initializing Pinecone index: {e}")
             raise
     
+    def is_ready(self) -> bool:
+        return self.index is not None
+    
+    def close(self):
+        """
+        Release the index connection pool
+        """
+        self.executor.shutdown(wait=False)
+        try:
+            self.index.__exit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error closing Pinecone connection pool: {e}")
+    
     def _create_index(self):
         """
         Create a new Pinecone index if it doesn't exist
@@ -44,7 +140,7 @@ class PineconeService:
         try:
             self.pc.create_index(
                 name=self.index_name,
-                dimension=3072,  # text-embedding-3-large dimension
+                dimension=self.dimension,
                 metric='cosine',
                 spec=ServerlessSpec(
                     cloud='aws',
@@ -58,59 +154,161 @@ class PineconeService:
     
     async def upsert_vectors(
         self,
-        vectors: List[List[float]],
+        vectors: Vectors,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        namespace: Optional[str] = None
+    ):
+        """
+        Upsert vectors into a Pinecone namespace
+        Up to upsert_inflight batches are in flight at once, and each batch's rows are turned
+        into Python lists only as it is sent. Upserts overwrite by id, so a batch that hits a
+        transient error is simply resent after a jittered backoff; ids whose batch still fails
+        are reported in a PartialUpsertError once the other batches are done.
+        """
+        if not ids:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(ids) or len(ids) != len(metadata):
+            raise ValueError("vectors, ids and metadata must have the same length")
+        batches = plan_upsert_batches(
+            ids, metadata, matrix.shape[1], self.upsert_max_bytes, UPSERT_MAX_VECTORS
+        )
+        window = asyncio.Semaphore(self.upsert_inflight)
+        failures = []
+        
+        async def send(start: int, end: int):
+            async with window:
+                try:
+                    await self._upsert_batch_with_retry(
+                        matrix, ids, metadata, start, end, namespace
+                    )
+                    VECTORS_UPSERTED.labels(self.name).inc(end - start)
+                except Exception as e:
+                    failures.append((start, end, e))
+        
+        await asyncio.gather(*(send(start, end) for start, end in batches))
+        if failures:
+            failures.sort(key=lambda failure: failure[0])
+            error = PartialUpsertError(
+                [vector_id for start, end, _ in failures for vector_id in ids[start:end]],
+                len(ids),
+                failures[0][2]
+            )
+            logger.error(f"Error upserting vectors: {error}")
+            raise error
+        logger.info(f"Upserted {len(ids)} vectors to Pinecone in {len(batches)} batches")
+    
+    async def _upsert_batch_with_retry(
+        self,
+        matrix: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        start: int,
+        end: int,
+        namespace: Optional[str] = None
+    ):
+        for attempt in range(self.upsert_max_retries + 1):
+            try:
+                await self.executor.run(
+                    self._upsert_batch, matrix, ids, metadata, start, end, namespace
+                )
+                return
+            except Exception as e:
+                if attempt == self.upsert_max_retries or not _is_transient(e):
+                    raise
+                wait = UPSERT_MIN_BACKOFF * 2 ** attempt * random.uniform(1.0, 1.5)
+                logger.warning(
+                    f"Upsert batch of {end - start} vectors failed ({type(e).__name__}), "
+                    f"retrying in {wait:.1f}s (attempt {attempt + 1}/{self.upsert_max_retries})"
+                )
+                await asyncio.sleep(wait)
+    
+    def _upsert_batch(
+        self,
+        matrix: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        start: int,
+        end: int,
+        namespace: Optional[str] = None
+    ):
+        rows = matrix[start:end].tolist()
+        self.index.upsert(
+            vectors=list(zip(ids[start:end], rows, metadata[start:end])), namespace=namespace
+        )
+    
+    async def update_metadata(
+        self,
         ids: List[str],
-        metadata: List[Dict[str, Any]]
+        fields: Dict[str, Any],
+        namespace: Optional[str] = None
     ):
         """
-        Upsert vectors into Pinecone
+        Set metadata fields on vectors in a Pinecone namespace
+        The API updates one id per request; requests run at most executor-many at a time
         """
         try:
-            # Prepare vectors for upsert
-            vectors_to_upsert = [
-                {
-                    "id": ids[i],
-                    "values": vectors[i],
-                    "metadata": metadata[i]
-                }
-                for i in range(len(vectors))
-            ]
-            
-            # Upsert in batches
-            batch_size = 100
-            for i in range(0, len(vectors_to_upsert), batch_size):
-                batch = vectors_to_upsert[i:i + batch_size]
-                self.index.upsert(vectors=batch)
-            
-            logger.info(f"Upserted {len(vectors_to_upsert)} vectors to Pinecone")
+            await asyncio.gather(*(
+                self.executor.run(
+                    self.index.update, id=vector_id, set_metadata=fields, namespace=namespace
+                )
+                for vector_id in ids
+            ))
+            logger.info(f"Updated metadata of {len(ids)} vectors in Pinecone")
         except Exception as e:
-            logger.error(f"Error upserting vectors: {e}")
+            logger.error(f"Error updating vector metadata: {e}")
+            raise
+    
+    async def delete_vectors(self, ids: List[str], namespace: Optional[str] = None):
+        """
+        Delete vectors from a Pinecone namespace by id, in batches of the API's 1000-id limit
+        """
+        try:
+            batch_size = 1000
+            await asyncio.gather(*(
+                self.executor.run(
+                    self.index.delete, ids=ids[i:i + batch_size], namespace=namespace
+                )
+                for i in range(0, len(ids), batch_size)
+            ))
+            logger.info(f"Deleted {len(ids)} vectors from Pinecone")
+        except Exception as e:
+            logger.error(f"Error deleting vectors: {e}")
             raise
     
     async def query_vectors(
         self,
         query_vector: List[float],
         top_k: int = 5,
-        filter: Optional[Dict[str, Any]] = None
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Query vectors from Pinecone
+        Query vectors from a Pinecone namespace, narrowed by a metadata filter
         """
         try:
-            query_response = self.index.query(
+            query_response = await self.executor.run(
+                self.index.query,
                 vector=query_vector,
                 top_k=top_k,
                 include_metadata=True,
-                filter=filter
+                include_values=include_values,
+                filter=filter,
+                namespace=namespace
             )
             
             results = []
             for match in query_response.matches:
-                results.append({
+                result = {
                     'id': match.id,
                     'score': match.score,
                     'metadata': match.metadata
-                })
+                }
+                if include_values:
+                    result['values'] = match.values
+                results.append(result)
             
             return results
         except Exception as e:
@@ -0,0 +1,153 @@
+"""
+Query Cache - in-memory caches for repeated questions
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from services.local_db import connect, data_path
+from services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds
+    Named caches also report their hits and misses to the cache lookup metric
+    """
+    
+    def __init__(self, max_entries: int, ttl: float, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                value = None
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+        if self.name:
+            record_cache(self.name, int(value is not None), int(value is None))
+        return value
+    
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class IndexVersion:
+    """
+    Counter bumped whenever indexed documents change
+    Kept in SQLite so every worker process on the host sees the same version
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('INDEX_STATE_DB', data_path('index_state.db'))
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS index_version (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "version INTEGER NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO index_version VALUES (0, 0)")
+    
+    def get(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT version FROM index_version").fetchone()[0]
+    
+    def bump(self) -> int:
+        with self._lock:
+            self._conn.execute("UPDATE index_version SET version = version + 1")
+            return self._conn.execute("SELECT version FROM index_version").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Fold case, whitespace and trailing punctuation so rephrasings of the same text share entries
+    """
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
+
+class QueryCache:
+    """
+    Two-tier cache for the query path:
+    - query embeddings, keyed by the normalized query text
+    - answers, keyed by normalized query, top_k, the retrieved chunk ids and the index version
+    A retrieval tier remembers which chunks a query retrieved in a given scope (filters and
+    tenant) at a given index version, so a repeated question can find its cached answer without
+    calling Pinecone again.
+    """
+    
+    def __init__(self, index_version: Optional[IndexVersion] = None):
+        ttl = float(os.getenv('QUERY_CACHE_TTL', '300'))
+        max_entries = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '10000'))
+        self.index_version = index_version or IndexVersion()
+        self.embeddings = TTLCache(
+            max_entries, float(os.getenv('QUERY_EMBED_CACHE_TTL', '86400')), name='query_embedding'
+        )
+        self.retrievals = TTLCache(max_entries, ttl, name='retrieval')
+        self.answers = TTLCache(max_entries, ttl, name='answer')
+    
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        return self.embeddings.get(normalize_query(query))
+    
+    def put_embedding(self, query: str, embedding: List[float]):
+        self.embeddings.set(normalize_query(query), embedding)
+    
+    def retrieval_key(self, query: str, top_k: int, scope: Optional[str] = None) -> Tuple:
+        return (normalize_query(query), top_k, scope, self.index_version.get())
+    
+    def answer_key(self, query: str, top_k: int, chunk_ids: Iterable[str], version: int) -> Tuple:
+        return (normalize_query(query), top_k, frozenset(chunk_ids), version)
+    
+    def invalidate(self, file_id: Optional[str] = None):
+        """
+        Drop cached retrievals and answers after a document is ingested, re-ingested or deleted
+        Query embeddings stay valid since they don't depend on indexed content
+        """
+        version = self.index_version.bump()
+        self.retrievals.clear()
+        self.answers.clear()
+        logger.info(f"Query cache invalidated (file: {file_id}, index version: {version})")
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {'entries': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+            for name, cache in (
+                ('embeddings', self.embeddings),
+                ('retrievals', self.retrievals),
+                ('answers', self.answers)
+            )
+        }
+    
+    def close(self):
+        self.index_version.close()
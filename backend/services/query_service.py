@@ -2,75 +2,445 @@
 Query Service - handles RAG queries
 """
 
+import os
+import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from services.chunk_store import ChunkStore
+from services.context_builder import ContextBuilder
 from services.openai_service import OpenAIService
-from services.pinecone_service import PineconeService
-from models.schemas import Source
+from services.vector_store import VectorStore, create_vector_store, tenant_filter
+from services.metrics import PIPELINE_QUERY, stage
+from services.query_cache import QueryCache
+from services.reranker import Reranker
+from services.sparse_index import SparseIndex, reciprocal_rank_fusion
+from models.schemas import QueryFilters, Source
 
 logger = logging.getLogger(__name__)
 
+NO_CONTEXT_ANSWER = (
+    "I couldn't find any relevant information in the documents to answer your question."
+)
+
+
+class ChunkTextUnavailable(RuntimeError):
+    """
+    The chunk store holds none of the retrieved chunks' text, e.g. because it is on another
+    host's local disk
+    """
+
+
+def metadata_filter(filters: Optional[QueryFilters]) -> Optional[Dict[str, Any]]:
+    """
+    Translate request filters into a Pinecone metadata filter (None when nothing is filtered)
+    """
+    if filters is None:
+        return None
+    clauses = []
+    if filters.file_ids:
+        clauses.append({'file_id': {'$in': filters.file_ids}})
+    if filters.document_ids:
+        clauses.append({'document_id': {'$in': filters.document_ids}})
+    if filters.file_types:
+        clauses.append({'type': {'$in': [file_type.lower() for file_type in filters.file_types]}})
+    pages = {}
+    if filters.page_from is not None:
+        pages['$gte'] = filters.page_from
+    if filters.page_to is not None:
+        pages['$lte'] = filters.page_to
+    if pages:
+        clauses.append({'page': pages})
+    uploaded = {}
+    if filters.uploaded_after is not None:
+        uploaded['$gte'] = int(filters.uploaded_after.timestamp())
+    if filters.uploaded_before is not None:
+        uploaded['$lt'] = int(filters.uploaded_before.timestamp())
+    if uploaded:
+        clauses.append({'uploaded_at': uploaded})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
 
 class QueryService:
     """
     Service for processing RAG queries
     """
     
-    def __init__(self):
-        self.openai_service = OpenAIService()
-        self.pinecone_service = PineconeService()
+    def __init__(
+        self,
+        openai_service: Optional[OpenAIService] = None,
+        vector_store: Optional[VectorStore] = None,
+        query_cache: Optional[QueryCache] = None,
+        sparse_index: Optional[SparseIndex] = None,
+        chunk_store: Optional[ChunkStore] = None,
+        reranker: Optional[Reranker] = None
+    ):
+        self.openai_service = openai_service or OpenAIService()
+        self.vector_store = vector_store or create_vector_store()
+        self.query_cache = query_cache
+        # With a sparse index, each retriever fetches top_k * multiplier candidates for fusion
+        self.sparse_index = sparse_index
+        self.hybrid_fetch_multiplier = int(os.getenv('HYBRID_FETCH_MULTIPLIER', '3'))
+        self.rrf_k = int(os.getenv('HYBRID_RRF_K', '60'))
+        # Full chunk text for the LLM comes from the chunk store; sources carry a snippet
+        self.chunk_store = chunk_store
+        self.snippet_chars = int(os.getenv('SOURCE_SNIPPET_CHARS', '300'))
+        self.context_builder = ContextBuilder()
+        # With a reranker, retrieval fetches reranker.candidates chunks and keeps the best top_k
+        self.reranker = reranker if reranker is not None and reranker.enabled else None
+        # Completions in flight at once for a batch of queries
+        self.batch_concurrency = int(os.getenv('BATCH_QUERY_CONCURRENCY', '8'))
     
-    async def query(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+    async def query(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[QueryFilters] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Process a query: embed, retrieve, and generate answer
+        Retrieval only considers the tenant's chunks that match the filters
         """
         try:
-            # Generate query embedding
-            query_embeddings = await self.openai_service.generate_embeddings([query])
-            query_vector = query_embeddings[0]
-            
-            # Query Pinecone
-            results = await self.pinecone_service.query_vectors(
-                query_vector=query_vector,
-                top_k=top_k
+            context, sources, answer_key = await self._retrieve(
+                query, top_k, filter=metadata_filter(filters), tenant=tenant
             )
             
-            # Extract context and sources
-            context = []
-            sources = []
-            
-            for result in results:
-                metadata = result['metadata']
-                content = metadata.get('content', '')
-                
-                # Get full content if available (you might want to store this differently)
-                # For now, we'll use the stored content snippet
-                context.append(content)
-                
-                sources.append(Source(
-                    filename=metadata.get('filename', 'unknown'),
-                    page=metadata.get('page'),
-                    chunk_id=result['id'],
-                    similarity_score=result['score'],
-                    content=content,
-                    metadata={
-                        'file_id': metadata.get('file_id'),
-                        'type': metadata.get('type')
-                    }
-                ))
-            
-            # Generate answer using retrieved context
-            if context:
-                answer = await self.openai_service.generate_answer(query, context)
-            else:
-                answer = "I couldn't find any relevant information in the documents to answer your question."
+            answer, cached = await self._answer(query, context, answer_key)
             
             return {
                 'answer': answer,
                 'sources': sources,
-                'query': query
+                'query': query,
+                'cached': cached
             }
         except Exception as e:
             logger.error(f"Error processing query: {e}", exc_info=True)
             raise
-
+    
+    async def query_stream(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[QueryFilters] = None,
+        tenant: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a query and yield events as they become available:
+        'sources' once retrieval finishes, 'token' per answer fragment, then 'done'
+        """
+        try:
+            started = time.perf_counter()
+            context, sources, answer_key = await self._retrieve(
+                query, top_k, filter=metadata_filter(filters), tenant=tenant
+            )
+            yield {
+                'event': 'sources',
+                'data': {'query': query, 'sources': [source.model_dump() for source in sources]}
+            }
+            
+            answer_parts = []
+            cached_answer = self._cached_answer(answer_key)
+            if cached_answer is not None:
+                answer_parts.append(cached_answer)
+                yield {'event': 'token', 'data': {'token': cached_answer}}
+            elif context:
+                with stage(PIPELINE_QUERY, 'completion'):
+                    async for token in self.openai_service.stream_answer(query, context):
+                        answer_parts.append(token)
+                        yield {'event': 'token', 'data': {'token': token}}
+            else:
+                answer_parts.append(NO_CONTEXT_ANSWER)
+                yield {'event': 'token', 'data': {'token': NO_CONTEXT_ANSWER}}
+            
+            yield {
+                'event': 'done',
+                'data': {
+                    'query': query,
+                    'answer': ''.join(answer_parts),
+                    'sources_count': len(sources),
+                    'cached': cached_answer is not None,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+                }
+            }
+            if cached_answer is None:
+                self._store_answer(answer_key, ''.join(answer_parts))
+        except Exception as e:
+            logger.error(f"Error processing streaming query: {e}", exc_info=True)
+            raise
+    
+    async def query_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[QueryFilters] = None,
+        tenant: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer many queries; returns, once the queries are embedded, an iterator yielding each
+        result as soon as it completes
+        Query embeddings are fetched in one batched call, retrievals run concurrently and
+        completions at most batch_concurrency at a time. A failed query yields a result with
+        'error' instead of failing the batch. The filters and tenant apply to every query
+        """
+        filter = metadata_filter(filters)
+        query_vectors = await self._embed_queries(queries)
+        return self._batch_results(queries, query_vectors, top_k, filter, tenant)
+    
+    async def _batch_results(
+        self,
+        queries: List[str],
+        query_vectors: List[List[float]],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        tenant: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        async def run(index: int, query: str) -> Dict[str, Any]:
+            try:
+                context, sources, answer_key = await self._retrieve(
+                    query, top_k, query_vectors[index], filter=filter, tenant=tenant
+                )
+                async with semaphore:
+                    answer, cached = await self._answer(query, context, answer_key)
+                return {
+                    'index': index,
+                    'query': query,
+                    'answer': answer,
+                    'sources': sources,
+                    'cached': cached
+                }
+            except Exception as e:
+                logger.error(f"Error processing batch query {index}: {e}", exc_info=True)
+                return {'index': index, 'query': query, 'error': str(e)}
+        
+        tasks = [asyncio.create_task(run(i, query)) for i, query in enumerate(queries)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # The consumer went away (e.g. client disconnect): drop the remaining queries
+            for task in tasks:
+                task.cancel()
+    
+    async def _answer(
+        self,
+        query: str,
+        context: List[str],
+        answer_key: Optional[Tuple]
+    ) -> Tuple[str, bool]:
+        """
+        The cached answer for this retrieval, or a freshly generated one; also returns whether it
+        was cached
+        """
+        answer = self._cached_answer(answer_key)
+        if answer is not None:
+            return answer, True
+        # Generate answer using retrieved context
+        if context:
+            with stage(PIPELINE_QUERY, 'completion'):
+                answer = await self.openai_service.generate_answer(query, context)
+        else:
+            answer = NO_CONTEXT_ANSWER
+        self._store_answer(answer_key, answer)
+        return answer, False
+    
+    def _cached_answer(self, answer_key: Optional[Tuple]) -> Optional[str]:
+        if self.query_cache is None or answer_key is None:
+            return None
+        return self.query_cache.answers.get(answer_key)
+    
+    def _store_answer(self, answer_key: Optional[Tuple], answer: str):
+        if self.query_cache is not None and answer_key is not None:
+            self.query_cache.answers.set(answer_key, answer)
+    
+    async def _embed_query(self, query: str) -> List[float]:
+        if self.query_cache is not None:
+            cached = self.query_cache.get_embedding(query)
+            if cached is not None:
+                return cached
+        
+        with stage(PIPELINE_QUERY, 'embed'):
+            query_embeddings = await self.openai_service.generate_embeddings([query])
+        if self.query_cache is not None:
+            self.query_cache.put_embedding(query, query_embeddings[0])
+        return query_embeddings[0]
+    
+    async def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries with a single embeddings call, skipping cached and repeated ones
+        """
+        vectors: Dict[str, List[float]] = {}
+        for query in queries:
+            if query not in vectors and self.query_cache is not None:
+                cached = self.query_cache.get_embedding(query)
+                if cached is not None:
+                    vectors[query] = cached
+        missing = list(dict.fromkeys(query for query in queries if query not in vectors))
+        if missing:
+            with stage(PIPELINE_QUERY, 'embed'):
+                embeddings = await self.openai_service.generate_embeddings(missing)
+            for query, embedding in zip(missing, embeddings):
+                vectors[query] = embedding
+                if self.query_cache is not None:
+                    self.query_cache.put_embedding(query, embedding)
+        return [vectors[query] for query in queries]
+    
+    async def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        query_vector: Optional[List[float]] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None
+    ) -> Tuple[List[str], List[Source], Optional[Tuple]]:
+        """
+        Fetch the most relevant chunks as LLM context and sources
+        With a sparse index, the BM25 and dense lookups run concurrently and are merged with
+        reciprocal-rank fusion; a reranker then picks top_k of the over-fetched candidates.
+        Both lookups are limited to the tenant's namespace and the metadata filter.
+        Pass query_vector when the query is already embedded. Also returns the answer cache key
+        (None without a cache)
+        """
+        retrieval_key = None
+        if self.query_cache is not None:
+            scope = None
+            if filter is not None or tenant is not None:
+                scope = json.dumps({'filter': filter, 'tenant': tenant}, sort_keys=True)
+            retrieval_key = await asyncio.to_thread(
+                self.query_cache.retrieval_key, query, top_k, scope
+            )
+            hit = self.query_cache.retrievals.get(retrieval_key)
+            if hit is not None:
+                context, sources = hit
+                return context, sources, self._answer_key(retrieval_key, sources)
+        
+        candidate_k = max(top_k, self.reranker.candidates) if self.reranker else top_k
+        include_values = self.reranker is not None and self.reranker.needs_vectors
+        if self.sparse_index is None:
+            query_vector, results = await self._dense_search(
+                query, candidate_k, include_values, query_vector, filter, tenant
+            )
+            dense_ids = {result['id'] for result in results}
+            sparse_ids = set()
+        else:
+            fetch_k = candidate_k * self.hybrid_fetch_multiplier
+            (query_vector, dense), sparse = await asyncio.gather(
+                self._dense_search(query, fetch_k, include_values, query_vector, filter, tenant),
+                # The keyword index has no namespaces; it scopes by the chunks' tenant field
+                self._sparse_search(query, fetch_k, tenant_filter(filter, tenant))
+            )
+            results = reciprocal_rank_fusion([dense, sparse], candidate_k, k=self.rrf_k)
+            dense_ids = {result['id'] for result in dense}
+            sparse_ids = {result['id'] for result in sparse}
+        
+        # Fetch full chunk text in one batch
+        texts = {}
+        if self.chunk_store is not None and results:
+            with stage(PIPELINE_QUERY, 'chunk_fetch'):
+                texts = await self.chunk_store.get_many(result['id'] for result in results)
+        missing = []
+        for result in results:
+            # Vectors ingested before the chunk store carry a truncated copy in metadata
+            text = texts.get(result['id'], result['metadata'].get('content'))
+            if text is None:
+                missing.append(result['id'])
+            result['text'] = text
+        if missing:
+            logger.warning(
+                f"Chunk store is missing {len(missing)} of {len(results)} retrieved chunks "
+                f"(e.g. {missing[0]}); answering without them"
+            )
+            if len(missing) == len(results):
+                raise ChunkTextUnavailable(
+                    f"Text of the {len(results)} retrieved chunks is unavailable; "
+                    f"check that CHUNK_STORE_DB is shared by every backend instance"
+                )
+        
+        if self.reranker is not None:
+            with stage(PIPELINE_QUERY, 'rerank'):
+                results = await self.reranker.rerank(query, query_vector, results, top_k)
+        
+        # Extract context candidates and sources
+        candidates = []
+        sources = []
+        
+        for result in results:
+            metadata = result['metadata']
+            content = result['text'] or ''
+            if result['text'] is not None:
+                candidates.append({'text': content, 'metadata': metadata})
+            
+            in_dense = result['id'] in dense_ids
+            sources.append(Source(
+                filename=metadata.get('filename', 'unknown'),
+                page=metadata.get('page'),
+                chunk_id=result['id'],
+                # Keyword-only matches have no cosine similarity
+                similarity_score=result['score'] if in_dense else 0.0,
+                content=content[:self.snippet_chars],
+                text_available=result['text'] is not None,
+                metadata={
+                    'file_id': metadata.get('file_id'),
+                    'document_id': metadata.get('document_id'),
+                    'type': metadata.get('type'),
+                    'retrieval': (
+                        'hybrid' if in_dense and result['id'] in sparse_ids
+                        else 'dense' if in_dense else 'sparse'
+                    )
+                }
+            ))
+        
+        # Deduplicate, merge neighbouring chunks and fit the token budget
+        with stage(PIPELINE_QUERY, 'context'):
+            context = self.context_builder.build(candidates)
+        
+        if retrieval_key is None or missing:
+            # Don't keep a context missing chunks the store may serve again later
+            return context, sources, None
+        self.query_cache.retrievals.set(retrieval_key, (context, sources))
+        return context, sources, self._answer_key(retrieval_key, sources)
+    
+    async def _dense_search(
+        self,
+        query: str,
+        top_k: int,
+        include_values: bool = False,
+        query_vector: Optional[List[float]] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None
+    ) -> Tuple[List[float], List[Dict[str, Any]]]:
+        # Generate query embedding
+        if query_vector is None:
+            query_vector = await self._embed_query(query)
+        
+        # Query the vector store
+        with stage(PIPELINE_QUERY, 'vector_search'):
+            results = await self.vector_store.query_vectors(
+                query_vector=query_vector,
+                top_k=top_k,
+                filter=filter,
+                include_values=include_values,
+                namespace=tenant
+            )
+        return query_vector, results
+    
+    async def _sparse_search(
+        self,
+        query: str,
+        top_k: int,
+        filter: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        with stage(PIPELINE_QUERY, 'sparse_search'):
+            return await self.sparse_index.search(query, top_k, filter)
+    
+    def _answer_key(self, retrieval_key: Tuple, sources: List[Source]) -> Tuple:
+        query, top_k, _, version = retrieval_key
+        return self.query_cache.answer_key(
+            query, top_k, [source.chunk_id for source in sources], version
+        )
@@ -0,0 +1,146 @@
+"""
+Reranker - reorders over-fetched retrieval candidates within a latency budget
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+import numpy as np
+from services.concurrency import BoundedExecutor
+
+logger = logging.getLogger(__name__)
+
+RERANK_NONE = 'none'
+RERANK_MMR = 'mmr'
+RERANK_CROSS_ENCODER = 'cross-encoder'
+
+
+class Reranker:
+    """
+    Picks the top_k of N retrieval candidates
+    - mmr: maximal marginal relevance over the candidates' embeddings, trading relevance to
+      the query against similarity to already chosen chunks (mmr_lambda)
+    - cross-encoder: scores (query, chunk) pairs with a local sentence-transformers model
+    Reranking runs off the event loop; if it takes longer than timeout_ms the candidates keep
+    their retrieval order.
+    """
+    
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = (mode or os.getenv('RERANK_MODE', RERANK_NONE)).lower()
+        if self.mode not in (RERANK_NONE, RERANK_MMR, RERANK_CROSS_ENCODER):
+            raise ValueError(f"Unknown RERANK_MODE: {self.mode}")
+        self.candidates = int(os.getenv('RERANK_CANDIDATES', '20'))
+        self.timeout = float(os.getenv('RERANK_TIMEOUT_MS', '150')) / 1000
+        self.mmr_lambda = float(os.getenv('RERANK_MMR_LAMBDA', '0.7'))
+        self.model_name = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        self.executor = BoundedExecutor('rerank', int(os.getenv('RERANK_MAX_CONCURRENCY', '2')))
+        self._model = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.mode != RERANK_NONE
+    
+    @property
+    def needs_vectors(self) -> bool:
+        return self.mode == RERANK_MMR
+    
+    def warm_up(self):
+        """
+        Load the cross-encoder model up front so the first query doesn't time out loading it
+        """
+        if self.mode == RERANK_CROSS_ENCODER:
+            self._get_model()
+    
+    async def rerank(
+        self,
+        query: str,
+        query_vector: Optional[List[float]],
+        candidates: List[Dict[str, Any]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        candidates are dicts with id and score, plus 'values' (embedding) for mmr and 'text'
+        for the cross-encoder, in retrieval order
+        """
+        if not self.enabled or len(candidates) <= 1:
+            return candidates[:top_k]
+        if self.mode == RERANK_MMR:
+            work = self.executor.run(self._mmr, query_vector, candidates, top_k)
+        else:
+            work = self.executor.run(self._cross_encode, query, candidates, top_k)
+        try:
+            return await asyncio.wait_for(work, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Reranking {len(candidates)} candidates exceeded {self.timeout * 1000:.0f} ms; "
+                f"keeping retrieval order"
+            )
+        except Exception as e:
+            logger.error(f"Reranking failed, keeping retrieval order: {e}")
+        return candidates[:top_k]
+    
+    def _mmr(
+        self,
+        query_vector: Optional[List[float]],
+        candidates: List[Dict[str, Any]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        with_vectors = [c.get('values') is not None for c in candidates]
+        if query_vector is None or not any(with_vectors):
+            return candidates[:top_k]
+        dimension = len(query_vector)
+        vectors = np.array([
+            c['values'] if has_vector else np.zeros(dimension)
+            for c, has_vector in zip(candidates, with_vectors)
+        ], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        
+        # Keyword-only candidates have no embedding; rank order stands in for their relevance
+        rank_relevance = 1.0 - np.arange(len(candidates)) / len(candidates)
+        relevance = np.where(with_vectors, vectors @ query, rank_relevance)
+        similarity = vectors @ vectors.T
+        
+        selected: List[int] = []
+        remaining = list(range(len(candidates)))
+        while remaining and len(selected) < top_k:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = (
+                self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            )
+            best = remaining[int(np.argmax(scores))]
+            selected.append(best)
+            remaining.remove(best)
+        return [candidates[i] for i in selected]
+    
+    def _get_model(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError as e:
+                raise RuntimeError(
+                    "RERANK_MODE=cross-encoder requires the sentence-transformers package"
+                ) from e
+            self._model = CrossEncoder(self.model_name, device='cpu')
+            logger.info(f"Loaded cross-encoder {self.model_name}")
+        return self._model
+    
+    def _cross_encode(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        scores = self._get_model().predict([(query, c.get('text') or '') for c in candidates])
+        order = np.argsort(-np.asarray(scores), kind='stable')[:top_k]
+        return [candidates[i] for i in order]
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
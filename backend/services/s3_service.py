@@ -0,0 +1,262 @@
+"""
+S3 Service - non-blocking access to the document bucket
+"""
+
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+import boto3
+from collections import deque
+from botocore.config import Config
+from typing import IO, Any, Dict, List, Optional
+from services.concurrency import BoundedExecutor
+from services.metrics import S3_DOWNLOADED_BYTES
+
+logger = logging.getLogger(__name__)
+
+S3_BUCKET = os.getenv('S3_BUCKET', 'ragledger-documents')
+
+
+def build_s3_client(max_pool_connections: int = 50):
+    """
+    Build an S3 client with a keep-alive connection pool sized for concurrent requests
+    """
+    config = Config(
+        max_pool_connections=max_pool_connections,
+        tcp_keepalive=True,
+        retries={'max_attempts': 3, 'mode': 'adaptive'}
+    )
+    return boto3.client('s3', config=config)
+
+
+class S3Service:
+    """
+    Service for S3 operations
+    boto3 has no async client, so calls run on a bounded thread pool
+    """
+    
+    def __init__(self, client=None, bucket: str = S3_BUCKET):
+        max_concurrency = int(os.getenv('S3_MAX_CONCURRENCY', '16'))
+        pool_size = int(os.getenv('S3_MAX_POOL_CONNECTIONS', str(max(50, max_concurrency))))
+        self.client = client or build_s3_client(pool_size)
+        self.bucket = bucket
+        self.executor = BoundedExecutor('s3', max_concurrency)
+        # Objects up to spool_max_memory are downloaded into memory, larger ones to a temp file
+        self.spool_max_memory = int(os.getenv('S3_SPOOL_MAX_MEMORY', str(64 * 1024 * 1024)))
+        # Objects of at least range_threshold bytes are fetched as parallel ranged GETs
+        self.range_threshold = int(os.getenv('S3_RANGE_THRESHOLD', str(16 * 1024 * 1024)))
+        self.range_part_size = int(os.getenv('S3_RANGE_PART_SIZE', str(8 * 1024 * 1024)))
+        self.range_concurrency = int(os.getenv('S3_RANGE_CONCURRENCY', '4'))
+    
+    async def list_objects(self, prefix: str) -> Dict[str, Any]:
+        return await self.executor.run(
+            self.client.list_objects_v2, Bucket=self.bucket, Prefix=prefix
+        )
+    
+    async def download_file(self, key: str, local_path: str):
+        await self.executor.run(self.client.download_file, self.bucket, key, local_path)
+    
+    async def head_object(self, key: str) -> Dict[str, Any]:
+        return await self.executor.run(self.client.head_object, Bucket=self.bucket, Key=key)
+    
+    async def open_object(self, key: str, size: Optional[int] = None) -> IO[bytes]:
+        """
+        Download an object into a buffer positioned at the start
+        Returns a BytesIO, or a named temp file once the object exceeds spool_max_memory;
+        the caller closes it. Large objects are fetched as parallel ranged GETs
+        """
+        if size is None:
+            size = (await self.head_object(key))['ContentLength']
+        
+        if size > self.spool_max_memory:
+            buffer = tempfile.NamedTemporaryFile(prefix='ragledger-', suffix=os.path.basename(key))
+        else:
+            buffer = io.BytesIO()
+        try:
+            if size >= self.range_threshold:
+                await self._download_ranges(key, size, buffer)
+            else:
+                buffer.write(await self.executor.run(self._read_range, key, None))
+            buffer.flush()
+            buffer.seek(0)
+            return buffer
+        except Exception:
+            buffer.close()
+            raise
+    
+    async def _download_ranges(self, key: str, size: int, buffer: IO[bytes]):
+        """
+        Fetch an object in range_part_size pieces, range_concurrency at a time
+        Parts are written in order as they arrive, so only the in-flight parts sit in memory
+        """
+        ranges = deque(
+            f"bytes={start}-{min(start + self.range_part_size, size) - 1}"
+            for start in range(0, size, self.range_part_size)
+        )
+        inflight = deque()
+        try:
+            while ranges or inflight:
+                while ranges and len(inflight) < self.range_concurrency:
+                    inflight.append(asyncio.ensure_future(
+                        self.executor.run(self._read_range, key, ranges.popleft())
+                    ))
+                buffer.write(await inflight.popleft())
+        finally:
+            for future in inflight:
+                future.cancel()
+    
+    def _read_range(self, key: str, byte_range: Optional[str]) -> bytes:
+        kwargs = {'Range': byte_range} if byte_range else {}
+        response = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        data = response['Body'].read()
+        S3_DOWNLOADED_BYTES.inc(len(data))
+        return data
+    
+    async def put_object(self, key: str, body: Any, **kwargs) -> Dict[str, Any]:
+        return await self.executor.run(
+            self.client.put_object, Bucket=self.bucket, Key=key, Body=body, **kwargs
+        )
+    
+    def open_multipart_upload(
+        self,
+        key: str,
+        max_size: Optional[int] = None,
+        **kwargs
+    ) -> 'MultipartUploadWriter':
+        """
+        Start streaming an object to S3; kwargs (ContentType, Metadata) apply to the object
+        """
+        return MultipartUploadWriter(
+            self,
+            key,
+            part_size=int(os.getenv('UPLOAD_PART_SIZE', str(8 * 1024 * 1024))),
+            max_inflight=int(os.getenv('UPLOAD_PART_CONCURRENCY', '4')),
+            max_size=max_size,
+            **kwargs
+        )
+    
+    async def list_buckets(self) -> Dict[str, Any]:
+        return await self.executor.run(self.client.list_buckets)
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class MultipartUploadWriter:
+    """
+    Streams bytes into an S3 object as a multipart upload
+    Parts of part_size bytes are sent concurrently, at most max_inflight at a time, so memory
+    stays bounded to a few part buffers. The SHA-256 and size are computed as data passes
+    through; content smaller than one part is sent with a single put_object instead.
+    """
+    
+    def __init__(
+        self,
+        s3_service: S3Service,
+        key: str,
+        part_size: int,
+        max_inflight: int,
+        max_size: Optional[int] = None,
+        **kwargs
+    ):
+        self.s3_service = s3_service
+        self.key = key
+        # S3 requires every part but the last to be at least 5 MB
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.max_inflight = max_inflight
+        self.max_size = max_size
+        self.object_kwargs = kwargs
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._inflight = set()
+        self._parts: List[Dict[str, Any]] = []
+        self._part_number = 0
+    
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge(f"File exceeds the {self.max_size} byte upload limit")
+        self._hash.update(data)
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._send_part(part)
+    
+    async def complete(self) -> Dict[str, Any]:
+        """
+        Flush the last part and finish the upload; returns the size and SHA-256 hex digest
+        """
+        if self._upload_id is None:
+            await self.s3_service.put_object(self.key, bytes(self._buffer), **self.object_kwargs)
+        else:
+            if self._buffer:
+                await self._send_part(bytes(self._buffer))
+            await asyncio.gather(*self._inflight)
+            self._inflight.clear()
+            parts = sorted(self._parts, key=lambda part: part['PartNumber'])
+            await self.s3_service.executor.run(
+                self.s3_service.client.complete_multipart_upload,
+                Bucket=self.s3_service.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        self._buffer = bytearray()
+        return {'size': self.size, 'sha256': self._hash.hexdigest()}
+    
+    async def abort(self):
+        for task in self._inflight:
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._inflight.clear()
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            try:
+                await self.s3_service.executor.run(
+                    self.s3_service.client.abort_multipart_upload,
+                    Bucket=self.s3_service.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id
+                )
+            except Exception as e:
+                logger.error(f"Error aborting multipart upload for {self.key}: {e}")
+            self._upload_id = None
+    
+    async def _send_part(self, body: bytes):
+        if self._upload_id is None:
+            response = await self.s3_service.executor.run(
+                self.s3_service.client.create_multipart_upload,
+                Bucket=self.s3_service.bucket,
+                Key=self.key,
+                **self.object_kwargs
+            )
+            self._upload_id = response['UploadId']
+        while len(self._inflight) >= self.max_inflight:
+            done, self._inflight = await asyncio.wait(
+                self._inflight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+        self._part_number += 1
+        self._inflight.add(asyncio.create_task(self._upload_part(self._part_number, body)))
+    
+    async def _upload_part(self, part_number: int, body: bytes):
+        response = await self.s3_service.executor.run(
+            self.s3_service.client.upload_part,
+            Bucket=self.s3_service.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self._parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
@@ -0,0 +1,303 @@
+"""
+Sparse Index - BM25 keyword index over ingested chunks
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from services.concurrency import BoundedExecutor
+from services.local_db import connect, data_path
+from services.local_vector_store import matches_filter
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and codes such as "W-8BEN", "4111-1111" or "acct.no"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SEPARATOR_RE = re.compile(r"[-_./]")
+_SQL_BATCH = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase terms for BM25
+    Compound codes are indexed whole, joined ("w8ben") and by part, so "W-8BEN", "W8BEN" and
+    "8BEN" all match the same chunk
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        parts = _SEPARATOR_RE.split(token)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+            terms.extend(part for part in parts if len(part) > 1)
+    return terms
+
+
+class SparseIndex:
+    """
+    Inverted index with BM25 scoring, stored in SQLite
+    Chunks are added and removed per file_id, so re-ingesting a document only touches its own
+    postings; collection statistics are kept as running totals.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('SPARSE_INDEX_DB', data_path('sparse_index.db'))
+        self.k1 = float(os.getenv('BM25_K1', '1.2'))
+        self.b = float(os.getenv('BM25_B', '0.75'))
+        # Query terms found in more than this share of chunks are skipped (stop words)
+        self.max_df_ratio = float(os.getenv('SPARSE_MAX_DF_RATIO', '0.5'))
+        self.executor = BoundedExecutor(
+            'sparse-index', int(os.getenv('SPARSE_MAX_CONCURRENCY', '4'))
+        )
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_docs_file ON docs (file_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+            """
+        )
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self._doc_count, self._total_length = row[0], row[1]
+    
+    async def add_chunks(
+        self,
+        file_id: str,
+        chunk_ids: List[str],
+        texts: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """
+        Index chunks for a file, replacing any existing entries with the same chunk ids
+        """
+        await self.executor.run(self._add_chunks, file_id, chunk_ids, texts, metadata)
+    
+    async def update_metadata(self, chunk_ids: List[str], fields: Dict[str, Any]):
+        """
+        Set metadata fields on indexed chunks, keeping their other fields
+        """
+        await self.executor.run(self._update_metadata, chunk_ids, fields)
+    
+    async def remove_file(self, file_id: str):
+        await self.executor.run(self._remove_file, file_id)
+    
+    async def remove_chunks(self, chunk_ids: List[str]):
+        await self.executor.run(self._remove_chunks, chunk_ids)
+    
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the top_k chunks by BM25 score as dicts with id, score and metadata
+        """
+        try:
+            return await self.executor.run(self._search, query, top_k, filter)
+        except Exception as e:
+            logger.error(f"Error searching sparse index: {e}")
+            raise
+    
+    def _add_chunks(
+        self,
+        file_id: str,
+        chunk_ids: List[str],
+        texts: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_chunks(chunk_ids)
+                self._conn.executemany(
+                    "INSERT INTO docs VALUES (?, ?, ?, ?)",
+                    [
+                        (chunk_id, file_id, sum(counts.values()), json.dumps(meta))
+                        for chunk_id, counts, meta in zip(chunk_ids, term_counts, metadata)
+                    ]
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [
+                        (term, chunk_id, tf)
+                        for chunk_id, counts in zip(chunk_ids, term_counts)
+                        for term, tf in counts.items()
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._refresh_totals()
+                raise
+            self._doc_count += len(chunk_ids)
+            self._total_length += sum(sum(counts.values()) for counts in term_counts)
+    
+    def _update_metadata(self, chunk_ids: List[str], fields: Dict[str, Any]):
+        patch = json.dumps(fields)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for i in range(0, len(chunk_ids), _SQL_BATCH):
+                    batch = chunk_ids[i:i + _SQL_BATCH]
+                    self._conn.execute(
+                        f"UPDATE docs SET metadata = json_patch(metadata, ?) "
+                        f"WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                        [patch, *batch]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _remove_file(self, file_id: str):
+        with self._lock:
+            chunk_ids = [
+                row[0] for row in self._conn.execute(
+                    "SELECT chunk_id FROM docs WHERE file_id = ?", (file_id,)
+                )
+            ]
+            if not chunk_ids:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_chunks(chunk_ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._refresh_totals()
+                raise
+        logger.info(f"Removed {len(chunk_ids)} chunks for file {file_id} from the sparse index")
+    
+    def _remove_chunks(self, chunk_ids: List[str]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_chunks(chunk_ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._refresh_totals()
+                raise
+    
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """
+        Delete chunks and their postings (caller holds the lock inside a transaction)
+        """
+        for i in range(0, len(chunk_ids), _SQL_BATCH):
+            batch = chunk_ids[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            removed = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs "
+                f"WHERE chunk_id IN ({placeholders})",
+                batch
+            ).fetchone()
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({placeholders})", batch)
+            self._doc_count -= removed[0]
+            self._total_length -= removed[1]
+    
+    def _refresh_totals(self):
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self._doc_count, self._total_length = row[0], row[1]
+    
+    def _search(
+        self,
+        query: str,
+        top_k: int,
+        filter: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or not self._doc_count:
+                return []
+            doc_count = self._doc_count
+            avg_length = self._total_length / doc_count
+            placeholders = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term",
+                terms
+            ).fetchall())
+            terms = [
+                term for term in df if df[term] <= self.max_df_ratio * doc_count
+            ] or list(df)
+            if not terms:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT p.chunk_id, p.term, p.tf, d.length FROM postings p "
+                f"JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term IN ({placeholders})",
+                terms
+            ).fetchall()
+        
+        scores: Dict[str, float] = {}
+        for chunk_id, term, tf, length in rows:
+            idf = math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        
+        results = []
+        for i in range(0, len(ranked), _SQL_BATCH):
+            batch = ranked[i:i + _SQL_BATCH]
+            metadata = self._get_metadata([chunk_id for chunk_id, _ in batch])
+            for chunk_id, score in batch:
+                meta = metadata.get(chunk_id)
+                if meta is None or (filter is not None and not matches_filter(meta, filter)):
+                    continue
+                results.append({'id': chunk_id, 'score': score, 'metadata': meta})
+                if len(results) == top_k:
+                    return results
+            if filter is None:
+                break
+        return results
+    
+    def _get_metadata(self, chunk_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, metadata FROM docs WHERE chunk_id IN ({placeholders})",
+                chunk_ids
+            ).fetchall()
+        return {row['chunk_id']: json.loads(row['metadata']) for row in rows}
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]],
+    top_k: int,
+    k: int = 60
+) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists: each result scores sum(1 / (k + rank)) across the lists
+    The first list's entry (its score and metadata) is kept for results found by several lists
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result['id'], {'result': result, 'rrf_score': 0.0})
+            entry['rrf_score'] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry['rrf_score'], reverse=True)
+    return [dict(entry['result'], rrf_score=entry['rrf_score']) for entry in ranked[:top_k]]
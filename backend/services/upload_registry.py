@@ -0,0 +1,66 @@
+"""
+Upload Registry - record of uploaded documents and where they live in S3
+"""
+
+import os
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from services.local_db import connect, data_path
+
+logger = logging.getLogger(__name__)
+
+
+class UploadRegistry:
+    """
+    SQLite-backed map from file_id to its S3 key and file details
+    Lets ingestion fetch an upload directly instead of listing the bucket to find it
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('UPLOAD_REGISTRY_DB', data_path('uploads.db'))
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                file_id TEXT PRIMARY KEY,
+                s3_key TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                size INTEGER,
+                content_hash TEXT,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+    
+    def record(
+        self,
+        file_id: str,
+        s3_key: str,
+        filename: str,
+        file_type: str,
+        size: Optional[int] = None,
+        content_hash: Optional[str] = None
+    ):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_id, s3_key, filename, file_type, size, content_hash,
+                    datetime.now(timezone.utc).isoformat()
+                )
+            )
+    
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM uploads WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
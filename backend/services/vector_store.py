@@ -0,0 +1,136 @@
+"""
+Vector Store - interface shared by the Pinecone and local vector index backends
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Embeddings as one float32 matrix (one row per vector) or as a list of lists
+Vectors = Union[np.ndarray, List[List[float]]]
+
+# Native output size of the OpenAI embedding models
+EMBED_MODEL_DIMENSIONS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+    'text-embedding-ada-002': 1536,
+}
+
+
+# Metadata field naming a chunk's tenant; Pinecone also keeps each tenant in its own namespace
+TENANT_FIELD = 'tenant'
+
+
+def tenant_filter(
+    filter: Optional[Dict[str, Any]],
+    tenant: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Scope a metadata filter to one tenant's chunks (or, without a tenant, to untenanted ones),
+    for indexes that have no namespaces
+    """
+    if tenant is None:
+        clause = {TENANT_FIELD: {'$exists': False}}
+    else:
+        clause = {TENANT_FIELD: {'$eq': tenant}}
+    return {'$and': [filter, clause]} if filter else clause
+
+
+def embedding_dimension() -> int:
+    """
+    Size of the stored embeddings: EMBED_DIMENSIONS if set, else the embedding model's own
+    """
+    dimensions = int(os.getenv('EMBED_DIMENSIONS', '0'))
+    if dimensions:
+        return dimensions
+    model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-large')
+    return EMBED_MODEL_DIMENSIONS.get(model, 3072)
+
+
+class PartialUpsertError(RuntimeError):
+    """
+    Some vectors of an upsert weren't stored; the rest were
+    """
+    
+    def __init__(self, failed_ids: List[str], total: int, cause: Exception):
+        super().__init__(f"{len(failed_ids)} of {total} vectors failed to upsert: {cause}")
+        self.failed_ids = failed_ids
+
+
+class VectorStore(ABC):
+    """
+    Where chunk embeddings are stored and searched
+    Scores are cosine similarities; filters use Pinecone's metadata filter syntax.
+    Each tenant's vectors live in their own namespace (None: the default one)
+    """
+    
+    name = 'vector_store'
+    
+    @abstractmethod
+    async def upsert_vectors(
+        self,
+        vectors: Vectors,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        namespace: Optional[str] = None
+    ):
+        """
+        Insert or overwrite vectors by id
+        Raises PartialUpsertError naming the failed ids if only part of the upsert succeeded
+        """
+    
+    @abstractmethod
+    async def query_vectors(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the top_k matches in the namespace as dicts with id, score and metadata, best first
+        With include_values, each match also carries its stored vector under 'values'
+        """
+    
+    @abstractmethod
+    async def update_metadata(
+        self,
+        ids: List[str],
+        fields: Dict[str, Any],
+        namespace: Optional[str] = None
+    ):
+        """
+        Set the given metadata fields on vectors by id, keeping their other fields and values;
+        unknown ids are ignored
+        """
+    
+    @abstractmethod
+    async def delete_vectors(self, ids: List[str], namespace: Optional[str] = None):
+        """
+        Delete vectors by id; unknown ids are ignored
+        """
+    
+    def is_ready(self) -> bool:
+        return True
+    
+    def close(self):
+        pass
+
+
+def create_vector_store() -> VectorStore:
+    """
+    Build the backend selected by VECTOR_STORE: 'pinecone' (default) or 'local'
+    """
+    backend = os.getenv('VECTOR_STORE', 'pinecone').lower()
+    if backend == 'pinecone':
+        from services.pinecone_service import PineconeService
+        return PineconeService()
+    if backend == 'local':
+        from services.local_vector_store import LocalVectorStore
+        return LocalVectorStore()
+    raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")
@@ -0,0 +1,166 @@
+"""
+Fakes of the external services, shared by the tests as fixtures
+Each fake records what it was asked; a test needing other behaviour replaces the method on its
+instance
+"""
+
+import io
+import threading
+from types import SimpleNamespace
+import pytest
+
+
+class FakeOpenAIService:
+    """
+    Embeds each text as [len(text), 1.0] and gives the same answer to every question
+    """
+    
+    def __init__(self):
+        self.embedding_calls = []
+        self.embedded = []
+        self.contexts = []
+    
+    async def generate_embeddings(self, texts, token_counts=None):
+        self.embedding_calls.append(list(texts))
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+    
+    async def generate_answer(self, query, context):
+        self.contexts.append(context)
+        return "answer"
+
+
+class FakeVectorStore:
+    """
+    Keeps each vector's metadata and namespace by id, and answers every query with matches
+    """
+    
+    def __init__(self):
+        self.matches = [{
+            'id': 'f1_0',
+            'score': 0.9,
+            'metadata': {'filename': 'fees.pdf', 'file_id': 'f1', 'content': 'Overdraft fee: $35'}
+        }]
+        self.vectors = {}
+        self.namespaces = {}
+        self.upserts = []
+        self.queries = []
+    
+    async def upsert_vectors(self, vectors, ids, metadata, namespace=None):
+        self.upserts.append((list(ids), list(metadata)))
+        self.vectors.update(zip(ids, metadata))
+        self.namespaces.update(dict.fromkeys(ids, namespace))
+    
+    async def update_metadata(self, ids, fields, namespace=None):
+        for chunk_id in ids:
+            if self.namespaces.get(chunk_id) == namespace and chunk_id in self.vectors:
+                self.vectors[chunk_id] = {**self.vectors[chunk_id], **fields}
+    
+    async def delete_vectors(self, ids, namespace=None):
+        for chunk_id in ids:
+            if self.namespaces.get(chunk_id) == namespace:
+                self.vectors.pop(chunk_id, None)
+    
+    async def query_vectors(
+        self, query_vector, top_k=5, filter=None, include_values=False, namespace=None
+    ):
+        self.queries.append({'top_k': top_k, 'filter': filter, 'namespace': namespace})
+        return self.matches[:top_k]
+
+
+class FakePineconeIndex:
+    """
+    Pinecone index client: stores upserted batches and answers every query with one match
+    """
+    
+    def __init__(self):
+        self.batches = []
+        self.stored = {}
+        self.queries = []
+        self._lock = threading.Lock()
+    
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self.batches.append([vector_id for vector_id, _, _ in vectors])
+            for vector_id, values, metadata in vectors:
+                self.stored[vector_id] = (values, metadata)
+    
+    def update(self, id, set_metadata=None, namespace=None):
+        with self._lock:
+            values, metadata = self.stored[id]
+            self.stored[id] = (values, {**metadata, **set_metadata})
+    
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        match = SimpleNamespace(
+            id='d1_0', score=0.9, values=[],
+            metadata={'filename': 'fees.pdf', 'file_id': 'f1', 'content': 'Wire fee: $25'}
+        )
+        return SimpleNamespace(matches=[match])
+
+
+class FakeS3Client:
+    """
+    boto3 S3 client over a dict of objects, recording reads and aborted multipart uploads
+    """
+    
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.calls = []
+    
+    def head_object(self, Bucket, Key):
+        self.calls.append(('head', Key))
+        return {'ContentLength': len(self.objects[Key])}
+    
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls.append(('get', Range))
+        data = self.objects[Key]
+        if Range:
+            start, end = Range.split('=')[1].split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': io.BytesIO(data)}
+    
+    def list_objects_v2(self, Bucket, Prefix):
+        self.calls.append(('list', Prefix))
+        return {'Contents': [{'Key': key, 'Size': len(data)}
+                             for key, data in self.objects.items() if key.startswith(Prefix)]}
+    
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+    
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.parts[Key] = {}
+        return {'UploadId': f"upload-{Key}"}
+    
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[Key][PartNumber] = Body
+        return {'ETag': f"etag-{PartNumber}"}
+    
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        self.objects[Key] = b"".join(self.parts[Key][number] for number in numbers)
+    
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+@pytest.fixture
+def openai_service():
+    return FakeOpenAIService()
+
+
+@pytest.fixture
+def vector_store():
+    return FakeVectorStore()
+
+
+@pytest.fixture
+def pinecone_index():
+    return FakePineconeIndex()
+
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client()
@@ -0,0 +1,115 @@
+"""
+Test the bulk ingestion pipeline script
+"""
+
+import importlib.util
+from pathlib import Path
+import pytest
+from services.ingestion_service import IngestionService
+from services.s3_service import S3Service
+from services.upload_registry import UploadRegistry
+
+SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "bulk_ingest.py"
+spec = importlib.util.spec_from_file_location("bulk_ingest", SCRIPT)
+bulk_ingest = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bulk_ingest)
+
+
+def write_csv(path, rows):
+    path.write_text("account,fee\n" + "".join(f"{n},{n * 5}\n" for n in range(rows)))
+
+
+@pytest.fixture
+def make_ingester(tmp_path, openai_service, vector_store, s3_client):
+    services = []
+    
+    def make_ingester():
+        s3_service = S3Service(client=s3_client, bucket='test')
+        service = IngestionService(
+            openai_service=openai_service,
+            vector_store=vector_store,
+            s3_service=s3_service
+        )
+        service.chunk_group_size = 4
+        services.extend([service, s3_service])
+        return bulk_ingest.BulkIngester(
+            service,
+            s3_service,
+            UploadRegistry(str(tmp_path / "uploads.db")),
+            bulk_ingest.Checkpoint(str(tmp_path / "checkpoint.db")),
+            workers={'upload': 2, 'extract': 2, 'embed': 2, 'upsert': 1},
+            queue_size=2
+        )
+    
+    yield make_ingester
+    for service in services:
+        service.close()
+
+
+def upserted_ids(vector_store):
+    return [chunk_id for ids, _ in vector_store.upserts for chunk_id in ids]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_ingests_each_distinct_file_once(
+    tmp_path, make_ingester, vector_store, s3_client
+):
+    docs = tmp_path / "docs"
+    (docs / "2023").mkdir(parents=True)
+    write_csv(docs / "a.csv", 200)
+    write_csv(docs / "2023" / "b.csv", 50)
+    (docs / "copy-of-a.csv").write_bytes((docs / "a.csv").read_bytes())
+    (docs / "notes.txt").write_text("ignored")
+    paths = bulk_ingest.find_files([str(docs)])
+    assert len(paths) == 3
+    
+    ingester = make_ingester()
+    stats = await ingester.run(paths)
+    
+    assert (stats.files, stats.skipped, stats.failed) == (2, 1, 0)
+    assert len(s3_client.objects) == 2
+    ids = upserted_ids(vector_store)
+    assert stats.chunks == len(ids) == len(set(ids))
+    assert stats.tokens > 0
+    
+    # A second run finds everything in the checkpoint
+    vector_store.upserts.clear()
+    rerun = make_ingester()
+    stats = await rerun.run(paths)
+    
+    assert (stats.files, stats.skipped) == (0, 3)
+    assert len(s3_client.objects) == 2 and not vector_store.upserts
+
+
+@pytest.mark.asyncio
+async def test_failed_file_resumes_without_reuploading(
+    tmp_path, make_ingester, openai_service, vector_store, s3_client
+):
+    write_csv(tmp_path / "ok.csv", 20)
+    (tmp_path / "bad.csv").write_text("account,fee\nPOISON,1\n")
+    paths = [str(tmp_path / "ok.csv"), str(tmp_path / "bad.csv")]
+    
+    async def generate_embeddings(texts, token_counts=None):
+        if any("POISON" in text for text in texts):
+            raise RuntimeError("embedding failed")
+        return [[float(len(text)), 1.0] for text in texts]
+    
+    openai_service.generate_embeddings = generate_embeddings
+    ingester = make_ingester()
+    stats = await ingester.run(paths)
+    
+    assert (stats.files, stats.failed) == (1, 1)
+    _, content_hash = bulk_ingest.hash_file(paths[1])
+    record = ingester.checkpoint.get(content_hash)
+    assert record['status'] == bulk_ingest.STATUS_FAILED
+    assert "embedding failed" in record['error']
+    
+    del openai_service.generate_embeddings
+    vector_store.upserts.clear()
+    uploaded = dict(s3_client.objects)
+    retry = make_ingester()
+    stats = await retry.run(paths)
+    
+    assert (stats.files, stats.skipped) == (1, 1)
+    assert s3_client.objects == uploaded
+    assert len(upserted_ids(vector_store)) == 1
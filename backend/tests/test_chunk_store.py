@@ -0,0 +1,77 @@
+"""
+Test the compressed chunk text store
+"""
+
+import pytest
+from services.chunk_store import ChunkStore
+from services.query_service import ChunkTextUnavailable, QueryService
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.db"))
+    store.block_chunks = 4
+    yield store
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_chunks_round_trip_across_blocks(store):
+    chunks = {f"f1_{i}": f"Statement line {i}: balance €{i * 10:,}.00 " * 20 for i in range(10)}
+    await store.put_many('f1', chunks)
+    
+    found = await store.get_many(['f1_0', 'f1_5', 'f1_9', 'missing'])
+    assert found == {key: chunks[key] for key in ('f1_0', 'f1_5', 'f1_9')}
+    blocks = store._conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+    assert blocks == 3
+
+
+@pytest.mark.asyncio
+async def test_overwrite_and_remove_file_drop_unused_blocks(store):
+    await store.put_many('f1', {f"f1_{i}": f"old {i}" for i in range(4)})
+    await store.put_many('f2', {'f2_0': "other file"})
+    await store.get_many(['f1_0'])
+    
+    await store.put_many('f1', {f"f1_{i}": f"new {i}" for i in range(4)})
+    assert await store.get_many(['f1_0', 'f1_3']) == {'f1_0': "new 0", 'f1_3': "new 3"}
+    assert store._conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] == 2
+    
+    await store.remove_file('f1')
+    assert await store.get_many(['f1_0', 'f2_0']) == {'f2_0': "other file"}
+    assert store._conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_query_sends_full_chunk_text_and_returns_snippets(
+    store, openai_service, vector_store
+):
+    text = "Late payment fee schedule. " * 100
+    await store.put_many('f1', {'f1_0': text})
+    service = QueryService(openai_service, vector_store, chunk_store=store)
+    
+    result = await service.query("late fee?")
+    
+    assert openai_service.contexts == [[text]]
+    assert result['sources'][0].content == text[:service.snippet_chars]
+
+
+@pytest.mark.asyncio
+async def test_chunk_store_misses_are_reported_not_answered_from(
+    store, openai_service, vector_store, caplog
+):
+    await store.put_many('f1', {'f1_0': "Late payment fee: 25 USD"})
+    vector_store.matches = [
+        {'id': 'f1_0', 'score': 0.9, 'metadata': {'filename': 'a.pdf'}},
+        {'id': 'f1_1', 'score': 0.8, 'metadata': {'filename': 'a.pdf'}}
+    ]
+    service = QueryService(openai_service, vector_store, chunk_store=store)
+    
+    result = await service.query("late fee?")
+    assert openai_service.contexts == [["Late payment fee: 25 USD"]]
+    assert [source.text_available for source in result['sources']] == [True, False]
+    assert result['sources'][1].content == ""
+    assert "missing 1 of 2" in caplog.text
+    
+    await store.remove_file('f1')
+    with pytest.raises(ChunkTextUnavailable):
+        await service.query("late fee?")
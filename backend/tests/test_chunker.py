@@ -0,0 +1,71 @@
+"""
+Test structure-aware chunking
+"""
+
+import time
+from services.chunker import Chunker, encode, encoding, token_offsets
+
+
+def test_chunks_end_at_paragraph_and_sentence_breaks():
+    paragraphs = [
+        " ".join(f"Clause {p}.{s} sets the fee for account type {s} at {s * 3} dollars."
+                 for s in range(1, 6))
+        for p in range(1, 12)
+    ]
+    text = "\n\n".join(paragraphs)
+    chunks = Chunker(120, 20).split(text)
+    
+    assert len(chunks) > 3
+    for content, tokens in chunks:
+        assert content in text
+        assert tokens <= 120
+        assert content.endswith(".")
+    # The overlap starts at a sentence, not mid-word
+    assert all(content.startswith("Clause") for content, _ in chunks)
+    # Paragraphs fit a chunk, so the first chunk is exactly the first paragraph
+    assert chunks[0][0] == paragraphs[0]
+    assert chunks[-1][0].endswith(paragraphs[-1])
+
+
+def test_token_offsets_map_multibyte_text():
+    text = "Zinsen für Überweisungen — 5 € / 日本語のテキスト 🚀 done"
+    tokens = encode(text)
+    offsets = token_offsets(text, tokens)
+    assert offsets[0] == 0 and offsets[-1] == len(text)
+    assert all(a <= b for a, b in zip(offsets, offsets[1:]))
+    
+    chunks = Chunker(4, 1).split(text * 20)
+    assert all(content in text * 20 for content, _ in chunks)
+
+
+def test_overlap_is_capped_so_chunking_always_progresses():
+    text = " ".join(f"word{n}" for n in range(300))
+    chunker = Chunker(10, 50)
+    assert chunker.overlap == 5
+    chunks = chunker.split(text)
+    assert chunks[0][0].startswith("word0") and chunks[-1][0].endswith("word299")
+    assert len(chunks) < 300
+
+
+def test_pathological_input_is_linear():
+    runs = "x" * 200000
+    started = time.perf_counter()
+    chunks = Chunker(500, 50).split(runs + " tail")
+    assert time.perf_counter() - started < 5
+    assert chunks[0][0] == "x" * len(chunks[0][0])
+    assert all(tokens <= 500 for _, tokens in chunks)
+    assert chunks[-1][0].endswith("tail")
+    
+    assert encode("<|endoftext|> hello") == encoding.encode_ordinary("<|endoftext|> hello")
+    assert Chunker().split("  \n\n ") == []
+
+
+def test_long_whitespace_runs_are_linear():
+    padded = "Opening balance 100" + " " * 100000 + "Fee 5" + "\n" * 100000 + "Closing balance 95"
+    started = time.perf_counter()
+    tokens = encode(padded)
+    chunks = Chunker(500, 50).split(padded)
+    assert time.perf_counter() - started < 2
+    assert encoding.decode(tokens) == padded
+    assert all(tokens <= 500 for _, tokens in chunks)
+    assert chunks[0][0].startswith("Opening") and chunks[-1][0].endswith("Closing balance 95")
@@ -0,0 +1,66 @@
+"""
+Test token-budgeted context packing
+"""
+
+from services.chunker import Chunker
+from services.context_builder import ContextBuilder, encoding
+from services.ingestion_service import IngestionService
+
+
+def candidate(text, file_id='f1', page=1, chunk_index=None):
+    return {
+        'text': text,
+        'metadata': {'file_id': file_id, 'page': page, 'chunk_index': chunk_index}
+    }
+
+
+def test_consecutive_chunks_merge_without_repeating_overlap():
+    words = ["deposit", "wire", "loan", "escrow", "fee", "rate", "audit", "ledger", "branch"]
+    text = " ".join(f"{words[n % 9]}-{n * 7919 % 1000}" for n in range(700))
+    service = IngestionService.__new__(IngestionService)
+    service.chunkers = {'pdf': Chunker(500, 50)}
+    chunks = service._chunk_text(text, "terms.pdf", page=1)
+    assert len(chunks) >= 2
+    
+    builder = ContextBuilder(token_budget=10000)
+    context = builder.build([
+        candidate(chunks[1]['content'], chunk_index=1),
+        candidate(chunks[0]['content'], chunk_index=0)
+    ])
+    
+    assert len(context) == 1
+    second = chunks[1]['content']
+    assert text.index(second) < len(chunks[0]['content'])
+    assert context[0] == text[:text.index(second) + len(second)]
+
+
+def test_near_duplicates_are_dropped():
+    rows = "".join(
+        f"Row {n}:\naccount: {1000 + n}\nfee: Monthly maintenance\namount: {n}.00\n\n"
+        for n in range(1, 40)
+    )
+    builder = ContextBuilder(token_budget=10000)
+    
+    context = builder.build([
+        candidate(rows, chunk_index=3),
+        candidate(rows.replace("Row 39", "Row 39 (reversed)"), file_id='f2', chunk_index=8),
+        candidate(rows.replace("account", "acct"), chunk_index=20),
+        candidate("Wire transfers settle the same business day.", chunk_index=30)
+    ])
+    
+    assert len(context) == 3
+    assert "acct" in context[1]
+
+
+def test_best_pieces_fill_the_token_budget():
+    texts = [f"Passage {n}. " + "interest accrues daily " * 40 for n in range(5)]
+    tokens = len(encoding.encode(texts[0]))
+    builder = ContextBuilder(token_budget=tokens * 2 + 5, dedup_threshold=1.01)
+    
+    context = builder.build([
+        candidate(text, page=n, chunk_index=n) for n, text in enumerate(texts)
+    ])
+    assert context == texts[:2]
+    
+    truncated = ContextBuilder(token_budget=10).build([candidate(texts[0])])
+    assert len(encoding.encode(truncated[0])) <= 10
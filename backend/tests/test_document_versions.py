@@ -0,0 +1,213 @@
+"""
+Test incremental re-ingestion and deletion of document versions
+"""
+
+import asyncio
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from routers.dependencies import get_ingestion_service
+from services.chunk_store import ChunkStore
+from services.document_registry import DocumentRegistry, DocumentVersion
+from services.ingestion_service import IngestionService
+from models.schemas import QueryFilters
+from services.local_vector_store import LocalVectorStore
+from services.query_service import metadata_filter
+from services.sparse_index import SparseIndex
+
+
+def make_chunks(pages):
+    return [
+        {'content': text, 'filename': 'statement.pdf', 'page': page, 'tokens': len(text.split())}
+        for page, texts in enumerate(pages, start=1)
+        for text in texts
+    ]
+
+
+async def ingest(service, document_id, file_id, chunks, tenant=None):
+    version = await service.begin_document(
+        document_id, file_id, 'statement.pdf', 'pdf', tenant=tenant, uploaded_at=1700000000
+    )
+    prepared = service.prepare_group(version, chunks)
+    embeddings = await service.embed_group(prepared)
+    await service.upsert_group(prepared, embeddings)
+    return await service.finish_document(version)
+
+
+@pytest.fixture
+def service(tmp_path, openai_service, vector_store):
+    service = IngestionService(
+        openai_service,
+        vector_store,
+        s3_service=object(),
+        chunk_store=ChunkStore(str(tmp_path / "chunks.db")),
+        document_registry=DocumentRegistry(str(tmp_path / "documents.db"))
+    )
+    yield service
+    service.chunk_store.close()
+    service.document_registry.close()
+
+
+@pytest.mark.asyncio
+async def test_reingest_embeds_only_changed_chunks(service):
+    first = await ingest(service, 'stmt', 'file-1', make_chunks([
+        ["Opening balance 100", "Fee 5"],
+        ["Interest 2", "Closing balance 97"],
+        ["Fee 5"]
+    ]))
+    assert first == {'chunks_added': 5, 'chunks_unchanged': 0, 'chunks_removed': 0}
+    old_ids = set(service.vector_store.vectors)
+    assert len(old_ids) == 5
+    
+    service.openai_service.embedded.clear()
+    second = await ingest(service, 'stmt', 'file-2', make_chunks([
+        ["Opening balance 100", "Fee 5"],
+        ["Interest 3", "Closing balance 98"],
+        ["Fee 5"]
+    ]))
+    
+    assert second == {'chunks_added': 2, 'chunks_unchanged': 3, 'chunks_removed': 2}
+    assert service.openai_service.embedded == ["Interest 3", "Closing balance 98"]
+    new_ids = set(service.vector_store.vectors)
+    assert len(new_ids) == 5 and len(old_ids & new_ids) == 3
+    texts = await service.chunk_store.get_many(old_ids | new_ids)
+    assert sorted(texts.values()) == sorted([
+        "Opening balance 100", "Fee 5", "Interest 3", "Closing balance 98", "Fee 5"
+    ])
+    # Kept chunks are pointed at the new upload too
+    stored = service.vector_store.vectors.values()
+    assert all(m['file_id'] == 'file-2' and m['document_id'] == 'stmt' for m in stored)
+    
+    result = await service.delete_document('stmt')
+    assert result == {'document_id': 'stmt', 'chunks_deleted': 5}
+    assert not service.vector_store.vectors
+    assert not await service.chunk_store.get_many(new_ids)
+    with pytest.raises(FileNotFoundError):
+        await service.delete_document('stmt')
+
+
+@pytest.mark.asyncio
+async def test_tenant_documents_stay_in_their_namespace(service):
+    await ingest(service, 'stmt', 'file-1', make_chunks([["Fee 5", "Interest 2"]]), 'acme')
+    assert set(service.vector_store.namespaces.values()) == {'acme'}
+    assert all(
+        m['tenant'] == 'acme' and m['uploaded_at'] == 1700000000
+        for m in service.vector_store.vectors.values()
+    )
+    with pytest.raises(ValueError):
+        await ingest(service, 'stmt', 'file-2', make_chunks([["Fee 6"]]), 'globex')
+    
+    diff = await ingest(service, 'stmt', 'file-2', make_chunks([["Fee 6", "Interest 2"]]), 'acme')
+    assert diff == {'chunks_added': 1, 'chunks_unchanged': 1, 'chunks_removed': 1}
+    assert len(service.vector_store.vectors) == 2
+    await service.delete_document('stmt')
+    assert not service.vector_store.vectors
+
+
+@pytest.mark.asyncio
+async def test_reingested_documents_are_found_by_their_new_file_id(tmp_path, openai_service):
+    store = LocalVectorStore(str(tmp_path / "vectors"))
+    service = IngestionService(
+        openai_service,
+        store,
+        s3_service=object(),
+        sparse_index=SparseIndex(str(tmp_path / "sparse.db")),
+        document_registry=DocumentRegistry(str(tmp_path / "documents.db"))
+    )
+    pages = [["Opening balance 100", "Fee 5"], ["Interest 2"]]
+    try:
+        await ingest(service, 'stmt', 'file-1', make_chunks(pages))
+        pages[1] = ["Interest 3"]
+        diff = await ingest(service, 'stmt', 'file-2', make_chunks(pages))
+        assert diff['chunks_unchanged'] == 2
+        
+        new_file = metadata_filter(QueryFilters(file_ids=['file-2']))
+        results = await store.query_vectors([1.0, 1.0], top_k=10, filter=new_file)
+        assert len(results) == 3
+        assert await store.query_vectors([1.0, 1.0], top_k=10, filter={'file_id': 'file-1'}) == []
+        keyword = await service.sparse_index.search("balance fee interest", 10, new_file)
+        assert len(keyword) == 3
+    finally:
+        store.close()
+        service.sparse_index.close()
+        service.document_registry.close()
+
+
+@pytest.mark.asyncio
+async def test_unfinished_reingest_chunks_are_deleted(service):
+    await ingest(service, 'stmt', 'file-1', make_chunks([["Fee 5", "Interest 2"]]))
+    registered = set(service.vector_store.vectors)
+    
+    async def store_without_finishing(file_id, texts):
+        version = await service.begin_document('stmt', file_id, 'statement.pdf', 'pdf')
+        prepared = service.prepare_group(version, make_chunks([texts]))
+        await service.upsert_group(prepared, await service.embed_group(prepared))
+        return version
+    
+    # A failed ingest deletes what it stored right away
+    version = await store_without_finishing('file-2', ["Fee 5", "Interest 3"])
+    assert len(service.vector_store.vectors) == 3
+    await service.abort_document(version)
+    assert set(service.vector_store.vectors) == registered
+    
+    # One that couldn't clean up (e.g. the process died) is cleaned up by the next ingest
+    await store_without_finishing('file-3', ["Fee 6"])
+    assert len(service.document_registry.get_pending('stmt')) == 1
+    diff = await ingest(service, 'stmt', 'file-4', make_chunks([["Fee 5", "Interest 2"]]))
+    assert diff['chunks_unchanged'] == 2
+    assert set(service.vector_store.vectors) == registered
+    assert not service.document_registry.get_pending('stmt')
+    stored = service.chunk_store._conn.execute("SELECT chunk_id FROM chunks").fetchall()
+    assert {row['chunk_id'] for row in stored} == registered
+
+
+@pytest.mark.asyncio
+async def test_document_locks_are_dropped_when_released(service):
+    async with service._document_lock('stmt'):
+        waiter = asyncio.create_task(service.delete_document('stmt'))
+        await asyncio.sleep(0)
+        assert service._document_locks['stmt'][1] == 2
+    with pytest.raises(FileNotFoundError):
+        await waiter
+    assert not service._document_locks
+
+
+@pytest.mark.asyncio
+async def test_local_store_deletes_vectors(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = np.random.default_rng(0).normal(size=(4, 8)).astype(np.float32)
+    store = LocalVectorStore(path)
+    await store.upsert_vectors(vectors.tolist(), ['a', 'b', 'c', 'd'], [{}] * 4)
+    await store.delete_vectors(['b', 'missing'])
+    results = await store.query_vectors(vectors[1].tolist(), top_k=4)
+    assert {result['id'] for result in results} == {'a', 'c', 'd'}
+    store.close()
+    
+    reopened = LocalVectorStore(path)
+    try:
+        results = await reopened.query_vectors(vectors[1].tolist(), top_k=4)
+        assert {result['id'] for result in results} == {'a', 'c', 'd'}
+        await reopened.upsert_vectors([vectors[1].tolist()], ['b'], [{}])
+        results = await reopened.query_vectors(vectors[1].tolist(), top_k=1)
+        assert results[0]['id'] == 'b'
+    finally:
+        reopened.close()
+
+
+def test_delete_endpoint(service):
+    version = DocumentVersion('stmt', 'file-1', 'statement.pdf', 'pdf', {})
+    entry = version.add(make_chunks([["Fee 5"]])[0])
+    service.vector_store.vectors[entry['id']] = entry['metadata']
+    service.document_registry.replace(version)
+    app.dependency_overrides[get_ingestion_service] = lambda: service
+    try:
+        client = TestClient(app)
+        assert client.delete("/ingest/unknown").status_code == 404
+        
+        response = client.delete("/ingest/stmt")
+        assert response.status_code == 200
+        assert response.json() == {'document_id': 'stmt', 'chunks_deleted': 1}
+        assert not service.vector_store.vectors
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,63 @@
+"""
+Test embedding batching, ordering and rate-limit retries
+"""
+
+import httpx
+import pytest
+from types import SimpleNamespace
+from openai import RateLimitError
+from services.openai_service import OpenAIService
+
+
+class FakeEmbeddings:
+    def __init__(self, rate_limit_first: int = 0):
+        self.batches = []
+        self.rate_limit_first = rate_limit_first
+    
+    async def create(self, model, input):
+        if self.rate_limit_first:
+            self.rate_limit_first -= 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            response = httpx.Response(429, request=request, headers={"retry-after": "0"})
+            raise RateLimitError("rate limited", response=response, body=None)
+        self.batches.append(list(input))
+        return SimpleNamespace(data=[
+            SimpleNamespace(embedding=[float(text.split()[-1])]) for text in input
+        ])
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("EMBED_BATCH_MAX_ITEMS", "4")
+    monkeypatch.setenv("EMBED_BATCH_MAX_TOKENS", "10")
+    return OpenAIService()
+
+
+@pytest.mark.asyncio
+async def test_batches_respect_item_and_token_limits_and_keep_order(service):
+    fake = FakeEmbeddings()
+    service._embed_client = SimpleNamespace(embeddings=fake)
+    texts = [f"chunk {i}" for i in range(10)]
+    token_counts = [3, 3, 3, 3, 1, 1, 1, 1, 1, 9]
+    
+    embeddings = await service.generate_embeddings(texts, token_counts=token_counts)
+    
+    assert embeddings == [[float(i)] for i in range(10)]
+    sizes = sorted(len(batch) for batch in fake.batches)
+    assert sizes == [1, 2, 3, 4]
+    for batch in fake.batches:
+        indexes = [int(text.split()[-1]) for text in batch]
+        assert len(batch) <= 4
+        assert sum(token_counts[i] for i in indexes) <= 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_batches_are_retried(service):
+    fake = FakeEmbeddings(rate_limit_first=2)
+    service._embed_client = SimpleNamespace(embeddings=fake)
+    service._embed_backoff = 0.001
+    
+    embeddings = await service.generate_embeddings(["a 1", "b 2"], token_counts=[1, 1])
+    
+    assert embeddings == [[1.0], [2.0]]
@@ -0,0 +1,58 @@
+"""
+Test the persistent embedding cache
+"""
+
+import pytest
+from types import SimpleNamespace
+from services.embedding_cache import EmbeddingCache
+from services.openai_service import OpenAIService
+
+
+def test_cache_roundtrip_and_normalized_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"))
+    key = EmbeddingCache.make_key("Overdraft fee:  $35\n", "text-embedding-3-large")
+    
+    assert EmbeddingCache.make_key("Overdraft fee: $35", "text-embedding-3-large") == key
+    assert EmbeddingCache.make_key("Overdraft fee: $35", "text-embedding-3-small") != key
+    assert EmbeddingCache.make_key("Overdraft fee: $35", "text-embedding-3-large", 256) != key
+    
+    cache.put_many({key: [0.25, -1.5]})
+    assert cache.get_many([key, "missing"]) == {key: [0.25, -1.5]}
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    
+    # Entries persist across reopen
+    cache.close()
+    assert EmbeddingCache(str(tmp_path / "cache.db")).get_many([key]) == {key: [0.25, -1.5]}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(10):
+        cache.put_many({f"k{i}": [float(i)]})
+    cache.get_many(["k0"])  # k0 becomes the most recently used entry
+    cache.put_many({"k10": [10.0]})
+    
+    assert cache.stats()['entries'] <= 10
+    assert "k0" in cache.get_many(["k0"])
+    assert cache.get_many(["k1"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_only_cache_misses_are_embedded(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    service = OpenAIService(embedding_cache=EmbeddingCache(str(tmp_path / "cache.db")))
+    sent = []
+    
+    async def create(model, input):
+        sent.extend(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t))]) for t in input])
+    
+    service._embed_client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    
+    first = await service.generate_embeddings(["alpha", "beta", "alpha"])
+    second = await service.generate_embeddings(["beta", "gamma"])
+    
+    assert first == [[5.0], [4.0], [5.0]]
+    assert second == [[4.0], [5.0]]
+    assert sent == ["alpha", "beta", "gamma"]
@@ -0,0 +1,82 @@
+"""
+Test BM25 keyword retrieval and hybrid fusion
+"""
+
+import pytest
+import pytest_asyncio
+from services.query_service import QueryService
+from services.sparse_index import SparseIndex, reciprocal_rank_fusion, tokenize
+
+CHUNKS = {
+    'f1_0': "Form W-8BEN must be renewed every three years for non-resident accounts.",
+    'f1_1': "Wire transfer fees are waived for premium checking customers.",
+    'f1_2': "Overdraft protection links a savings account to checking.",
+    'f2_0': "Account 4111-2222 was charged a foreign transaction fee.",
+}
+
+
+@pytest_asyncio.fixture
+async def sparse_index(tmp_path):
+    index = SparseIndex(str(tmp_path / "sparse.db"))
+    for file_id in ('f1', 'f2'):
+        ids = [chunk_id for chunk_id in CHUNKS if chunk_id.startswith(file_id)]
+        await index.add_chunks(
+            file_id, ids, [CHUNKS[i] for i in ids],
+            [{'filename': 'a.pdf', 'file_id': file_id, 'content': CHUNKS[i]} for i in ids]
+        )
+    yield index
+    index.close()
+
+
+def test_tokenize_keeps_codes_whole_and_split():
+    terms = tokenize("Form W-8BEN")
+    assert {'form', 'w-8ben', 'w8ben', '8ben'} <= set(terms)
+
+
+@pytest.mark.asyncio
+async def test_bm25_matches_exact_codes(sparse_index):
+    results = await sparse_index.search("w8ben renewal", top_k=2)
+    assert results[0]['id'] == 'f1_0'
+    
+    results = await sparse_index.search("4111-2222", top_k=2)
+    assert [result['id'] for result in results] == ['f2_0']
+    
+    filtered = await sparse_index.search("account", top_k=5, filter={'file_id': 'f2'})
+    assert [result['id'] for result in filtered] == ['f2_0']
+
+
+@pytest.mark.asyncio
+async def test_remove_file_updates_index_incrementally(sparse_index):
+    await sparse_index.remove_file('f1')
+    assert await sparse_index.search("W-8BEN", top_k=5) == []
+    assert sparse_index._doc_count == 1
+    
+    await sparse_index.add_chunks('f1', ['f1_0'], [CHUNKS['f1_0']], [{'file_id': 'f1'}])
+    assert (await sparse_index.search("W-8BEN", top_k=5))[0]['id'] == 'f1_0'
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    dense = [{'id': 'a', 'score': 0.9}, {'id': 'b', 'score': 0.8}]
+    sparse = [{'id': 'b', 'score': 7.0}, {'id': 'c', 'score': 5.0}]
+    fused = reciprocal_rank_fusion([dense, sparse], top_k=3)
+    assert [result['id'] for result in fused] == ['b', 'a', 'c']
+    assert fused[0]['score'] == 0.8
+
+
+@pytest.mark.asyncio
+async def test_hybrid_query_surfaces_keyword_match(sparse_index, openai_service, vector_store):
+    # Dense retrieval misses the chunk whose only match is the form code
+    vector_store.matches = [
+        {'id': chunk_id, 'score': 0.8 - i * 0.1,
+         'metadata': {'filename': 'a.pdf', 'content': CHUNKS[chunk_id]}}
+        for i, chunk_id in enumerate(['f1_1', 'f1_2', 'f2_0'])
+    ]
+    service = QueryService(openai_service, vector_store, sparse_index=sparse_index)
+    
+    result = await service.query("When does my W-8BEN expire?", top_k=3)
+    
+    ids = [source.chunk_id for source in result['sources']]
+    assert 'f1_0' in ids
+    keyword_only = result['sources'][ids.index('f1_0')]
+    assert keyword_only.metadata['retrieval'] == 'sparse'
+    assert keyword_only.similarity_score == 0.0
@@ -0,0 +1,138 @@
+"""
+Test background ingestion job queue
+"""
+
+import asyncio
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from routers.dependencies import get_job_queue
+from services.job_queue import IngestionJobQueue, JobStore
+
+
+class FakeIngestionService:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.release = asyncio.Event()
+        self.calls = []
+    
+    async def ingest_document(self, file_id: str, progress=None, document_id=None, tenant=None):
+        self.calls.append(file_id)
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("embedding quota exceeded")
+        progress({
+            'pages_parsed': 3, 'chunks_total': 7, 'chunks_embedded': 7, 'vectors_upserted': 7
+        })
+        return {'chunks_processed': 7, 'file_id': file_id, 'filename': 'statement.pdf'}
+
+
+async def wait_for_status(queue: IngestionJobQueue, job_id: str, status: str, attempts=100):
+    for _ in range(attempts):
+        job = await queue.get(job_id)
+        if job['status'] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_background_and_reports_progress(tmp_path):
+    service = FakeIngestionService()
+    queue = IngestionJobQueue(service, JobStore(str(tmp_path / "jobs.db")))
+    
+    job = await queue.enqueue("file-1")
+    assert job['status'] == 'queued'
+    
+    # A client retry while the job is in flight returns the same job
+    retry = await queue.enqueue("file-1")
+    assert retry['job_id'] == job['job_id']
+    # The same file as another document, or for another tenant, is a different job
+    other_document = await queue.enqueue("file-1", document_id="statements/2024-03")
+    other_tenant = await queue.enqueue("file-1", tenant="acme")
+    assert len({job['job_id'], other_document['job_id'], other_tenant['job_id']}) == 3
+    retry = await queue.enqueue("file-1", document_id="file-1")
+    assert retry['job_id'] == job['job_id']
+    retry = await queue.enqueue("file-1", tenant="acme")
+    assert retry['job_id'] == other_tenant['job_id']
+    
+    service.release.set()
+    done = await wait_for_status(queue, job['job_id'], 'completed')
+    assert done['progress']['vectors_upserted'] == 7
+    assert done['result']['chunks_processed'] == 7
+    assert service.calls == ["file-1"] * 3
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_records_error(tmp_path):
+    service = FakeIngestionService(fail=True)
+    service.release.set()
+    queue = IngestionJobQueue(service, JobStore(str(tmp_path / "jobs.db")))
+    
+    job = await queue.enqueue("file-2")
+    failed = await wait_for_status(queue, job['job_id'], 'failed')
+    assert "quota" in failed['error']
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_progress_is_written_off_the_event_loop_and_coalesced(tmp_path):
+    class ChattyIngestionService:
+        async def ingest_document(self, file_id, progress=None, document_id=None, tenant=None):
+            for pages in range(1, 51):
+                progress({'pages_parsed': pages})
+            return {'chunks_processed': 0}
+    
+    store = JobStore(str(tmp_path / "jobs.db"))
+    writers = []
+    update = store.update
+    
+    def recording_update(job_id, **fields):
+        writers.append(threading.current_thread())
+        update(job_id, **fields)
+    
+    store.update = recording_update
+    queue = IngestionJobQueue(ChattyIngestionService(), store)
+    job = await queue.enqueue("file-3")
+    done = await wait_for_status(queue, job['job_id'], 'completed')
+    assert done['progress'] == {'pages_parsed': 50}
+    assert threading.main_thread() not in writers
+    # One write for all fifty reports, then the result
+    assert len(writers) == 2
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_only_jobs_with_a_lapsed_lease_are_taken_over(tmp_path, monkeypatch):
+    monkeypatch.setenv('INGEST_JOB_LEASE', '0.3')
+    path = str(tmp_path / "jobs.db")
+    first_service, second_service = FakeIngestionService(), FakeIngestionService()
+    first = IngestionJobQueue(first_service, JobStore(path))
+    second = IngestionJobQueue(second_service, JobStore(path))
+    
+    job = await first.enqueue("file-4")
+    await wait_for_status(first, job['job_id'], 'running')
+    # The first queue is alive and heartbeating, so a second process leaves its job alone
+    await second.start()
+    await asyncio.sleep(0.6)
+    assert second_service.calls == []
+    
+    # Once the first queue's process is gone its lease lapses and the job moves over
+    await first.stop()
+    second_service.release.set()
+    done = await wait_for_status(second, job['job_id'], 'completed', attempts=300)
+    assert done['worker_id'] == second.worker_id
+    assert second_service.calls == ["file-4"]
+    await second.stop()
+
+
+def test_unknown_job_returns_404(tmp_path):
+    queue = IngestionJobQueue(FakeIngestionService(), JobStore(str(tmp_path / "jobs.db")))
+    app.dependency_overrides[get_job_queue] = lambda: queue
+    try:
+        response = TestClient(app).get("/ingest/does-not-exist")
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 404
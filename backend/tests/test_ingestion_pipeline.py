@@ -0,0 +1,179 @@
+"""
+Test the streaming ingestion pipeline
+"""
+
+import io
+import tempfile
+from multiprocessing.shared_memory import SharedMemory
+import pytest
+from services.chunker import Chunker
+from services.ingestion_service import IngestionService
+from services import pdf_extractor
+from services.pdf_extractor import PdfExtractor
+
+
+def make_pdf(pages):
+    """
+    Build a minimal PDF with one line of text per page
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        )
+    ]
+    font_id = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    pdf += f"startxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "statement.pdf"
+    path.write_bytes(make_pdf([f"Page {n} balance {n * 100}" for n in range(1, 8)]))
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_pdf_pages_stream_in_order_across_workers(pdf_path):
+    extractor = PdfExtractor(max_workers=2, pages_per_task=2, max_inflight=2)
+    try:
+        pages = [page async for page in extractor.iter_pages(pdf_path)]
+    finally:
+        extractor.close()
+    
+    assert [number for number, _ in pages] == list(range(1, 8))
+    assert pages[2][1] == "Page 3 balance 300"
+
+
+@pytest.fixture
+def shared_blocks(monkeypatch):
+    """
+    Names of the shared memory blocks the extractor creates
+    """
+    share = pdf_extractor.share_pdf
+    names = []
+    
+    def tracking_share(document):
+        source, shm = share(document)
+        if shm is not None:
+            names.append(shm.name)
+        return source, shm
+    
+    monkeypatch.setattr(pdf_extractor, "share_pdf", tracking_share)
+    return names
+
+
+def assert_released(names):
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
+
+
+@pytest.mark.asyncio
+async def test_in_memory_pdfs_reach_workers_through_shared_memory(shared_blocks):
+    data = make_pdf([f"Page {n}" for n in range(1, 6)])
+    assert pdf_extractor.share_pdf("statement.pdf") == ("statement.pdf", None)
+    extractor = PdfExtractor(max_workers=1, pages_per_task=2)
+    try:
+        pages = [page async for page in extractor.iter_pages(io.BytesIO(data))]
+        
+        # A spooled file not yet on disk is copied block by block
+        spooled = tempfile.SpooledTemporaryFile(max_size=len(data) + 1)
+        spooled.write(data)
+        assert len([page async for page in extractor.iter_pages(spooled)]) == 5
+    finally:
+        extractor.close()
+    
+    assert [text for _, text in pages] == [f"Page {n}" for n in range(1, 6)]
+    # One block per document, shared by every page range and freed after extraction
+    assert len(shared_blocks) == 2
+    assert_released(shared_blocks)
+
+
+@pytest.mark.asyncio
+async def test_shared_memory_is_freed_when_extraction_fails_or_stops(shared_blocks):
+    extractor = PdfExtractor(max_workers=1, pages_per_task=1)
+    try:
+        with pytest.raises(Exception):
+            [page async for page in extractor.iter_pages(io.BytesIO(b"not a pdf"))]
+        
+        pages = extractor.iter_pages(io.BytesIO(make_pdf(["One", "Two", "Three"])))
+        assert (await pages.__anext__())[1] == "One"
+        await pages.aclose()
+    finally:
+        extractor.close()
+    
+    assert len(shared_blocks) == 2
+    assert_released(shared_blocks)
+
+
+@pytest.mark.asyncio
+async def test_ingest_document_embeds_and_upserts_in_groups(
+    pdf_path, monkeypatch, openai_service, vector_store
+):
+    service = IngestionService(openai_service, vector_store, s3_service=object())
+    service.pdf_extractor = PdfExtractor(max_workers=1, pages_per_task=3)
+    service.chunk_group_size = 3
+    
+    async def fake_download(file_id):
+        return {'filename': 'statement.pdf', 'document': pdf_path, 'file_type': 'pdf'}
+    
+    monkeypatch.setattr(service, "_download_file", fake_download)
+    updates = []
+    
+    try:
+        result = await service.ingest_document("file-1", progress=updates.append)
+    finally:
+        service.close()
+    
+    assert result['chunks_processed'] == 7
+    assert [len(ids) for ids, _ in vector_store.upserts] == [3, 3, 1]
+    ids = [i for batch, _ in vector_store.upserts for i in batch]
+    assert len(set(ids)) == 7
+    assert all(
+        meta['document_id'] == "file-1" for _, batch in vector_store.upserts for meta in batch
+    )
+    assert updates[-1]['vectors_upserted'] == 7
+    assert max(update['pages_parsed'] for update in updates) == 7
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_pack_into_token_bounded_chunks(tmp_path, openai_service, vector_store):
+    path = tmp_path / "transactions.csv"
+    rows = "\n".join(f"{n},2024-01-{n % 28 + 1:02d},{n * 1.5}" for n in range(1, 201))
+    path.write_text("id,date,amount\n" + rows + "\n")
+    service = IngestionService(openai_service, vector_store, s3_service=object())
+    service.csv_read_chunksize = 30
+    service.chunkers['csv'] = Chunker(100, 0)
+    
+    try:
+        chunks = [chunk async for chunk in service._extract_csv_text(str(path), "t.csv")]
+    finally:
+        service.close()
+    
+    assert chunks[0]['row_start'] == 1
+    assert chunks[-1]['row_end'] == 200
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk['row_start'] == previous['row_end'] + 1
+    assert all(chunk['tokens'] <= 100 for chunk in chunks)
+    assert chunks[0]['content'].startswith("Row 1:\nid: 1\ndate: 2024-01-02\namount: 1.5\n")
+    assert "\n\nRow 2:\n" in chunks[0]['content']
@@ -0,0 +1,227 @@
+"""
+Test the local vector store backend
+"""
+
+import os
+import asyncio
+import threading
+import numpy as np
+import pytest
+from services import local_vector_store
+from services.local_vector_store import LocalVectorStore, matches_filter
+
+
+def random_vectors(count, dimension=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "vectors"))
+    yield store
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_query_returns_nearest_vectors_with_metadata(store):
+    vectors = random_vectors(50)
+    ids = [f"doc_{i}" for i in range(50)]
+    metadata = [{'file_id': 'a' if i % 2 else 'b', 'page': i} for i in range(50)]
+    await store.upsert_vectors(vectors.tolist(), ids, metadata)
+    
+    results = await store.query_vectors(vectors[7].tolist(), top_k=3)
+    assert results[0]['id'] == 'doc_7'
+    assert results[0]['score'] == pytest.approx(1.0, abs=1e-5)
+    assert results[0]['metadata'] == {'file_id': 'a', 'page': 7}
+    assert results[0]['score'] >= results[1]['score'] >= results[2]['score']
+    
+    filtered = await store.query_vectors(vectors[7].tolist(), top_k=5, filter={'file_id': 'b'})
+    assert len(filtered) == 5
+    assert all(result['metadata']['file_id'] == 'b' for result in filtered)
+
+
+@pytest.mark.asyncio
+async def test_upserts_overwrite_by_id_and_persist(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = random_vectors(3)
+    store = LocalVectorStore(path)
+    await store.upsert_vectors(vectors.tolist(), ['x', 'y', 'z'], [{'v': 1}] * 3)
+    await store.upsert_vectors([vectors[0].tolist()], ['y'], [{'v': 2}])
+    with pytest.raises(ValueError):
+        await store.upsert_vectors([[1.0, 2.0]], ['bad'], [{}])
+    store.close()
+    
+    reopened = LocalVectorStore(path)
+    try:
+        # The update went to a new row and retired the old one
+        assert reopened.count == 4
+        assert int(reopened._alive.values.sum()) == 3
+        results = await reopened.query_vectors(vectors[0].tolist(), top_k=2)
+        assert {result['id'] for result in results} == {'x', 'y'}
+        assert {result['id']: result['metadata']['v'] for result in results}['y'] == 2
+    finally:
+        reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_upserts_leave_query_snapshots_untouched(store):
+    vectors = random_vectors(4)
+    await store.upsert_vectors(vectors[:2].tolist(), ['x', 'y'], [{'v': 1}] * 2)
+    with store._lock:
+        snapshot = (
+            store._alive.values, store._clusters.values, store._ids, store._metadata, store.count
+        )
+    before = np.array(store._matrix[:2])
+    
+    await store.upsert_vectors(vectors[2:].tolist(), ['y', 'z'], [{'v': 2}] * 2)
+    await store.delete_vectors(['x'])
+    alive, clusters, ids, metadata, count = snapshot
+    assert alive.tolist() == [True, True] and clusters.tolist() == [-1, -1]
+    # Ids and metadata are appended in place; a snapshot reads only its first count rows
+    assert store._ids is ids and store._metadata is metadata
+    assert ids[:count] == ['x', 'y'] and metadata[:count] == [{'v': 1}, {'v': 1}]
+    assert np.array_equal(store._matrix[:2], before)
+    
+    results = await store.query_vectors(vectors[2].tolist(), top_k=3)
+    assert [result['id'] for result in results][:1] == ['y']
+    assert {result['id']: result['metadata']['v'] for result in results} == {'y': 2, 'z': 2}
+
+
+@pytest.mark.asyncio
+async def test_ivf_index_finds_nearest_neighbours(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOCAL_VECTOR_IVF_MIN', '500')
+    store = LocalVectorStore(str(tmp_path / "vectors"))
+    vectors = random_vectors(2000, seed=1)
+    try:
+        for start in range(0, 2000, 500):
+            await store.upsert_vectors(
+                vectors[start:start + 500].tolist(),
+                [f"v{i}" for i in range(start, start + 500)],
+                [{'n': i} for i in range(start, start + 500)]
+            )
+        assert store._centroids is not None
+        
+        hits = 0
+        for i in range(0, 2000, 50):
+            results = await store.query_vectors(vectors[i].tolist(), top_k=1)
+            hits += results[0]['id'] == f"v{i}"
+        assert hits == 40
+    finally:
+        store.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('quantization', ['none', 'int8'])
+async def test_tombstones_are_compacted_away(tmp_path, monkeypatch, quantization):
+    monkeypatch.setattr(local_vector_store, '_COMPACT_MIN_DEAD', 1)
+    path = str(tmp_path / "vectors")
+    vectors = random_vectors(10)
+    ids = [f"v{i}" for i in range(10)]
+    store = LocalVectorStore(path, quantization=quantization)
+    await store.upsert_vectors(vectors.tolist(), ids, [{'n': i} for i in range(10)])
+    page_filter = {'n': {'$gte': 4}}
+    await store.query_vectors(vectors[0].tolist(), top_k=10, filter=page_filter)
+    with store._lock:
+        old_matrix, old_count = store._matrix, store.count
+    
+    await store.delete_vectors(ids[:2])
+    assert store.count == 10
+    await store.upsert_vectors(vectors[2:4].tolist(), ids[2:4], [{'n': -1}] * 2)
+    # Four of twelve rows were dead, past the 0.3 ratio
+    assert store.count == 8
+    assert store._ids == ids[4:] + ['v2', 'v3']
+    assert store._rows == {vector_id: row for row, vector_id in enumerate(store._ids)}
+    assert np.allclose(old_matrix[:old_count], LocalVectorStore._normalize(vectors))
+    results = await store.query_vectors(vectors[3].tolist(), top_k=10, filter=page_filter)
+    assert {r['id'] for r in results} == set(ids[4:])
+    store.close()
+    
+    reopened = LocalVectorStore(path, quantization=quantization)
+    try:
+        assert reopened.count == 8 and int(reopened._alive.values.sum()) == 8
+        files = {'vectors-1.f32'}
+        if quantization == 'int8':
+            files |= {'vectors-1.int8', 'scales-1.f32'}
+        assert {name for name in os.listdir(path) if not name.startswith('metadata')} == files
+        results = await reopened.query_vectors(vectors[3].tolist(), top_k=1)
+        assert results[0]['id'] == 'v3' and results[0]['metadata'] == {'n': -1}
+        await reopened.upsert_vectors([vectors[0].tolist()], ['v0'], [{'n': 0}])
+        results = await reopened.query_vectors(vectors[0].tolist(), top_k=1)
+        assert results[0]['id'] == 'v0'
+    finally:
+        reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_ivf_training_does_not_block_queries_or_upserts(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOCAL_VECTOR_IVF_MIN', '100')
+    store = LocalVectorStore(str(tmp_path / "vectors"))
+    vectors = random_vectors(120, seed=4)
+    started, release = threading.Event(), threading.Event()
+    train_ivf = store._train_ivf
+    
+    def blocking_train_ivf(matrix, alive_rows):
+        started.set()
+        assert release.wait(5)
+        return train_ivf(matrix, alive_rows)
+    
+    monkeypatch.setattr(store, '_train_ivf', blocking_train_ivf)
+    try:
+        training = asyncio.create_task(store.upsert_vectors(
+            vectors[:100].tolist(), [f"v{i}" for i in range(100)], [{}] * 100
+        ))
+        assert await asyncio.to_thread(started.wait, 5)
+        # Both run while the centroids are being computed
+        results = await store.query_vectors(vectors[3].tolist(), top_k=1)
+        assert results[0]['id'] == 'v3'
+        await store.upsert_vectors(
+            vectors[100:].tolist(), [f"v{i}" for i in range(100, 120)], [{}] * 20
+        )
+        assert store._centroids is None
+        release.set()
+        await training
+        
+        assert store._centroids is not None
+        assert (store._clusters.values[:120] >= 0).all()
+        results = await store.query_vectors(vectors[110].tolist(), top_k=1)
+        assert results[0]['id'] == 'v110'
+    finally:
+        release.set()
+        store.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('quantization', ['int8', 'binary'])
+async def test_quantized_search_rescores_at_full_precision(tmp_path, quantization):
+    path = str(tmp_path / "vectors")
+    vectors = random_vectors(300, dimension=64, seed=2)
+    ids = [f"v{i}" for i in range(300)]
+    store = LocalVectorStore(path)
+    await store.upsert_vectors(vectors.tolist(), ids, [{'n': i} for i in range(300)])
+    exact = await store.query_vectors(vectors[5].tolist(), top_k=5)
+    store.close()
+    
+    # Codes are built for vectors stored before quantization was enabled
+    store = LocalVectorStore(path, quantization=quantization)
+    try:
+        assert store._codes is not None
+        results = await store.query_vectors(vectors[5].tolist(), top_k=5)
+        assert results[0]['id'] == 'v5'
+        assert results[0]['score'] == pytest.approx(1.0, abs=1e-5)
+        assert [r['id'] for r in results] == [r['id'] for r in exact]
+        
+        noisy = vectors[7] + np.random.default_rng(3).normal(scale=0.05, size=64)
+        await store.upsert_vectors([noisy.tolist()], ['new'], [{'n': -1}])
+        results = await store.query_vectors(noisy.tolist(), top_k=2, filter={'n': {'$gte': 0}})
+        assert results[0]['id'] == 'v7'
+    finally:
+        store.close()
+
+
+def test_filter_operators():
+    metadata = {'type': 'pdf', 'page': 4, 'tags': ['loan', 'kyc']}
+    assert matches_filter(metadata, {'type': {'$in': ['pdf', 'csv']}, 'page': {'$gte': 4}})
+    assert matches_filter(metadata, {'$or': [{'page': {'$lt': 2}}, {'tags': 'kyc'}]})
+    assert not matches_filter(metadata, {'row_start': {'$exists': True}})
+    assert matches_filter(metadata, {'row_start': {'$ne': 3}})
+    assert not matches_filter(metadata, {'$and': [{'type': 'pdf'}, {'page': {'$gt': 10}}]})
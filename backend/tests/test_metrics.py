@@ -0,0 +1,128 @@
+"""
+Test pipeline metrics, the /metrics endpoint and the Server-Timing header
+"""
+
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from main import app
+from services.metrics import MetricsMiddleware, stage
+from services.openai_service import OpenAIService
+from services.pinecone_service import PineconeService
+from services.query_cache import IndexVersion, QueryCache
+from services.query_service import QueryService
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_query_stages_are_exported_and_reported_in_server_timing(
+    tmp_path, monkeypatch, openai_service, pinecone_index
+):
+    monkeypatch.setenv("SERVER_TIMING_ENABLED", "true")
+    pinecone_service = PineconeService(index=pinecone_index)
+    cache = QueryCache(IndexVersion(str(tmp_path / "index_state.db")))
+    service = QueryService(openai_service, pinecone_service, query_cache=cache)
+    
+    api = FastAPI()
+    api.add_middleware(MetricsMiddleware)
+    
+    @api.get("/ask/{topic}")
+    async def ask(topic: str):
+        return await service.query(f"what does a {topic} cost?")
+    
+    embeds = sample('ragledger_stage_duration_seconds_count', pipeline='query', stage='embed')
+    answer_hits = sample('ragledger_cache_lookups_total', cache='answer', result='hit')
+    try:
+        client = TestClient(api)
+        first = client.get("/ask/wire")
+        repeat = client.get("/ask/wire")
+    finally:
+        pinecone_service.close()
+        cache.close()
+    
+    timings = dict(
+        entry.split(";dur=") for entry in first.headers["server-timing"].split(", ")
+    )
+    assert {'embed', 'vector_search', 'context', 'completion', 'total'} <= set(timings)
+    assert float(timings['total']) >= float(timings['completion'])
+    # The repeat is answered from the cache, so only the total is timed
+    assert repeat.json()['cached'] is True
+    assert repeat.headers["server-timing"].startswith("total;dur=")
+    
+    assert sample(
+        'ragledger_stage_duration_seconds_count', pipeline='query', stage='embed'
+    ) == embeds + 1
+    assert sample('ragledger_cache_lookups_total', cache='answer', result='hit') == answer_hits + 1
+    assert sample(
+        'ragledger_http_request_duration_seconds_count',
+        method='GET', route='/ask/{topic}', status='200'
+    ) >= 2
+    
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'ragledger_stage_duration_seconds_bucket{' in response.text
+    assert 'ragledger_vectors_upserted_total' in response.text
+
+
+def test_server_timing_is_off_by_default():
+    api = FastAPI()
+    api.add_middleware(MetricsMiddleware)
+    
+    @api.get("/ping")
+    async def ping():
+        with stage('query', 'embed'):
+            return {'ok': True}
+    
+    errors = sample('ragledger_stage_errors_total', pipeline='query', stage='embed')
+    with pytest.raises(RuntimeError):
+        with stage('query', 'embed'):
+            raise RuntimeError("embedding failed")
+    assert sample('ragledger_stage_errors_total', pipeline='query', stage='embed') == errors + 1
+    
+    response = TestClient(api).get("/ping")
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_openai_token_usage_is_counted(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    service = OpenAIService()
+    
+    class FakeCompletions:
+        async def create(self, stream=False, **kwargs):
+            if not stream:
+                return SimpleNamespace(
+                    choices=[SimpleNamespace(message=SimpleNamespace(content="Yes."))],
+                    usage=SimpleNamespace(prompt_tokens=120, completion_tokens=2)
+                )
+            
+            async def chunks():
+                for delta in ("Wire", " fees", None, " apply."):
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(
+                        content=delta
+                    ))])
+            return chunks()
+    
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    inputs = sample('ragledger_openai_tokens_total', operation='completion', direction='input')
+    outputs = sample('ragledger_openai_tokens_total', operation='completion', direction='output')
+    try:
+        assert await service.generate_answer("fees?", ["Wire fee: $25"]) == "Yes."
+        streamed = [token async for token in service.stream_answer("fees?", ["Wire fee: $25"])]
+    finally:
+        await service.close()
+    
+    assert streamed == ["Wire", " fees", " apply."]
+    # Streamed prompts are counted locally
+    assert sample(
+        'ragledger_openai_tokens_total', operation='completion', direction='input'
+    ) > inputs + 120
+    assert sample(
+        'ragledger_openai_tokens_total', operation='completion', direction='output'
+    ) == outputs + 2 + 3
@@ -0,0 +1,101 @@
+"""
+Test the Pinecone upsert pipeline
+"""
+
+import threading
+import numpy as np
+import pytest
+from pinecone.exceptions import PineconeApiException
+import services.pinecone_service as pinecone_service
+from services.pinecone_service import PineconeService, plan_upsert_batches
+from services.vector_store import PartialUpsertError
+
+
+def fail_upserts(index, transient_failures=0, reject=None):
+    """
+    Fail the index's first upserts with a 503, and reject any batch holding the reject id
+    """
+    upsert = index.upsert
+    lock = threading.Lock()
+    failures = [transient_failures]
+    
+    def failing_upsert(vectors, namespace=None):
+        with lock:
+            if failures[0]:
+                failures[0] -= 1
+                raise PineconeApiException(status=503, reason="unavailable")
+        if reject and any(vector_id == reject for vector_id, _, _ in vectors):
+            raise PineconeApiException(status=400, reason="bad metadata")
+        upsert(vectors, namespace=namespace)
+    
+    index.upsert = failing_upsert
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pinecone_service, 'UPSERT_MIN_BACKOFF', 0)
+
+
+def make_service(index, max_bytes):
+    service = PineconeService(index=index)
+    service.upsert_max_bytes = max_bytes
+    return service
+
+
+def test_batches_respect_request_bytes_and_vector_limits():
+    ids = [f"id-{i}" for i in range(10)]
+    metadata = [{'file_id': 'f'}] * 10
+    # 8 values, fixed overhead, the id and '{"file_id": "f"}'
+    vector_bytes = 8 * 24 + 64 + 4 + 16
+    
+    batches = plan_upsert_batches(ids, metadata, 8, max_bytes=vector_bytes * 3)
+    assert batches == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert plan_upsert_batches(ids, metadata, 8, max_vectors=4) == [(0, 4), (4, 8), (8, 10)]
+    assert plan_upsert_batches([], [], 8) == []
+
+
+@pytest.mark.asyncio
+async def test_numpy_vectors_upsert_concurrently_with_retries(pinecone_index):
+    fail_upserts(pinecone_index, transient_failures=2)
+    service = make_service(pinecone_index, max_bytes=1000)
+    vectors = np.arange(40, dtype=np.float32).reshape(10, 4)
+    ids = [f"id-{i}" for i in range(10)]
+    try:
+        await service.upsert_vectors(vectors, ids, [{'n': i} for i in range(10)])
+    finally:
+        service.close()
+    
+    assert len(pinecone_index.batches) > 1
+    assert sorted(pinecone_index.stored) == sorted(ids)
+    values, metadata = pinecone_index.stored['id-3']
+    assert values == [12.0, 13.0, 14.0, 15.0] and metadata == {'n': 3}
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_reported_by_id(pinecone_index):
+    fail_upserts(pinecone_index, reject='id-4')
+    service = make_service(pinecone_index, max_bytes=1000)
+    vectors = [[float(i)] * 4 for i in range(10)]
+    ids = [f"id-{i}" for i in range(10)]
+    try:
+        with pytest.raises(PartialUpsertError) as error:
+            await service.upsert_vectors(vectors, ids, [{}] * 10)
+    finally:
+        service.close()
+    
+    failed = error.value.failed_ids
+    assert 'id-4' in failed and len(failed) < len(ids)
+    assert sorted(failed + list(pinecone_index.stored)) == sorted(ids)
+
+
+@pytest.mark.asyncio
+async def test_metadata_updates_keep_values_and_other_fields(pinecone_index):
+    service = make_service(pinecone_index, 10_000)
+    await service.upsert_vectors(
+        np.ones((3, 4), dtype=np.float32), ['a', 'b', 'c'], [{'file_id': 'f1', 'page': 1}] * 3
+    )
+    await service.update_metadata(['a', 'c'], {'file_id': 'f2', 'uploaded_at': 1700000000})
+    assert pinecone_index.stored['a'] == (
+        [1.0] * 4, {'file_id': 'f2', 'page': 1, 'uploaded_at': 1700000000}
+    )
+    assert pinecone_index.stored['b'][1] == {'file_id': 'f1', 'page': 1}
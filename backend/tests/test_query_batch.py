@@ -0,0 +1,108 @@
+"""
+Test batched queries and the NDJSON batch endpoint
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from routers.dependencies import get_query_service
+from services.query_service import QueryService
+
+client = TestClient(app)
+
+
+@pytest.mark.asyncio
+async def test_batch_embeds_once_and_yields_in_completion_order(
+    monkeypatch, openai_service, vector_store
+):
+    monkeypatch.setenv('BATCH_QUERY_CONCURRENCY', '2')
+    in_flight, max_in_flight = 0, 0
+    
+    async def generate_answer(query, context):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            # Longer questions take longer to answer
+            await asyncio.sleep(len(query) / 1000)
+            if "fail" in query:
+                raise RuntimeError("completion failed")
+            return f"answer to {query}"
+        finally:
+            in_flight -= 1
+    
+    async def query_vectors(
+        query_vector, top_k=5, filter=None, include_values=False, namespace=None
+    ):
+        # Each question retrieves a chunk named after its embedding, i.e. its length
+        return [{
+            'id': f"f1_{int(query_vector[0])}",
+            'score': 0.9,
+            'metadata': {'filename': 'fees.pdf', 'content': 'Overdraft fee: $35'}
+        }]
+    
+    openai_service.generate_answer = generate_answer
+    vector_store.query_vectors = query_vectors
+    service = QueryService(openai_service=openai_service, vector_store=vector_store)
+    queries = [
+        "What is the overdraft fee on a checking account?",
+        "Wire fee?",
+        "Wire fee?",
+        "Why would this fail?",
+        "What is the monthly maintenance fee?"
+    ]
+    
+    results = [result async for result in await service.query_batch(queries, top_k=1)]
+    
+    assert openai_service.embedding_calls == [[
+        queries[0], queries[1], queries[3], queries[4]
+    ]]
+    assert max_in_flight == 2
+    assert sorted(result['index'] for result in results) == list(range(len(queries)))
+    # The short question finishes before the long one queued ahead of it
+    assert results[0]['index'] == 1
+    failed = [result for result in results if 'error' in result]
+    assert [result['index'] for result in failed] == [3]
+    answered = {result['index']: result for result in results if 'error' not in result}
+    assert answered[1]['answer'] == "answer to Wire fee?"
+    assert answered[1]['sources'][0].chunk_id == f"f1_{len('Wire fee?')}"
+
+
+class FakeQueryService:
+    async def query_batch(self, queries, top_k=5, filters=None, tenant=None):
+        async def results():
+            for index in reversed(range(len(queries))):
+                yield {
+                    'index': index,
+                    'query': queries[index],
+                    'answer': f"answer {index}",
+                    'sources': [],
+                    'cached': False
+                }
+        return results()
+
+
+def test_batch_endpoint_streams_ndjson():
+    app.dependency_overrides[get_query_service] = lambda: FakeQueryService()
+    try:
+        response = client.post("/query/batch", json={"queries": ["a", "b", "c"]})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['index'] for line in lines] == [2, 1, 0]
+    assert lines[0]['answer'] == "answer 2"
+
+
+def test_batch_endpoint_rejects_empty_batch():
+    app.dependency_overrides[get_query_service] = lambda: FakeQueryService()
+    try:
+        response = client.post("/query/batch", json={"queries": []})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 422
@@ -0,0 +1,43 @@
+"""
+Test query embedding and answer caching
+"""
+
+import pytest
+from services.query_cache import IndexVersion, QueryCache
+from services.query_service import QueryService
+
+
+@pytest.fixture
+def services(tmp_path, openai_service, vector_store):
+    cache = QueryCache(IndexVersion(str(tmp_path / "index_state.db")))
+    query_service = QueryService(openai_service, vector_store, query_cache=cache)
+    return query_service, openai_service, vector_store, cache
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_is_served_from_cache(services):
+    query_service, openai_service, vector_store, _ = services
+    
+    first = await query_service.query("What is the overdraft fee?")
+    second = await query_service.query("  what is the OVERDRAFT fee ")
+    
+    assert first['cached'] is False
+    assert second['cached'] is True
+    assert second['answer'] == first['answer']
+    assert (len(openai_service.embedding_calls), len(vector_store.queries)) == (1, 1)
+    assert len(openai_service.contexts) == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_forces_fresh_retrieval_and_answer(services):
+    query_service, openai_service, vector_store, cache = services
+    
+    await query_service.query("What is the overdraft fee?")
+    cache.invalidate("file-1")
+    result = await query_service.query("What is the overdraft fee?")
+    
+    assert result['cached'] is False
+    assert len(vector_store.queries) == 2
+    assert len(openai_service.contexts) == 2
+    # The query embedding doesn't depend on indexed documents, so it stays cached
+    assert len(openai_service.embedding_calls) == 1
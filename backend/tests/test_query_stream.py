@@ -0,0 +1,44 @@
+"""
+Test streaming query endpoint
+"""
+
+import json
+from fastapi.testclient import TestClient
+from main import app
+from routers.dependencies import get_query_service
+
+client = TestClient(app)
+
+
+class FakeQueryService:
+    async def query_stream(self, query: str, top_k: int = 5, filters=None, tenant=None):
+        yield {'event': 'sources', 'data': {'query': query, 'sources': []}}
+        for token in ["Overdraft ", "fee ", "is $35."]:
+            yield {'event': 'token', 'data': {'token': token}}
+        yield {'event': 'done', 'data': {'query': query, 'answer': "Overdraft fee is $35."}}
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_query_stream_emits_sources_tokens_and_done():
+    """
+    Test that /query/stream sends sources first, then tokens, then a summary
+    """
+    app.dependency_overrides[get_query_service] = lambda: FakeQueryService()
+    try:
+        response = client.post("/query/stream", json={"query": "What is the overdraft fee?"})
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["sources", "token", "token", "token", "done"]
+    tokens = "".join(data['token'] for name, data in events if name == "token")
+    assert tokens == events[-1][1]['answer']
@@ -0,0 +1,103 @@
+"""
+Test MMR and cross-encoder re-ranking and the latency budget fallback
+"""
+
+import time
+import numpy as np
+import pytest
+from services.local_vector_store import LocalVectorStore
+from services.query_service import QueryService
+from services.reranker import Reranker
+
+
+def candidates(vectors):
+    return [
+        {'id': f"c{i}", 'score': 0.0, 'metadata': {}, 'text': f"chunk {i}", 'values': vector}
+        for i, vector in enumerate(vectors)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_mmr_skips_near_duplicates_of_chosen_chunks():
+    query = [1.0, 0.0, 0.0]
+    ranked = candidates([
+        [0.95, 0.31, 0.0],
+        [0.94, 0.33, 0.01],  # near copy of c0
+        [0.9, 0.0, 0.43],
+    ])
+    reranker = Reranker(mode='mmr')
+    reranker.mmr_lambda = 0.5
+    
+    picked = await reranker.rerank("fees", query, ranked, top_k=2)
+    
+    assert [c['id'] for c in picked] == ['c0', 'c2']
+
+
+@pytest.mark.asyncio
+async def test_cross_encoder_orders_by_model_score():
+    class FakeCrossEncoder:
+        def predict(self, pairs):
+            return [len(text) for _, text in pairs]
+    
+    reranker = Reranker(mode='cross-encoder')
+    reranker._model = FakeCrossEncoder()
+    ranked = [
+        {'id': 'short', 'text': 'fee'},
+        {'id': 'long', 'text': 'overdraft fee schedule'},
+        {'id': 'mid', 'text': 'wire fee'}
+    ]
+    
+    picked = await reranker.rerank("fees", None, ranked, top_k=2)
+    
+    assert [c['id'] for c in picked] == ['long', 'mid']
+
+
+@pytest.mark.asyncio
+async def test_slow_rerank_keeps_retrieval_order(monkeypatch):
+    monkeypatch.setenv('RERANK_TIMEOUT_MS', '20')
+    reranker = Reranker(mode='mmr')
+    monkeypatch.setattr(
+        reranker, '_mmr', lambda query_vector, ranked, top_k: time.sleep(0.5) or ranked[::-1]
+    )
+    ranked = candidates([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+    
+    started = time.perf_counter()
+    picked = await reranker.rerank("fees", [1.0, 0.0], ranked, top_k=2)
+    
+    assert time.perf_counter() - started < 0.3
+    assert [c['id'] for c in picked] == ['c0', 'c1']
+
+
+@pytest.mark.asyncio
+async def test_query_service_reranks_over_fetched_candidates(
+    tmp_path, monkeypatch, openai_service
+):
+    monkeypatch.setenv('RERANK_CANDIDATES', '10')
+    # Ordering, not latency, is under test; a GC pause must not trigger the fallback
+    monkeypatch.setenv('RERANK_TIMEOUT_MS', '5000')
+    store = LocalVectorStore(str(tmp_path))
+    rng = np.random.default_rng(0)
+    base = np.array([1.0, 0.0, 0.0, 0.0])
+    vectors = [base + rng.normal(scale=0.01, size=4) for _ in range(8)]
+    vectors.append(np.array([0.8, 0.6, 0.0, 0.0]))
+    ids = [f"f1_{i}" for i in range(len(vectors))]
+    await store.upsert_vectors(
+        [v.tolist() for v in vectors], ids,
+        [{'file_id': 'f1', 'content': f"chunk {i}"} for i in range(len(vectors))]
+    )
+    
+    async def generate_embeddings(texts, token_counts=None):
+        return [base.tolist() for _ in texts]
+    
+    openai_service.generate_embeddings = generate_embeddings
+    reranker = Reranker(mode='mmr')
+    reranker.mmr_lambda = 0.5
+    service = QueryService(openai_service=openai_service, vector_store=store, reranker=reranker)
+    
+    _, sources, _ = await service._retrieve("fees", top_k=2)
+    
+    # The dissimilar chunk ranks last by similarity but is picked second for diversity
+    assert len(sources) == 2
+    assert sources[1].chunk_id == 'f1_8'
+    store.close()
+    reranker.close()
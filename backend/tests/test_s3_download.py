@@ -0,0 +1,52 @@
+"""
+Test in-memory S3 downloads and upload-record lookups
+"""
+
+import io
+import pytest
+from services.ingestion_service import IngestionService
+from services.s3_service import S3Service
+from services.upload_registry import UploadRegistry
+
+
+@pytest.mark.asyncio
+async def test_large_objects_download_as_ordered_ranges(s3_client):
+    data = bytes(range(256)) * 40
+    s3_client.objects['documents/f/big.csv'] = data
+    service = S3Service(client=s3_client, bucket='test')
+    service.range_threshold = 1024
+    service.range_part_size = 1000
+    service.spool_max_memory = 4096
+    
+    try:
+        buffer = await service.open_object('documents/f/big.csv')
+        assert not isinstance(buffer, io.BytesIO)
+        assert buffer.read() == data
+        buffer.close()
+    finally:
+        service.close()
+    
+    ranges = [call[1] for call in s3_client.calls if call[0] == 'get']
+    assert len(ranges) == 11
+    assert ranges[-1] == f"bytes=10000-{len(data) - 1}"
+
+
+@pytest.mark.asyncio
+async def test_ingestion_uses_upload_record_instead_of_listing(tmp_path, s3_client):
+    s3_client.objects['documents/f1/ledger.csv'] = b"id,amount\n1,10\n2,20\n"
+    registry = UploadRegistry(str(tmp_path / "uploads.db"))
+    registry.record('f1', 'documents/f1/ledger.csv', 'ledger.csv', 'csv', size=21)
+    s3_service = S3Service(client=s3_client, bucket='test')
+    service = IngestionService(object(), object(), s3_service, upload_registry=registry)
+    
+    try:
+        info = await service._download_file('f1')
+        chunks = [chunk async for chunk in service._extract_csv_text(info['document'], 'l.csv')]
+    finally:
+        service.close()
+        s3_service.close()
+        registry.close()
+    
+    assert isinstance(info['document'], io.BytesIO)
+    assert [call[0] for call in s3_client.calls] == ['get']
+    assert chunks[0]['content'] == "Row 1:\nid: 1\namount: 10\n\nRow 2:\nid: 2\namount: 20\n"
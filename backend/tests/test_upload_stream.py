@@ -0,0 +1,114 @@
+"""
+Test streaming multipart uploads
+"""
+
+import hashlib
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from routers.dependencies import get_s3_service, get_upload_registry
+from services.s3_service import S3Service, UploadTooLarge
+from services.upload_registry import UploadRegistry
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def upload_client(tmp_path, s3_client):
+    s3_service = S3Service(client=s3_client, bucket='test')
+    registry = UploadRegistry(str(tmp_path / "uploads.db"))
+    app.dependency_overrides[get_s3_service] = lambda: s3_service
+    app.dependency_overrides[get_upload_registry] = lambda: registry
+    yield TestClient(app), s3_client, registry
+    app.dependency_overrides.clear()
+    s3_service.close()
+    registry.close()
+
+
+def test_large_upload_streams_as_multipart(upload_client):
+    client, s3_client, registry = upload_client
+    content = bytes(range(256)) * (11 * MB // 256)
+    
+    response = client.post("/upload", files={'file': ('ledger.pdf', content, 'application/pdf')})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data['size'] == len(content)
+    assert data['content_hash'] == hashlib.sha256(content).hexdigest()
+    key = f"documents/{data['file_id']}/ledger.pdf"
+    assert sorted(s3_client.parts[key]) == [1, 2]
+    assert s3_client.objects[key] == content
+    assert registry.get(data['file_id'])['content_hash'] == data['content_hash']
+
+
+def test_small_upload_uses_single_put(upload_client):
+    client, s3_client, _ = upload_client
+    
+    response = client.post("/upload", files={'file': ('ledger.csv', b"id,amount\n1,5\n")})
+    
+    assert response.status_code == 200
+    assert not s3_client.parts
+    assert list(s3_client.objects.values()) == [b"id,amount\n1,5\n"]
+
+
+def test_upload_over_limit_is_rejected(upload_client, monkeypatch):
+    client, s3_client, _ = upload_client
+    # Within the Content-Length slack, so the limit trips while streaming
+    monkeypatch.setattr("routers.upload.UPLOAD_MAX_BYTES", 12 * MB - 1024)
+    
+    response = client.post("/upload", files={'file': ('big.pdf', b"x" * (12 * MB))})
+    
+    assert response.status_code == 413
+    assert not s3_client.objects
+    
+    monkeypatch.setattr("routers.upload.UPLOAD_MAX_BYTES", 6 * MB)
+    response = client.post("/upload", files={'file': ('big.pdf', b"x" * (12 * MB))})
+    
+    assert response.status_code == 413
+    assert not s3_client.objects
+
+
+@pytest.mark.asyncio
+async def test_writer_aborts_started_multipart_upload(s3_client):
+    s3_service = S3Service(client=s3_client, bucket='test')
+    writer = s3_service.open_multipart_upload('documents/f/big.pdf', max_size=10 * MB)
+    
+    try:
+        await writer.write(b"x" * (9 * MB))
+        with pytest.raises(UploadTooLarge):
+            await writer.write(b"x" * (2 * MB))
+        await writer.abort()
+    finally:
+        s3_service.close()
+    
+    assert s3_client.aborted == ['documents/f/big.pdf']
+    assert not s3_client.objects
+
+
+def test_unsupported_file_type_is_rejected(upload_client):
+    client, s3_client, _ = upload_client
+    
+    response = client.post("/upload", files={'file': ('notes.txt', b"hello")})
+    
+    assert response.status_code == 400
+    assert not s3_client.objects
+
+
+def test_truncated_upload_is_rejected_and_aborted(upload_client):
+    client, s3_client, registry = upload_client
+    boundary = "ragledger-boundary"
+    head = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="ledger.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    content = b"x" * (12 * MB)
+    headers = {'content-type': f"multipart/form-data; boundary={boundary}"}
+    
+    # Cut off inside the file part, then before the closing boundary; both after a part was sent
+    for body in (head + content[:10 * MB], head + content + f"\r\n--{boundary}\r\n".encode()):
+        response = client.post("/upload", content=body, headers=headers)
+        assert response.status_code == 400
+    
+    assert not s3_client.objects
+    assert len(s3_client.aborted) == 2
@@ -5,9 +5,10 @@ interface ResultsViewProps {
   answer: string
   sources: Source[]
   query: string
+  streaming?: boolean
 }
 
-export default function ResultsView({ answer, sources, query }: ResultsViewProps) {
+export default function ResultsView({ answer, sources, query, streaming = false }: ResultsViewProps) {
   const getScoreColor = (score: number) => {
     if (score >= 0.8) return 'text-green-600 bg-green-50'
     if (score >= 0.6) return 'text-yellow-600 bg-yellow-50'
@@ -26,7 +27,12 @@ export default function ResultsView({ answer, sources, query }: ResultsViewProps
       <div className="bg-white rounded-lg shadow-md p-6">
         <h3 className="text-lg font-semibold text-gray-800 mb-4">Answer</h3>
         <div className="prose max-w-none">
-          <p className="text-gray-700 whitespace-pre-wrap">{answer}</p>
+          <p className="text-gray-700 whitespace-pre-wrap">
+            {answer}
+            {streaming && (
+              <span className="inline-block w-2 h-4 ml-0.5 align-middle bg-gray-400 animate-pulse" />
+            )}
+          </p>
         </div>
       </div>
 
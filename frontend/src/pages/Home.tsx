@@ -1,6 +1,6 @@
 import { useState } from 'react'
 import FileUpload from '../components/FileUpload'
-import { UploadResponse } from '../utils/api'
+import { IngestJob, UploadResponse } from '../utils/api'
 import { CheckCircle, AlertCircle } from 'lucide-react'
 import { api } from '../utils/api'
 
@@ -9,19 +9,21 @@ export default function Home() {
   const [ingesting, setIngesting] = useState(false)
   const [ingestStatus, setIngestStatus] = useState<'idle' | 'success' | 'error'>('idle')
   const [ingestMessage, setIngestMessage] = useState('')
+  const [ingestJob, setIngestJob] = useState<IngestJob | null>(null)
 
   const handleUploadSuccess = async (response: UploadResponse) => {
     setUploadResponse(response)
     setIngestStatus('idle')
     setIngestMessage('')
+    setIngestJob(null)
 
     // Automatically trigger ingestion
     setIngesting(true)
     try {
-      const ingestResponse = await api.ingestFile(response.file_id)
+      const job = await api.ingestFileAndWait(response.file_id, setIngestJob)
       setIngestStatus('success')
       setIngestMessage(
-        `Document ingested successfully! ${ingestResponse.chunks_processed} chunks processed.`
+        `Document ingested successfully! ${job.chunks_processed ?? 0} chunks processed.`
       )
     } catch (error: any) {
       const errorMessage = error.response?.data?.detail || error.message || 'Ingestion failed'
@@ -55,6 +57,15 @@ export default function Home() {
             <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-blue-600"></div>
             <span>Processing and ingesting document...</span>
           </div>
+          {ingestJob && (
+            <div className="mt-2 text-sm text-blue-700">
+              {ingestJob.status === 'queued'
+                ? 'Waiting for an ingestion worker...'
+                : `${ingestJob.progress.pages_parsed} pages parsed, ` +
+                  `${ingestJob.progress.chunks_embedded}/${ingestJob.progress.chunks_total} chunks embedded, ` +
+                  `${ingestJob.progress.vectors_upserted} vectors stored`}
+            </div>
+          )}
         </div>
       )}
 
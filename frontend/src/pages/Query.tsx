@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import SearchBox from '../components/SearchBox'
 import ResultsView from '../components/ResultsView'
 import { api, QueryResponse } from '../utils/api'
@@ -7,22 +7,53 @@ import { AlertCircle } from 'lucide-react'
 export default function Query() {
   const [queryResponse, setQueryResponse] = useState<QueryResponse | null>(null)
   const [loading, setLoading] = useState(false)
+  const [streaming, setStreaming] = useState(false)
   const [error, setError] = useState<string | null>(null)
+  const abortRef = useRef<AbortController | null>(null)
+
+  useEffect(() => () => abortRef.current?.abort(), [])
 
   const handleSearch = async (query: string) => {
+    abortRef.current?.abort()
+    const controller = new AbortController()
+    abortRef.current = controller
+
     setLoading(true)
     setError(null)
     setQueryResponse(null)
 
     try {
-      const response = await api.query(query, 5)
-      setQueryResponse(response)
+      await api.queryStream(
+        query,
+        {
+          onSources: (sources) => {
+            setQueryResponse({ query, answer: '', sources })
+            setStreaming(true)
+          },
+          onToken: (token) => {
+            setQueryResponse((current) =>
+              current ? { ...current, answer: current.answer + token } : current
+            )
+          },
+          onDone: (summary) => {
+            setQueryResponse((current) =>
+              current ? { ...current, answer: summary.answer } : current
+            )
+          },
+        },
+        5,
+        controller.signal
+      )
     } catch (err: any) {
+      if (err.name === 'AbortError') return
       const errorMessage = err.response?.data?.detail || err.message || 'Query failed'
       setError(errorMessage)
       console.error('Query error:', err)
     } finally {
-      setLoading(false)
+      if (abortRef.current === controller) {
+        setLoading(false)
+        setStreaming(false)
+      }
     }
   }
 
@@ -51,6 +82,7 @@ export default function Query() {
           answer={queryResponse.answer}
           sources={queryResponse.sources}
           query={queryResponse.query}
+          streaming={streaming}
         />
       )}
 
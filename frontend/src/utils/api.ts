@@ -13,11 +13,26 @@ export interface UploadResponse {
   message: string
   file_id: string
   filename: string
+  size?: number
+  content_hash?: string
 }
 
-export interface IngestResponse {
-  message: string
-  chunks_processed: number
+export interface IngestProgress {
+  pages_parsed: number
+  chunks_total: number
+  chunks_embedded: number
+  vectors_upserted: number
+}
+
+export interface IngestJob {
+  job_id: string
+  file_id: string
+  status: 'queued' | 'running' | 'completed' | 'failed'
+  progress: IngestProgress
+  chunks_processed?: number
+  error?: string
+  created_at: string
+  updated_at: string
 }
 
 export interface QueryResponse {
@@ -35,12 +50,25 @@ export interface Source {
   metadata?: Record<string, any>
 }
 
+export interface QueryStreamDone {
+  query: string
+  answer: string
+  sources_count: number
+  elapsed_ms: number
+}
+
+export interface QueryStreamHandlers {
+  onSources?: (sources: Source[]) => void
+  onToken?: (token: string) => void
+  onDone?: (summary: QueryStreamDone) => void
+}
+
 export interface HealthResponse {
   status: string
   version: string
   services: {
     openai: string
-    pinecone: string
+    vector_store: string
     s3: string
   }
 }
@@ -64,12 +92,37 @@ export const api = {
     return response.data
   },
 
-  // Ingest file
-  async ingestFile(fileId: string): Promise<IngestResponse> {
+  // Queue a file for ingestion
+  async ingestFile(fileId: string): Promise<IngestJob> {
     const response = await apiClient.post('/ingest', { file_id: fileId })
     return response.data
   },
 
+  // Ingestion job status
+  async getIngestJob(jobId: string): Promise<IngestJob> {
+    const response = await apiClient.get(`/ingest/${jobId}`)
+    return response.data
+  },
+
+  // Queue a file and poll until its job finishes
+  async ingestFileAndWait(
+    fileId: string,
+    onProgress?: (job: IngestJob) => void,
+    pollIntervalMs: number = 1000
+  ): Promise<IngestJob> {
+    let job = await api.ingestFile(fileId)
+    onProgress?.(job)
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, pollIntervalMs))
+      job = await api.getIngestJob(job.job_id)
+      onProgress?.(job)
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Ingestion failed')
+    }
+    return job
+  },
+
   // Query
   async query(question: string, topK: number = 5): Promise<QueryResponse> {
     const response = await apiClient.post('/query', {
@@ -78,6 +131,61 @@ export const api = {
     })
     return response.data
   },
+
+  // Query with the answer streamed as Server-Sent Events
+  async queryStream(
+    question: string,
+    handlers: QueryStreamHandlers,
+    topK: number = 5,
+    signal?: AbortSignal
+  ): Promise<void> {
+    const response = await fetch(`${API_BASE_URL}/query/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ query: question, top_k: topK }),
+      signal,
+    })
+
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => null)
+      throw new Error(body?.detail || `Query failed with status ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    const dispatch = (block: string) => {
+      let event = 'message'
+      let data = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) return
+      const payload = JSON.parse(data)
+      if (event === 'sources') handlers.onSources?.(payload.sources)
+      else if (event === 'token') handlers.onToken?.(payload.token)
+      else if (event === 'done') handlers.onDone?.(payload)
+      else if (event === 'error') throw new Error(payload.detail || 'Query failed')
+    }
+
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      let boundary = buffer.indexOf('\n\n')
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary))
+        buffer = buffer.slice(boundary + 2)
+        boundary = buffer.indexOf('\n\n')
+      }
+    }
+    if (buffer.trim()) dispatch(buffer)
+  },
 }
 
 export default api
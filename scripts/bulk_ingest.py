@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Bulk ingestion script: ingest a directory or manifest of documents through a staged pipeline
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from services.local_db import connect, data_path
+
+SUPPORTED_TYPES = ('pdf', 'csv')
+READ_SIZE = 8 * 1024 * 1024
+
+STATUS_UPLOADED = 'uploaded'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def hash_file(path: str) -> Tuple[int, str]:
+    """
+    Size and SHA-256 hex digest of a file
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+def find_files(inputs: List[str], manifest: Optional[str] = None) -> List[str]:
+    """
+    Supported files under the given files and directories, plus those listed in a manifest
+    (one path per line; blank lines and # comments are ignored)
+    """
+    candidates = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates.extend(str(path) for path in sorted(Path(item).rglob('*')))
+        else:
+            candidates.append(item)
+    if manifest:
+        with open(manifest, encoding='utf-8') as f:
+            candidates.extend(
+                line.strip() for line in f if line.strip() and not line.startswith('#')
+            )
+    
+    paths = []
+    for path in dict.fromkeys(candidates):
+        if os.path.isfile(path) and path.rsplit('.', 1)[-1].lower() in SUPPORTED_TYPES:
+            paths.append(path)
+    return paths
+
+
+class Checkpoint:
+    """
+    SQLite record of each file's progress, keyed by content hash
+    Files already ingested are skipped even if renamed or copied; files that were uploaded but
+    not fully ingested resume at extraction without uploading again
+    """
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                content_hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                file_id TEXT,
+                s3_key TEXT,
+                size INTEGER,
+                status TEXT NOT NULL,
+                chunks INTEGER,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+    
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM files WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def mark(self, content_hash: str, path: str, status: str, **fields):
+        """
+        Update a file's status; fields not given keep their previous values
+        """
+        record = {
+            **(self.get(content_hash) or {}),
+            **fields,
+            'content_hash': content_hash,
+            'path': path,
+            'status': status,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+        columns = [
+            'content_hash', 'path', 'file_id', 's3_key', 'size', 'status', 'chunks', 'error',
+            'updated_at'
+        ]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO files ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [record.get(column) for column in columns]
+            )
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Stats:
+    """
+    Progress and throughput counters for a run
+    """
+    
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.started = time.perf_counter()
+        self.files = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.tokens = 0
+    
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"files {self.files + self.skipped + self.failed}/{self.total_files} "
+            f"(ingested {self.files}, skipped {self.skipped}, failed {self.failed}) | "
+            f"{self.files / elapsed:.2f} files/s, {self.chunks / elapsed:.1f} chunks/s, "
+            f"{self.tokens / elapsed:.0f} tokens/s | {elapsed:.1f}s"
+        )
+
+
+class BulkIngester:
+    """
+    Staged pipeline: upload -> extract -> embed -> upsert
+    Each stage has its own workers; bounded queues between stages apply backpressure, so a slow
+    stage holds back the ones before it instead of piling chunks up in memory. Files are
+    extracted from the local copy rather than downloaded back from S3.
+    """
+    
+    def __init__(
+        self,
+        ingestion_service,
+        s3_service,
+        upload_registry,
+        checkpoint: Checkpoint,
+        workers: Optional[Dict[str, int]] = None,
+        queue_size: int = 8,
+        tenant: Optional[str] = None
+    ):
+        self.ingestion_service = ingestion_service
+        self.s3_service = s3_service
+        self.upload_registry = upload_registry
+        self.checkpoint = checkpoint
+        self.workers = {'upload': 4, 'extract': 2, 'embed': 4, 'upsert': 2, **(workers or {})}
+        self.queue_size = queue_size
+        self.tenant = tenant
+        self.stats = Stats(0)
+        self._started = set()
+    
+    async def run(self, paths: List[str]) -> Stats:
+        """
+        Ingest every path, returning the run's counters
+        """
+        self.stats = Stats(len(paths))
+        files: asyncio.Queue = asyncio.Queue()
+        for path in paths:
+            files.put_nowait(path)
+        
+        stages = [
+            (self._upload_worker, self.workers['upload']),
+            (self._extract_worker, self.workers['extract']),
+            (self._embed_worker, self.workers['embed']),
+            (self._upsert_worker, self.workers['upsert'])
+        ]
+        queues = [files] + [asyncio.Queue(maxsize=self.queue_size) for _ in stages[1:]] + [None]
+        running = [
+            [asyncio.create_task(worker(queues[i], queues[i + 1])) for _ in range(count)]
+            for i, (worker, count) in enumerate(stages)
+        ]
+        try:
+            # When a stage's workers are done, tell each worker of the next stage to stop
+            for i, tasks in enumerate(running):
+                await asyncio.gather(*tasks)
+                if i + 1 < len(running):
+                    for _ in running[i + 1]:
+                        await queues[i + 1].put(None)
+        finally:
+            for tasks in running:
+                for task in tasks:
+                    task.cancel()
+        return self.stats
+    
+    async def _upload_worker(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while not inbox.empty():
+            path = inbox.get_nowait()
+            job = await self._start_file(path)
+            if job is not None:
+                await outbox.put(job)
+    
+    async def _start_file(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Hash a file, skip it if it was already ingested, otherwise upload it (unless an
+        earlier run did) and return its job
+        """
+        content_hash = None
+        try:
+            size, content_hash = await asyncio.to_thread(hash_file, path)
+            record = self.checkpoint.get(content_hash)
+            if content_hash in self._started or (record and record['status'] == STATUS_DONE):
+                self.stats.skipped += 1
+                return None
+            self._started.add(content_hash)
+            
+            filename = os.path.basename(path)
+            file_type = filename.rsplit('.', 1)[-1].lower()
+            if record and record['s3_key']:
+                file_id, s3_key = record['file_id'], record['s3_key']
+            else:
+                file_id = str(uuid.uuid4())
+                s3_key = f"documents/{file_id}/{filename}"
+                await self._upload(path, s3_key, file_id, filename, file_type)
+                self.upload_registry.record(
+                    file_id, s3_key, filename, file_type, size=size, content_hash=content_hash
+                )
+                self.checkpoint.mark(
+                    content_hash, path, STATUS_UPLOADED, file_id=file_id, s3_key=s3_key,
+                    size=size, error=None
+                )
+            upload = self.upload_registry.get(file_id)
+            return {
+                'path': path,
+                'content_hash': content_hash,
+                # A revised file at the same path replaces the previous version's chunks
+                'document_id': os.path.abspath(path),
+                'file_id': file_id,
+                'filename': filename,
+                'file_type': file_type,
+                'uploaded_at': (
+                    int(datetime.fromisoformat(upload['created_at']).timestamp())
+                    if upload else None
+                ),
+                'chunks': 0,
+                'pending': 0,
+                'extracted': False,
+                'error': None
+            }
+        except Exception as e:
+            print(f"Failed {path}: {e}", file=sys.stderr)
+            self.stats.failed += 1
+            if content_hash is not None:
+                self.checkpoint.mark(content_hash, path, STATUS_FAILED, error=str(e))
+            return None
+    
+    async def _upload(self, path: str, s3_key: str, file_id: str, filename: str, file_type: str):
+        writer = self.s3_service.open_multipart_upload(
+            s3_key,
+            ContentType=f"application/{file_type}",
+            Metadata={'original_filename': filename, 'file_id': file_id, 'file_type': file_type}
+        )
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    data = await asyncio.to_thread(f.read, READ_SIZE)
+                    if not data:
+                        break
+                    await writer.write(data)
+            await writer.complete()
+        except BaseException:
+            await writer.abort()
+            raise
+    
+    async def _extract_worker(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        service = self.ingestion_service
+        while (job := await inbox.get()) is not None:
+            try:
+                chunks = service.extract_chunks(job['path'], job['filename'], job['file_type'])
+                job['version'] = await service.begin_document(
+                    job['document_id'], job['file_id'], job['filename'], job['file_type'],
+                    tenant=self.tenant, uploaded_at=job['uploaded_at']
+                )
+                async for group in service.group_chunks(chunks):
+                    if job['error']:
+                        break
+                    prepared = service.prepare_group(job['version'], group)
+                    job['chunks'] += len(group)
+                    if not prepared['ids']:
+                        continue
+                    job['pending'] += 1
+                    await outbox.put((job, prepared))
+            except Exception as e:
+                self._fail(job, e)
+            job['extracted'] = True
+            await self._maybe_finish(job)
+    
+    async def _embed_worker(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while (item := await inbox.get()) is not None:
+            job, prepared = item
+            if job['error']:
+                await self._group_done(job)
+                continue
+            try:
+                embeddings = await self.ingestion_service.embed_group(prepared)
+            except Exception as e:
+                self._fail(job, e)
+                await self._group_done(job)
+                continue
+            await outbox.put((job, prepared, embeddings))
+    
+    async def _upsert_worker(self, inbox: asyncio.Queue, outbox: None):
+        while (item := await inbox.get()) is not None:
+            job, prepared, embeddings = item
+            if not job['error']:
+                try:
+                    await self.ingestion_service.upsert_group(prepared, embeddings)
+                    self.stats.chunks += len(prepared['ids'])
+                    self.stats.tokens += sum(prepared['token_counts'])
+                except Exception as e:
+                    self._fail(job, e)
+            await self._group_done(job)
+    
+    def _fail(self, job: Dict[str, Any], error: Exception):
+        if job['error'] is None:
+            job['error'] = str(error)
+            print(f"Failed {job['path']}: {error}", file=sys.stderr)
+    
+    async def _group_done(self, job: Dict[str, Any]):
+        job['pending'] -= 1
+        await self._maybe_finish(job)
+    
+    async def _maybe_finish(self, job: Dict[str, Any]):
+        """
+        Record the file's outcome once it is fully extracted and every group is upserted
+        """
+        if not job['extracted'] or job['pending'] or job.get('finished'):
+            return
+        job['finished'] = True
+        if not job['error']:
+            try:
+                # Drops the chunks a previous version of the document had and this one doesn't
+                await self.ingestion_service.finish_document(job['version'])
+            except Exception as e:
+                self._fail(job, e)
+        if job['error']:
+            self.stats.failed += 1
+            self.checkpoint.mark(
+                job['content_hash'], job['path'], STATUS_FAILED, error=job['error']
+            )
+            return
+        self.stats.files += 1
+        self.checkpoint.mark(
+            job['content_hash'], job['path'], STATUS_DONE, chunks=job['chunks'], error=None
+        )
+
+
+async def bulk_ingest(paths: List[str], args: argparse.Namespace):
+    """
+    Run the pipeline with the backend's services, reporting progress every few seconds
+    """
+    from services.container import ServiceContainer
+    
+    container = ServiceContainer()
+    checkpoint = Checkpoint(args.checkpoint)
+    ingester = BulkIngester(
+        container.ingestion_service,
+        container.s3_service,
+        container.upload_registry,
+        checkpoint,
+        workers={
+            'upload': args.upload_workers,
+            'extract': args.extract_workers,
+            'embed': args.embed_workers,
+            'upsert': args.upsert_workers
+        },
+        queue_size=args.queue_size,
+        tenant=args.tenant
+    )
+    
+    async def report():
+        while True:
+            await asyncio.sleep(args.report_interval)
+            print(ingester.stats.summary(), file=sys.stderr)
+    
+    reporter = asyncio.create_task(report())
+    try:
+        stats = await ingester.run(paths)
+        print(f"Bulk ingestion complete: {stats.summary()}")
+    finally:
+        reporter.cancel()
+        checkpoint.close()
+        await container.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest many local files')
+    parser.add_argument('inputs', nargs='*', help='Files or directories to ingest')
+    parser.add_argument('--manifest', help='File listing paths to ingest, one per line')
+    parser.add_argument(
+        '--checkpoint',
+        default=data_path('bulk_ingest.db'),
+        help='Checkpoint database used to resume and to skip files already ingested'
+    )
+    parser.add_argument('--upload-workers', type=int, default=4, help='Concurrent S3 uploads')
+    parser.add_argument('--extract-workers', type=int, default=2, help='Files extracted at once')
+    parser.add_argument(
+        '--embed-workers', type=int, default=4, help='Chunk groups embedded at once'
+    )
+    parser.add_argument(
+        '--upsert-workers', type=int, default=2, help='Chunk groups upserted at once'
+    )
+    parser.add_argument(
+        '--queue-size', type=int, default=8, help='Chunk groups buffered between stages'
+    )
+    parser.add_argument(
+        '--report-interval', type=float, default=10.0, help='Seconds between progress reports'
+    )
+    parser.add_argument('--tenant', help='Tenant (namespace) to ingest the files for')
+    parser.add_argument('--s3-bucket', help='S3 bucket name', default=None)
+    
+    args = parser.parse_args()
+    
+    if args.s3_bucket:
+        os.environ['S3_BUCKET'] = args.s3_bucket
+    
+    if not args.inputs and not args.manifest:
+        parser.error('give files, directories or --manifest')
+    paths = find_files(args.inputs, args.manifest)
+    if not paths:
+        print("No PDF or CSV files found")
+        sys.exit(1)
+    print(f"Ingesting {len(paths)} files")
+    
+    asyncio.run(bulk_ingest(paths, args))
+
+
+if __name__ == "__main__":
+    main()
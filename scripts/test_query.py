@@ -4,8 +4,10 @@ Test query script for testing RAG queries
 """
 
 import asyncio
+import json
 import os
 import sys
+import time
 import argparse
 from pathlib import Path
 
@@ -38,14 +40,63 @@ async def test_query(query: str, top_k: int = 5):
         traceback.print_exc()
 
 
+async def test_batch(batch_file: str, top_k: int = 5, output: str = None):
+    """
+    Run every query in a file (one per line) as a batch, writing NDJSON results as they complete
+    """
+    with open(batch_file, encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    if not queries:
+        print(f"No queries in {batch_file}")
+        return
+    
+    query_service = QueryService()
+    out = open(output, 'w', encoding='utf-8') if output else sys.stdout
+    started = time.perf_counter()
+    failed = 0
+    try:
+        async for result in query_service.query_batch(queries, top_k):
+            if 'error' in result:
+                failed += 1
+            else:
+                result['sources'] = [source.model_dump() for source in result['sources']]
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    except Exception as e:
+        print(f"Error querying: {e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc()
+    finally:
+        if output:
+            out.close()
+        await query_service.openai_service.close()
+    
+    elapsed = time.perf_counter() - started
+    print(
+        f"{len(queries)} queries ({failed} failed) in {elapsed:.1f}s "
+        f"({len(queries) / elapsed:.1f} queries/s)",
+        file=sys.stderr
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description='Test a RAG query')
-    parser.add_argument('query', help='Query to test')
+    parser.add_argument('query', nargs='?', help='Query to test')
     parser.add_argument('--top-k', type=int, default=5, help='Number of results to retrieve')
+    parser.add_argument(
+        '--batch-file',
+        help='File with one query per line; results are written as NDJSON in completion order'
+    )
+    parser.add_argument('--output', help='Write batch results to this file instead of stdout')
     
     args = parser.parse_args()
     
-    asyncio.run(test_query(args.query, args.top_k))
+    if args.batch_file:
+        asyncio.run(test_batch(args.batch_file, args.top_k, args.output))
+    elif args.query:
+        asyncio.run(test_query(args.query, args.top_k))
+    else:
+        parser.error('a query or --batch-file is required')
 
 
 if __name__ == "__main__":